@@ -0,0 +1,229 @@
+import os
+import sys
+import io
+import json
+import runpy
+import argparse
+import tempfile
+from collections import Counter
+from contextlib import redirect_stdout
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+# Benchmarks the AWS scripts against moto, on a synthetic account seeded before every round.
+#
+#   pip install boto3 moto
+#   python benchmarks/aws.py                      # 5 VPCs, 200 ELBs, 500 SGs, 50 NAT gateways, 1000 snapshots
+#   python benchmarks/aws.py --scale 0.1 --runs 3 --only status,volume-provision
+#   python benchmarks/aws.py --json before.json   # keep the numbers to compare a change against
+#
+# Waits are compressed with WAIT_TIME_SCALE, since moto reaches every target state immediately. Nothing
+# leaves the process: moto intercepts every call, whatever credentials are in the environment.
+REPO = Path(__file__).resolve().parent.parent
+REGION = 'ca-central-1'
+CLUSTER_NAME = 'benchmark'
+VOLUME_NAMES = ['llm', 'eberron-llm', 'notebooks', 'model-cache']
+ACCOUNT = {
+    'vpcs': 5,
+    'load_balancers': 200,
+    'security_groups': 500,
+    'nat_gateways': 50,
+    'snapshots': 1000,
+}
+
+os.environ.setdefault('WAIT_TIME_SCALE', '0.01')
+os.environ.update(AWS_REGION=REGION, AWS_DEFAULT_REGION=REGION, CLUSTER_NAME=CLUSTER_NAME, STATUS_CACHE='')
+# Instrument the sessions the scripts create; the per-script counts are read from API_STATS, so the
+# cumulative report at exit is thrown away
+os.environ['API_STATS_FILE'] = os.devnull
+sys.path.insert(0, str(REPO))
+
+import boto3
+from moto import mock_aws
+
+from helpers import API_STATS, instrument_from_env
+
+
+def seed(account: dict) -> dict:
+    """
+    Creates a synthetic account in the current moto mock.
+
+    The VPCs are tagged with the cluster name. Three in five security groups are `k8s-elb-*` groups, each
+    referencing the next one in its VPC, and the others are node groups referencing up to three of them.
+    Load balancers alternate between classic ELBs and NLBs. Snapshots are tagged with the volume names in
+    turn, from untagged source volumes, so that provisioning restores from the latest one.
+
+    Args:
+        account (dict): How many of each resource to create, as in ACCOUNT.
+
+    Returns:
+        dict: How many of each resource were created.
+    """
+    ec2 = boto3.client('ec2', region_name=REGION)
+    elb = boto3.client('elb', region_name=REGION)
+    elbv2 = boto3.client('elbv2', region_name=REGION)
+
+    vpcs = []
+    subnets = {}
+    for i in range(max(account['vpcs'], 1)):
+        vpc_id = ec2.create_vpc(
+            CidrBlock=f'10.{i}.0.0/16',
+            TagSpecifications=[{'ResourceType': 'vpc', 'Tags': [{'Key': 'cluster_name', 'Value': CLUSTER_NAME}]}],
+        )['Vpc']['VpcId']
+        vpcs.append(vpc_id)
+        subnets[vpc_id] = [
+            ec2.create_subnet(VpcId=vpc_id, CidrBlock=f'10.{i}.{j}.0/24', AvailabilityZone=f'{REGION}{zone}')['Subnet']['SubnetId']
+            for j, zone in enumerate('ab')
+        ]
+
+    elb_groups = {vpc_id: [] for vpc_id in vpcs}
+    node_groups = {vpc_id: [] for vpc_id in vpcs}
+    for i in range(account['security_groups']):
+        vpc_id = vpcs[i % len(vpcs)]
+        name = f'k8s-elb-{i}' if i % 5 < 3 else f'nodes-{i}'
+        group_id = ec2.create_security_group(GroupName=name, Description=name, VpcId=vpc_id)['GroupId']
+        (elb_groups if name.startswith('k8s-elb-') else node_groups)[vpc_id].append(group_id)
+    for vpc_id in vpcs:
+        groups = elb_groups[vpc_id]
+        for group_id, referenced in zip(groups, groups[1:] + groups[:1]):
+            ec2.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[
+                {'IpProtocol': 'tcp', 'FromPort': 443, 'ToPort': 443, 'UserIdGroupPairs': [{'GroupId': referenced}]},
+            ])
+        for n, group_id in enumerate(node_groups[vpc_id]):
+            referenced = [groups[(n + k) % len(groups)] for k in range(min(3, len(groups)))]
+            if referenced:
+                ec2.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[
+                    {'IpProtocol': 'tcp', 'FromPort': 30000, 'ToPort': 32767, 'UserIdGroupPairs': [{'GroupId': g} for g in referenced]},
+                ])
+
+    for i in range(account['load_balancers']):
+        vpc_id = vpcs[i % len(vpcs)]
+        if i % 2 == 0:
+            elb.create_load_balancer(
+                LoadBalancerName=f'benchmark-{i}',
+                Listeners=[{'Protocol': 'tcp', 'LoadBalancerPort': 80, 'InstancePort': 30080}],
+                Subnets=subnets[vpc_id][:1],
+                SecurityGroups=elb_groups[vpc_id][:1],
+            )
+        else:
+            elbv2.create_load_balancer(Name=f'benchmark-{i}', Subnets=subnets[vpc_id], Type='network')
+
+    for i in range(account['nat_gateways']):
+        vpc_id = vpcs[i % len(vpcs)]
+        allocation_id = ec2.allocate_address(Domain='vpc')['AllocationId']
+        ec2.create_nat_gateway(SubnetId=subnets[vpc_id][0], AllocationId=allocation_id)
+
+    sources = [ec2.create_volume(Size=10, AvailabilityZone=f'{REGION}a')['VolumeId'] for _ in VOLUME_NAMES]
+    for i in range(account['snapshots']):
+        name = VOLUME_NAMES[i % len(VOLUME_NAMES)]
+        ec2.create_snapshot(
+            VolumeId=sources[i % len(sources)],
+            TagSpecifications=[{'ResourceType': 'snapshot', 'Tags': [{'Key': 'name', 'Value': name}]}],
+        )
+
+    return {'vpcs': len(vpcs), **{key: account[key] for key in ACCOUNT if key != 'vpcs'}}
+
+
+def run_status():
+    status = runpy.run_path(str(REPO / 'scripts' / 'status.py'), run_name='status')
+    # Instrumented like status.py's main() does, which this skips
+    instrument_from_env()
+    # AWS only: the Exoscale zones would need real credentials
+    status['write_markdown'](status['stream']([REGION], [], cache=None, verbose=False), 'STATUS.md')
+
+
+def run_script(path: str, **env):
+    def run():
+        os.environ.update(env)
+        sys.argv = [path]
+        runpy.run_path(path, run_name='__main__')
+    return run
+
+
+SCRIPTS = {
+    'status': run_status,
+    'volume-provision': run_script(str(REPO / 'scripts' / 'aws' / 'volume' / 'provision.py'), VOLUME_NAME='llm', VOLUME_SIZE='20'),
+    'volume-teardown': run_script(str(REPO / 'scripts' / 'aws' / 'volume' / 'teardown.py'), VOLUME_NAME='llm', VOLUME_SIZE='20'),
+    'teardown-load-balancer': run_script(str(REPO / 'scripts' / 'aws' / 'cluster' / 'teardown_load_balancer.py')),
+}
+
+
+def measure(run, verbose: bool = False) -> dict:
+    """Runs one script and returns its wall clock time and the API calls it made, by operation."""
+    before = Counter(API_STATS.calls)
+    start = perf_counter()
+    if verbose:
+        run()
+    else:
+        with redirect_stdout(io.StringIO()):
+            run()
+    seconds = perf_counter() - start
+    calls = Counter(API_STATS.calls)
+    calls.subtract(before)
+    return {'seconds': seconds, 'calls': {f'{provider} {operation}': count for (provider, operation), count in calls.items() if count}}
+
+
+def benchmark(names: list, account: dict, runs: int = 1, verbose: bool = False) -> dict:
+    """
+    Seeds a fresh account and runs the scripts in order, `runs` times.
+
+    Returns:
+        dict: The account, the seeding times, and per script the wall clock time of every run and the API calls
+            of the last one.
+    """
+    results = {'account': None, 'seed_seconds': [], 'scripts': {name: {'seconds': [], 'calls': {}} for name in names}}
+    cwd = os.getcwd()
+    for _ in range(runs):
+        with mock_aws(), tempfile.TemporaryDirectory() as directory:
+            # The scripts write their outputs, e.g. volume-aws-llm.json, to the working directory
+            os.chdir(directory)
+            try:
+                start = perf_counter()
+                results['account'] = seed(account)
+                results['seed_seconds'].append(perf_counter() - start)
+                for name in names:
+                    measured = measure(SCRIPTS[name], verbose)
+                    results['scripts'][name]['seconds'].append(measured['seconds'])
+                    results['scripts'][name]['calls'] = measured['calls']
+            finally:
+                os.chdir(cwd)
+    return results
+
+
+def report(results: dict) -> str:
+    lines = [
+        'Account: ' + ', '.join(f'{count} {kind.replace("_", " ")}' for kind, count in results['account'].items()),
+        f"Seeded in {median(results['seed_seconds']):.2f}s (median of {len(results['seed_seconds'])})",
+        '',
+        f"{'script':<24} {'median s':>9} {'min s':>9} {'API calls':>9}  busiest operations",
+    ]
+    for name, result in results['scripts'].items():
+        calls = Counter(result['calls'])
+        busiest = ', '.join(f'{operation.split(" ", 1)[1]} {count}' for operation, count in calls.most_common(3))
+        lines.append(
+            f"{name:<24} {median(result['seconds']):>9.2f} {min(result['seconds']):>9.2f} {sum(calls.values()):>9}  {busiest}"
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the AWS scripts against a synthetic moto account.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of the synthetic account.")
+    parser.add_argument("--runs", type=int, default=1, help="How many times to seed and run every script.")
+    parser.add_argument("--only", help=f"Comma-separated scripts to run, in order. Defaults to all of: {', '.join(SCRIPTS)}.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the scripts.")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCRIPTS)
+    unknown = [name for name in names if name not in SCRIPTS]
+    if unknown:
+        parser.error(f"Unknown script(s): {', '.join(unknown)}. Choose from: {', '.join(SCRIPTS)}.")
+    account = {kind: max(1, round(count * args.scale)) for kind, count in ACCOUNT.items()}
+
+    results = benchmark(names, account, runs=args.runs, verbose=args.verbose)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wait_time_scale': float(os.environ['WAIT_TIME_SCALE']), **results}, f, indent=2)
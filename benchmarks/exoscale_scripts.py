@@ -0,0 +1,160 @@
+import os
+import sys
+import io
+import json
+import runpy
+import argparse
+import tempfile
+from collections import Counter
+from contextlib import redirect_stdout
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+# Benchmarks the Exoscale scripts against the fake API of benchmarks/fake_exoscale.py, seeded before every round.
+#
+#   pip install exoscale
+#   python benchmarks/exoscale_scripts.py                                 # 20 load balancers, 100 snapshots
+#   python benchmarks/exoscale_scripts.py --latency 0.1 --transition 2    # closer to the real API
+#   python benchmarks/exoscale_scripts.py --scale 5 --runs 3 --json before.json
+#
+# Waits are compressed with WAIT_TIME_SCALE; keep --transition short enough for the compressed deadlines.
+REPO = Path(__file__).resolve().parent.parent
+ZONE = 'ch-gva-2'
+CLUSTER_NAME = 'benchmark'
+ACCOUNT = {
+    'nodepools': 2,
+    'instances': 3,
+    'load_balancers': 20,
+    'snapshots': 100,
+}
+
+os.environ.setdefault('WAIT_TIME_SCALE', '0.1')
+os.environ.update(
+    EXOSCALE_ZONE=ZONE, EXOSCALE_API_KEY='EXObenchmark', EXOSCALE_API_SECRET='benchmark', CLUSTER_NAME=CLUSTER_NAME,
+    STATUS_CACHE='',
+)
+# Instrument the clients the scripts create; the per-script counts are read from API_STATS, so the
+# cumulative report at exit is thrown away
+os.environ['API_STATS_FILE'] = os.devnull
+sys.path.insert(0, str(REPO))
+sys.path.insert(0, str(REPO / 'benchmarks'))
+
+from fake_exoscale import FakeExoscale, seed
+from helpers import API_STATS, exoscale_client, instrument_exoscale
+
+
+def run_status():
+    status = runpy.run_path(str(REPO / 'scripts' / 'status.py'), run_name='status')
+    # Exoscale only: the AWS half is benchmarked against moto by benchmarks/aws.py
+    # Instrumented like status.py's main() does, which this skips
+    exoscale = {ZONE: instrument_exoscale(exoscale_client(ZONE))}
+    status['write_markdown'](status['stream']([], [ZONE], cache=None, verbose=False, aws={}, exoscale=exoscale), 'STATUS.md')
+
+
+def run_script(path: str, **env):
+    def run():
+        os.environ.update(env)
+        sys.argv = [path]
+        runpy.run_path(path, run_name='__main__')
+    return run
+
+
+SCRIPTS = {
+    'status': run_status,
+    'volume-provision': run_script(str(REPO / 'scripts' / 'exoscale' / 'volume' / 'provision.py'), VOLUME_NAME='llm', VOLUME_SIZE='20'),
+    'volume-teardown': run_script(str(REPO / 'scripts' / 'exoscale' / 'volume' / 'teardown.py'), VOLUME_NAME='llm', VOLUME_SIZE='20'),
+    'teardown-load-balancer': run_script(str(REPO / 'scripts' / 'exoscale' / 'cluster' / 'teardown_load_balancer.py')),
+}
+
+
+def measure(run, verbose: bool = False) -> dict:
+    """Runs one script and returns its wall clock time and the API calls it made, by operation."""
+    before = Counter(API_STATS.calls)
+    start = perf_counter()
+    if verbose:
+        run()
+    else:
+        with redirect_stdout(io.StringIO()):
+            run()
+    seconds = perf_counter() - start
+    calls = Counter(API_STATS.calls)
+    calls.subtract(before)
+    return {'seconds': seconds, 'calls': {f'{provider} {operation}': count for (provider, operation), count in calls.items() if count}}
+
+
+def benchmark(names: list, account: dict, runs: int = 1, verbose: bool = False, **fake_options) -> dict:
+    """
+    Starts a fresh fake API, seeds it and runs the scripts in order, `runs` times.
+
+    Args:
+        names (list): The scripts, keys of SCRIPTS.
+        account (dict): How many of each resource to seed, as in ACCOUNT.
+        runs (int, optional): How many rounds. Defaults to 1.
+        verbose (bool, optional): Show the output of the scripts. Defaults to False.
+        **fake_options: Passed to `FakeExoscale`, e.g. latency and transition.
+
+    Returns:
+        dict: The account, and per script the wall clock time of every run and the API calls of the last one.
+    """
+    results = {'account': None, 'scripts': {name: {'seconds': [], 'calls': {}} for name in names}}
+    cwd = os.getcwd()
+    for _ in range(runs):
+        fake = FakeExoscale(**fake_options)
+        results['account'] = seed(fake, ZONE, CLUSTER_NAME, **account)
+        os.environ['EXOSCALE_API_URL'] = fake.start()
+        with tempfile.TemporaryDirectory() as directory:
+            # The scripts write their outputs, e.g. volume-exoscale-llm.json, to the working directory
+            os.chdir(directory)
+            try:
+                for name in names:
+                    measured = measure(SCRIPTS[name], verbose)
+                    results['scripts'][name]['seconds'].append(measured['seconds'])
+                    results['scripts'][name]['calls'] = measured['calls']
+            finally:
+                os.chdir(cwd)
+                fake.stop()
+    return results
+
+
+def report(results: dict) -> str:
+    lines = [
+        'Account: ' + ', '.join(f'{count} {kind}' for kind, count in results['account'].items()),
+        '',
+        f"{'script':<24} {'median s':>9} {'min s':>9} {'API calls':>9}  busiest operations",
+    ]
+    for name, result in results['scripts'].items():
+        calls = Counter(result['calls'])
+        busiest = ', '.join(f'{operation.split(" ", 1)[1]} {count}' for operation, count in calls.most_common(3))
+        lines.append(
+            f"{name:<24} {median(result['seconds']):>9.2f} {min(result['seconds']):>9.2f} {sum(calls.values()):>9}  {busiest}"
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the Exoscale scripts against a fake Exoscale API.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the number of load balancers and snapshots.")
+    parser.add_argument("--runs", type=int, default=1, help="How many times to seed and run every script.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every API response.")
+    parser.add_argument("--transition", type=float, default=0.5, help="Seconds until creations and deletions complete.")
+    parser.add_argument("--only", help=f"Comma-separated scripts to run, in order. Defaults to all of: {', '.join(SCRIPTS)}.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the scripts.")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCRIPTS)
+    unknown = [name for name in names if name not in SCRIPTS]
+    if unknown:
+        parser.error(f"Unknown script(s): {', '.join(unknown)}. Choose from: {', '.join(SCRIPTS)}.")
+    account = {
+        **ACCOUNT,
+        'load_balancers': max(1, round(ACCOUNT['load_balancers'] * args.scale)),
+        'snapshots': max(1, round(ACCOUNT['snapshots'] * args.scale)),
+    }
+
+    results = benchmark(names, account, runs=args.runs, verbose=args.verbose, latency=args.latency, transition=args.transition)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wait_time_scale': float(os.environ['WAIT_TIME_SCALE']), 'latency': args.latency, 'transition': args.transition, **results}, f, indent=2)
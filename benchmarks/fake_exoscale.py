@@ -0,0 +1,292 @@
+import re
+import json
+import argparse
+from copy import deepcopy
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import random, uniform
+from threading import Lock, Thread
+from time import monotonic, sleep
+from uuid import uuid4
+
+# A local stand-in for the Exoscale v2 API endpoints the scripts use: block storage volumes and snapshots,
+# load balancers, SKS clusters, instance pools and operations.
+#
+#   python benchmarks/fake_exoscale.py --port 8080 --latency 0.05 --transition 2 --seed
+#   EXOSCALE_API_URL='http://127.0.0.1:8080/{zone}/v2' EXOSCALE_API_KEY=x EXOSCALE_API_SECRET=x \
+#       VOLUME_NAME=llm VOLUME_SIZE=20 PYTHONPATH=. python scripts/exoscale/volume/provision.py
+#
+# Every zone has its own state. Creations and deletions answer with a pending operation and take
+# `transition` seconds to complete, like the real API, so the scripts' waits are exercised.
+
+RESOURCES = {
+    # URL path: the key of the list in responses
+    'block-storage': 'block-storage-volumes',
+    'block-storage-snapshot': 'block-storage-snapshots',
+    'load-balancer': 'load-balancers',
+    'sks-cluster': 'sks-clusters',
+    'instance-pool': 'instance-pools',
+    'operation': 'operations',
+}
+ROUTE = re.compile(r'^/(?:(?P<zone>[a-z]{2}-[a-z]+-\d+)/)?v2/(?P<kind>[a-z-]+)(?:/(?P<id>[0-9a-f-]+)(?::(?P<action>[a-z-]+))?)?/?$')
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds').replace('+00:00', 'Z')
+
+
+class FakeExoscale:
+    """
+    The in-memory state of the fake API and the HTTP server that serves it.
+
+    Args:
+        latency (float, optional): Seconds added to every response, with +/-20% jitter. Defaults to 0.
+        transition (float, optional): Seconds until a creation or deletion completes. Defaults to 1.
+        throttle_rate (float, optional): The share of requests answered with HTTP 429. Defaults to 0.
+        error_rate (float, optional): The share of requests answered with HTTP 503. Defaults to 0.
+    """
+
+    def __init__(self, latency: float = 0.0, transition: float = 1.0, throttle_rate: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.transition = transition
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.zones = defaultdict(lambda: {kind: {} for kind in RESOURCES})
+        self.requests = defaultdict(int)
+        self._pending = []  # (due, zone, kind, id, state or None to remove, operation id)
+        self._lock = Lock()
+        self.server = None
+
+    # State
+
+    def add(self, zone: str, kind: str, **resource) -> dict:
+        """Adds a resource that already exists, e.g. when seeding. Returns it, with an ID if it had none."""
+        resource.setdefault('id', str(uuid4()))
+        resource.setdefault('created-at', _now())
+        with self._lock:
+            self.zones[zone][kind][resource['id']] = resource
+        return resource
+
+    def _transition(self, zone: str, kind: str, resource_id: str, state, command: str) -> dict:
+        # Starts a change that completes after `transition` seconds, and returns its operation. Holds the lock.
+        operation = {
+            'id': str(uuid4()),
+            'state': 'pending',
+            'reason': None,
+            'reference': {'id': resource_id, 'link': f'/v2/{kind}/{resource_id}', 'command': command},
+        }
+        self.zones[zone]['operation'][operation['id']] = operation
+        self._pending.append((monotonic() + self.transition, zone, kind, resource_id, state, operation['id']))
+        return deepcopy(operation)
+
+    def _advance(self):
+        # Applies the changes that are due. Holds the lock.
+        now = monotonic()
+        due = [change for change in self._pending if change[0] <= now]
+        self._pending = [change for change in self._pending if change[0] > now]
+        for _, zone, kind, resource_id, state, operation_id in due:
+            resources = self.zones[zone][kind]
+            if state is None:
+                resources.pop(resource_id, None)
+            elif resource_id in resources:
+                resources[resource_id]['state'] = state
+            self.zones[zone]['operation'][operation_id]['state'] = 'success'
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        """
+        Answers one request.
+
+        Returns:
+            tuple: The HTTP status and the JSON body.
+        """
+        match = ROUTE.match(path.split('?')[0])
+        if not match or match['kind'] not in RESOURCES:
+            return 404, {'message': f'No route for {method} {path}'}
+        zone = match['zone'] or 'ch-gva-2'
+        kind, resource_id, action = match['kind'], match['id'], match['action']
+        with self._lock:
+            self.requests[f'{method} /{kind}' + ('/{id}' if resource_id else '') + (f':{action}' if action else '')] += 1
+            self._advance()
+            resources = self.zones[zone][kind]
+
+            if resource_id is None:
+                if method == 'GET':
+                    return 200, {RESOURCES[kind]: deepcopy(list(resources.values()))}
+                if method == 'POST' and kind == 'block-storage':
+                    return self._create_volume(zone, body)
+                return 405, {'message': f'{method} /{kind} is not supported'}
+
+            if resource_id not in resources:
+                return 404, {'message': f'{kind} {resource_id} not found'}
+            resource = resources[resource_id]
+            if method == 'GET' and not action:
+                return 200, deepcopy(resource)
+            if method == 'DELETE' and not action and kind in ('block-storage', 'block-storage-snapshot', 'load-balancer'):
+                resource['state'] = 'deleting'
+                return 200, self._transition(zone, kind, resource_id, None, f'delete-{kind}')
+            if method == 'POST' and kind == 'block-storage' and action == 'create-snapshot':
+                return 200, self._create_snapshot(zone, resource, body)
+            return 405, {'message': f'{method} {path} is not supported'}
+
+    def _create_volume(self, zone: str, body: dict) -> tuple:
+        snapshot = (body.get('block-storage-snapshot') or {}).get('id')
+        if snapshot and snapshot not in self.zones[zone]['block-storage-snapshot']:
+            return 404, {'message': f'block-storage-snapshot {snapshot} not found'}
+        volume = {
+            'id': str(uuid4()),
+            'name': body.get('name', ''),
+            'size': body.get('size', 10),
+            'labels': body.get('labels', {}),
+            'state': 'creating',
+            'created-at': _now(),
+            'block-storage-snapshots': [],
+        }
+        self.zones[zone]['block-storage'][volume['id']] = volume
+        return 200, self._transition(zone, 'block-storage', volume['id'], 'detached', 'create-block-storage-volume')
+
+    def _create_snapshot(self, zone: str, volume: dict, body: dict) -> dict:
+        snapshot = {
+            'id': str(uuid4()),
+            'name': body.get('name', ''),
+            'size': volume['size'],
+            'labels': body.get('labels', {}),
+            'state': 'creating',
+            'created-at': _now(),
+            'block-storage-volume': {'id': volume['id']},
+        }
+        self.zones[zone]['block-storage-snapshot'][snapshot['id']] = snapshot
+        volume.setdefault('block-storage-snapshots', []).append({'id': snapshot['id']})
+        return self._transition(zone, 'block-storage-snapshot', snapshot['id'], 'created', 'create-block-storage-snapshot')
+
+    # Server
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Serves the API in a background thread.
+
+        Returns:
+            str: The value for EXOSCALE_API_URL, with a '{zone}' placeholder.
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    body = {}
+                if fake.latency:
+                    sleep(fake.latency * uniform(0.8, 1.2))
+                if fake.throttle_rate and random() < fake.throttle_rate:
+                    status, payload = 429, {'message': 'Too many requests'}
+                elif fake.error_rate and random() < fake.error_rate:
+                    status, payload = 503, {'message': 'Service unavailable'}
+                else:
+                    status, payload = fake.handle(self.command, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://{host}:{self.server.server_address[1]}/{{zone}}/v2'
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def seed(
+    fake: FakeExoscale,
+    zone: str = 'ch-gva-2',
+    cluster_name: str = 'benchmark',
+    nodepools: int = 2,
+    instances: int = 3,
+    load_balancers: int = 20,
+    volume_names: list = ('llm', 'eberron-llm', 'notebooks', 'model-cache'),
+    snapshots: int = 100,
+) -> dict:
+    """
+    Fills a zone with a synthetic account: an SKS cluster named '<cluster_name>-cluster' with its nodepools
+    and instance pools, load balancers of which half are Kubernetes-created 'k8s-*' ones targeting the
+    cluster's instance pools, and snapshots labelled with the volume names in turn.
+
+    Returns:
+        dict: How many of each resource were created.
+    """
+    pools = []
+    for n in range(nodepools):
+        pool = fake.add(
+            zone, 'instance-pool',
+            name=f'nodepool-{n}', state='running', size=instances,
+            instances=[{'id': str(uuid4())} for _ in range(instances)],
+        )
+        pools.append(pool)
+    fake.add(
+        zone, 'sks-cluster',
+        name=f'{cluster_name}-cluster', state='running', version='1.31.1', level='starter', cni='cilium',
+        nodepools=[
+            {'id': str(uuid4()), 'name': pool['name'], 'state': 'running', 'size': pool['size'], 'instance-pool': {'id': pool['id']}}
+            for pool in pools
+        ],
+    )
+    for i in range(load_balancers):
+        ours = i % 2 == 0
+        fake.add(
+            zone, 'load-balancer',
+            name=f'k8s-{cluster_name}-{i}' if ours else f'other-{i}', state='running', ip=f'192.0.2.{i % 250 + 1}',
+            services=[{
+                'id': str(uuid4()), 'name': f'service-{i}', 'protocol': 'tcp', 'port': 443, 'target-port': 30443,
+                'strategy': 'round-robin', 'state': 'running',
+                'instance-pool': {'id': pools[i % len(pools)]['id'] if ours and pools else str(uuid4())},
+                'healthcheck': {'mode': 'tcp', 'port': 30443, 'interval': 10, 'timeout': 5, 'retries': 1},
+            }],
+        )
+    for i in range(snapshots):
+        name = volume_names[i % len(volume_names)]
+        fake.add(
+            zone, 'block-storage-snapshot',
+            name=f'{name}-snapshot-{i}', size=20, labels={'name': name}, state='created',
+            **{'created-at': f'2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z'},
+        )
+    return {'instance pools': nodepools, 'load balancers': load_balancers, 'snapshots': snapshots}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake Exoscale v2 API for the Exoscale scripts.")
+    parser.add_argument("--host", default='127.0.0.1', help="The address to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="The port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--transition", type=float, default=1.0, help="Seconds until creations and deletions complete.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="The share of requests answered with HTTP 429.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="The share of requests answered with HTTP 503.")
+    parser.add_argument("--seed", action="store_true", help="Fill the zone with a synthetic cluster, load balancers and snapshots.")
+    parser.add_argument("--zone", default='ch-gva-2', help="The zone to seed.")
+    parser.add_argument("--cluster-name", default='benchmark', help="The CLUSTER_NAME of the seeded cluster.")
+    args = parser.parse_args()
+
+    fake = FakeExoscale(args.latency, args.transition, args.throttle_rate, args.error_rate)
+    if args.seed:
+        print('Seeded ' + ', '.join(f'{count} {kind}' for kind, count in seed(fake, args.zone, args.cluster_name).items()))
+    url = fake.start(args.host, args.port)
+    print(f"Serving the fake Exoscale API; set EXOSCALE_API_URL='{url}'")
+    try:
+        while True:
+            sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
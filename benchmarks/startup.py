@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+# Benchmarks the cold start of the scripts: a fresh interpreter per run, importing one script without running it,
+# and which provider SDKs that import pulled in.
+#
+#   python benchmarks/startup.py
+#   python benchmarks/startup.py --runs 20 --only status,iac
+#   python benchmarks/startup.py --json before.json   # keep the numbers to compare a change against
+#
+# The SDK rows are the floor the lazy imports avoid: what `import boto3` or `import exoscale.api.v2` costs alone.
+REPO = Path(__file__).resolve().parent.parent
+SDKS = ['boto3', 'botocore', 'exoscale']
+
+# Python run with `-c` in a fresh interpreter, with the target as its argument. Prints the import time and the SDKs
+# it imported as JSON.
+_PROBE = f"""
+import json, runpy, sys
+from time import perf_counter
+start = perf_counter()
+target = sys.argv[1]
+if target.endswith('.py'):
+    runpy.run_path(target, run_name='startup')
+else:
+    __import__(target)
+print(json.dumps({{'seconds': perf_counter() - start, 'sdks': [sdk for sdk in {SDKS!r} if sdk in sys.modules]}}))
+"""
+
+TARGETS = {
+    'iac': 'iac',
+    'status': 'scripts/status.py',
+    'status-exporter': 'scripts/status_exporter.py',
+    'history': 'scripts/history.py',
+    'aws-volume-provision': 'scripts/aws/volume/provision.py',
+    'aws-volume-teardown': 'scripts/aws/volume/teardown.py',
+    'aws-teardown-load-balancer': 'scripts/aws/cluster/teardown_load_balancer.py',
+    'aws-tag-subnets': 'scripts/aws/cluster/tag_subnets.py',
+    'aws-provision-iam-cluster-role': 'scripts/aws/cluster/provision_iam_cluster_role.py',
+    'exoscale-volume-provision': 'scripts/exoscale/volume/provision.py',
+    'exoscale-volume-teardown': 'scripts/exoscale/volume/teardown.py',
+    'exoscale-teardown-load-balancer': 'scripts/exoscale/cluster/teardown_load_balancer.py',
+    'sdk-boto3': 'boto3',
+    'sdk-exoscale': 'exoscale.api.v2',
+}
+
+
+def measure(target: str) -> dict:
+    """
+    Imports `target`, a script path or a module name, in a fresh interpreter.
+
+    Returns:
+        dict: The wall clock time of the whole process, the time of the import alone, and the SDKs it imported.
+
+    Raises:
+        RuntimeError: If the import fails.
+    """
+    # The scripts import helpers the way the workflows run them, with the repo on PYTHONPATH. Status scripts also
+    # import their siblings, so they run from their own directory.
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(REPO), str(REPO / 'scripts'), os.getenv('PYTHONPATH')]))}
+    start = perf_counter()
+    process = subprocess.run([sys.executable, '-c', _PROBE, target], cwd=REPO, env=env, capture_output=True, text=True)
+    wall = perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{process.stderr}")
+    probe = json.loads(process.stdout.strip().splitlines()[-1])
+    return {'wall_seconds': wall, 'import_seconds': probe['seconds'], 'sdks': probe['sdks']}
+
+
+def benchmark(names: list, runs: int = 5) -> dict:
+    """
+    Measures each target `runs` times, one after the other.
+
+    Returns:
+        dict: Per target, the wall clock and import time of every run, and the SDKs of the last one.
+    """
+    results = {name: {'wall_seconds': [], 'import_seconds': [], 'sdks': []} for name in names}
+    for _ in range(runs):
+        for name in names:
+            measured = measure(TARGETS[name])
+            results[name]['wall_seconds'].append(measured['wall_seconds'])
+            results[name]['import_seconds'].append(measured['import_seconds'])
+            results[name]['sdks'] = measured['sdks']
+    return results
+
+
+def report(results: dict) -> str:
+    lines = [f"{'target':<32} {'process ms':>10} {'import ms':>10}  SDKs imported"]
+    for name, result in results.items():
+        lines.append(
+            f"{name:<32} {median(result['wall_seconds']) * 1000:>10.0f} {median(result['import_seconds']) * 1000:>10.0f}  "
+            f"{', '.join(result['sdks']) or '—'}"
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark how long the scripts take to start, in fresh interpreters.")
+    parser.add_argument("--runs", type=int, default=5, help="How many times to start every target.")
+    parser.add_argument("--only", help=f"Comma-separated targets to run, in order. Defaults to all of: {', '.join(TARGETS)}.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(TARGETS)
+    unknown = [name for name in names if name not in TARGETS]
+    if unknown:
+        parser.error(f"Unknown target(s): {', '.join(unknown)}. Choose from: {', '.join(TARGETS)}.")
+
+    results = benchmark(names, runs=args.runs)
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -1,14 +1,33 @@
 from typing import Callable
-from time import sleep
-from time import time as unixtime
 import os
 import re
 
+from helpers.cache import ResourceCache
+from helpers.clients import EXOSCALE_BUCKET, RateLimitedExoscale, TokenBucket, aws_client, aws_config, exoscale_client
+from helpers.collectors import iter_aws, iter_exoscale
+from helpers.configs import (
+    PROVIDERS, VOLUME_PROFILES, VOLUME_TYPES, config_provider, configured_providers, discover_regions, discover_volumes,
+    get_regions, get_volume_profile, read_env_file, volume_specs,
+)
+from helpers.history import append_run, compare_runs, history_from_env, load_runs, observe_from_env
+from helpers.instrumentation import (
+    API_STATS, ApiStats, InstrumentedExoscale, instrument_boto3, instrument_default_session, instrument_exoscale,
+    instrument_from_env,
+)
+from helpers.inventory import VpcInventory
+from helpers.operations import OPERATION_FAILURES, wait_for_operations
+from helpers.security_groups import SecurityGroupReference, SecurityGroupReferences
+from helpers.tasks import TaskGraph
+from helpers.tracing import TRACER, Tracer, span, trace_from_env
+from helpers.waiters import EXPECTED_DURATIONS, backoff_delays, wait_for, wait_for_each
+
 
 def wait_until(check: Callable, kwargs: dict, cond: Callable[[dict], bool], timeout: int=60, wait_interval: int=1):
     """
     Repeatedly calls a function with specified arguments until a condition is met or a timeout occurs.
 
+    Polls at a fixed interval. See `wait_for` for exponential backoff, expected durations and access to the last result.
+
     Args:
         check (Callable): The function to be called periodically with the specified arguments.
         kwargs (dict): A dictionary of keyword arguments to pass to the `check` function.
@@ -20,15 +39,16 @@ def wait_until(check: Callable, kwargs: dict, cond: Callable[[dict], bool], time
         bool: The result of the condition check function (`cond`) on the last call to `check`, indicating if the condition was met before the timeout.
 
     """
-    start = t = unixtime()
-    result = check(**kwargs)
-    while not cond(result) and t < start + timeout:
-        result = check(**kwargs)
-        if cond(result):
-            return cond(result)
-        sleep(wait_interval)
-        t = unixtime()
-    return cond(result)
+    return wait_for(
+        check,
+        kwargs,
+        cond,
+        timeout=timeout,
+        first_interval=wait_interval,
+        max_interval=wait_interval,
+        factor=1,
+        jitter=0,
+    )
 
 
 def _get_env_list(
@@ -133,3 +153,23 @@ def get_env_count(env: str) -> int:
         raise ValueError(f"{env}='{value}' is not a valid positive integer.")
     return count
 
+
+def get_env_flag(env: str) -> bool:
+    """
+    Retrieves an on/off switch from the environment variable `env`.
+
+    Args:
+        env (str): Name of the environment variable.
+
+    Returns:
+        bool: True for 1, true, yes or on, False for 0, false, no, off, or if not set. Case-insensitive.
+
+    Raises:
+        ValueError: If the variable is set to anything else.
+    """
+    value = os.getenv(env, '')
+    if value.strip().lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.strip().lower() in ('', '0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"{env}='{value}' is not a valid switch. Use true or false.")
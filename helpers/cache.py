@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+import json
+import os
+
+
+class ResourceCache:
+    """
+    A JSON file of previously fetched resources, by provider, region, kind and ID.
+
+    Each (provider, region, kind) entry remembers when it was last fully refreshed and a cursor, e.g. the
+    time of the last fetch, so that the next run can ask only for what changed since. Once an entry is older
+    than `ttl` it is treated as missing and the caller does a full refresh, which also drops anything deleted
+    in the meantime. Safe to use from several threads; nothing is written until `save`.
+
+    Args:
+        path (str | Path): The cache file. It is created on `save` if it does not exist.
+        ttl (int, optional): Seconds after which an entry needs a full refresh. Defaults to 6 hours.
+    """
+
+    def __init__(self, path, ttl: int = 6 * 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = Lock()
+        try:
+            self.data = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.data = {}
+
+    def get(self, provider: str, region: str, kind: str) -> Optional[dict]:
+        """
+        Returns a fresh entry as {'refreshed': ..., 'cursor': ..., 'items': {id: item}}, or None if it is
+        missing or past its TTL.
+        """
+        with self._lock:
+            entry = self.data.get(provider, {}).get(region, {}).get(kind)
+        if not entry or datetime.now(timezone.utc).timestamp() - entry.get('refreshed', 0) > self.ttl:
+            return None
+        return entry
+
+    def put(self, provider: str, region: str, kind: str, items: dict, cursor=None, refreshed: Optional[float] = None):
+        """
+        Stores the items of an entry.
+
+        Args:
+            provider (str): 'aws' or 'exoscale'.
+            region (str): The region or zone.
+            kind (str): The kind of resource, e.g. 'snapshots'.
+            items (dict): The resources by ID. Values must be JSON serializable; datetimes are stored as strings.
+            cursor (optional): Where the next delta refresh starts from.
+            refreshed (float, optional): The timestamp of the last full refresh. Defaults to now, i.e. `items`
+                is a full refresh. Pass the previous value when storing a delta.
+        """
+        entry = {
+            'refreshed': refreshed if refreshed is not None else datetime.now(timezone.utc).timestamp(),
+            'cursor': cursor,
+            'items': items,
+        }
+        with self._lock:
+            self.data.setdefault(provider, {}).setdefault(region, {})[kind] = entry
+
+    def save(self):
+        """Writes the cache to its file, replacing it atomically."""
+        with self._lock:
+            text = json.dumps(self.data, default=str, indent=1, sort_keys=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        temporary.write_text(text)
+        os.replace(temporary, self.path)
@@ -0,0 +1,177 @@
+from typing import Optional
+from threading import Lock
+from time import monotonic, sleep
+import os
+
+from helpers.instrumentation import API_STATS, instrument_deferred
+from helpers.waiters import backoff_delays
+
+
+# Attempts per AWS call, including the first, and the retry mode. Botocore reads the same variables, but an
+# explicit client config takes precedence, so they are passed on here.
+AWS_MAX_ATTEMPTS = int(os.getenv('AWS_MAX_ATTEMPTS') or 8)
+AWS_RETRY_MODE = os.getenv('AWS_RETRY_MODE') or 'adaptive'
+# Botocore's default connection pool size, used unless a caller runs more workers than this
+AWS_MIN_POOL_CONNECTIONS = 10
+# Requests per second, and burst, shared by every Exoscale client of the process. 0 turns the limit off.
+EXOSCALE_RATE_LIMIT = float(os.getenv('EXOSCALE_RATE_LIMIT') or 10)
+EXOSCALE_BURST = int(os.getenv('EXOSCALE_BURST') or 20)
+EXOSCALE_MAX_ATTEMPTS = int(os.getenv('EXOSCALE_MAX_ATTEMPTS') or 5)
+
+_clients = {}
+_lock = Lock()
+
+
+class TokenBucket:
+    """
+    Lets through `rate` calls per second on average, in bursts of up to `burst`. Safe to use from several threads.
+
+    Args:
+        rate (float): The sustained rate, in calls per second. 0 or less lets every call through.
+        burst (int, optional): The most calls let through at once. Defaults to the rate, at least 1.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """Blocks until a call may go through."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            sleep(delay)
+
+
+EXOSCALE_BUCKET = TokenBucket(EXOSCALE_RATE_LIMIT, EXOSCALE_BURST)
+
+
+def aws_config(max_workers: Optional[int] = None):
+    """
+    Returns the botocore config of the shared clients: adaptive retries, which also rate limit the client once AWS
+    starts throttling, and a connection pool large enough for `max_workers` concurrent calls.
+    """
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=max(max_workers or 0, AWS_MIN_POOL_CONNECTIONS),
+        retries={'mode': AWS_RETRY_MODE, 'max_attempts': AWS_MAX_ATTEMPTS},
+    )
+
+
+def aws_client(service: str, region: Optional[str] = None, max_workers: Optional[int] = None):
+    """
+    Returns the shared boto3 client of a service and region, creating it on first use.
+
+    Clients come from the default boto3 session, which `instrument_from_env` and `history_from_env` instrument,
+    and use `aws_config`. Since a client is shared by every caller, its retry mode also rate limits all of them
+    together. Asking for more workers than the cached client was sized for replaces it with a larger pool.
+
+    Args:
+        service (str): The service, e.g. 'ec2'.
+        region (str, optional): The region. Defaults to AWS_REGION, AWS_DEFAULT_REGION, or 'ca-central-1'.
+        max_workers (int, optional): How many threads will call the client at once.
+
+    Returns:
+        The boto3 client.
+    """
+    import boto3
+
+    region = region or os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION') or 'ca-central-1'
+    pool = max(max_workers or 0, AWS_MIN_POOL_CONNECTIONS)
+    key = ('aws', service, region)
+    # Creating clients is not thread-safe, so it happens under the lock
+    with _lock:
+        cached = _clients.get(key)
+        if cached is None or cached[1] < pool:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            instrument_deferred()
+            cached = _clients[key] = (boto3.DEFAULT_SESSION.client(service, region_name=region, config=aws_config(pool)), pool)
+        return cached[0]
+
+
+class RateLimitedExoscale:
+    """
+    Wraps an `exoscale.api.v2.Client` so that every call waits for a token of `bucket`, and is retried with
+    backoff when rate limited (HTTP 429), or, for read-only calls, on server errors (HTTP 5xx).
+
+    Calls that create or delete things are not retried on 5xx, since they may have gone through. Each 429 is
+    counted in API_STATS. Attributes other than methods pass through.
+
+    Args:
+        exo (exoscale.api.v2.Client): The client.
+        bucket (TokenBucket, optional): The rate limit. Defaults to EXOSCALE_BUCKET, shared by the whole process.
+        max_attempts (int, optional): Attempts per call, including the first. Defaults to EXOSCALE_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, exo, bucket: TokenBucket = EXOSCALE_BUCKET, max_attempts: int = EXOSCALE_MAX_ATTEMPTS):
+        self._exo = exo
+        self._bucket = bucket
+        self._max_attempts = max_attempts
+
+    def __getattr__(self, operation: str):
+        method = getattr(self._exo, operation)
+        if not callable(method):
+            return method
+        read_only = operation.startswith(('get_', 'list_'))
+
+        def call(*args, **kwargs):
+            delays = backoff_delays(first=0.5, max_interval=10)
+            for attempt in range(1, self._max_attempts + 1):
+                self._bucket.acquire()
+                try:
+                    return method(*args, **kwargs)
+                except Exception as e:
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    if status == 429:
+                        API_STATS.throttled('exoscale', operation)
+                    retryable = status == 429 or (read_only and status is not None and status >= 500)
+                    if not retryable or attempt == self._max_attempts:
+                        raise
+                sleep(next(delays))
+        return call
+
+
+def exoscale_client(zone: str, key: Optional[str] = None, secret: Optional[str] = None, rate_limited: bool = True):
+    """
+    Returns the shared Exoscale v2 API client of a zone and API key, creating it on first use.
+
+    With EXOSCALE_API_URL set, the client talks to that endpoint instead of the public API, e.g. to the fake
+    server in `benchmarks/fake_exoscale.py`. A '{zone}' in the URL is replaced by the zone, so one server can
+    stand in for several zones.
+
+    Args:
+        zone (str): The zone, e.g. 'ch-gva-2'.
+        key (str, optional): The API key. Defaults to EXOSCALE_API_KEY, or an empty key.
+        secret (str, optional): The API secret. Defaults to EXOSCALE_API_SECRET, or an empty secret.
+        rate_limited (bool, optional): Wrap the client in `RateLimitedExoscale`. Defaults to True.
+
+    Returns:
+        exoscale.api.v2.Client | RateLimitedExoscale: The client.
+    """
+    from exoscale.api.v2 import Client
+
+    key = key if key is not None else os.environ.get('EXOSCALE_API_KEY', '')
+    secret = secret if secret is not None else os.environ.get('EXOSCALE_API_SECRET', '')
+    url = os.getenv('EXOSCALE_API_URL', '')
+    cache_key = ('exoscale', 'v2', zone, key, url)
+    with _lock:
+        exo = _clients.get(cache_key)
+        if exo is None:
+            exo = _clients[cache_key] = Client(key, secret, zone=zone)
+            if url:
+                # Client accepts url= but does not pass it on to the generated base class, so set the endpoint here
+                exo.endpoint = url.format(zone=zone).rstrip('/')
+    return RateLimitedExoscale(exo) if rate_limited else exo
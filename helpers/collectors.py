@@ -0,0 +1,44 @@
+from typing import Iterator
+
+
+def iter_aws(client, operation: str, expression: str, **kwargs) -> Iterator:
+    """
+    Lazily yields the items of a boto3 list/describe call across all of its pages.
+
+    Pages are only requested as the caller consumes items, so breaking out of the loop, or taking the
+    first match with `next`, stops the calls early. Operations without a paginator are called once.
+
+    Args:
+        client: A boto3 client.
+        operation (str): The client method, e.g. 'describe_volumes'.
+        expression (str): A JMESPath expression selecting the items of a page, e.g. 'Volumes[]' or
+            'Reservations[].Instances[]'.
+        **kwargs: The arguments of the call, e.g. `Filters`.
+
+    Yields:
+        dict: The items, one at a time.
+    """
+    if client.can_paginate(operation):
+        yield from client.get_paginator(operation).paginate(**kwargs).search(expression)
+    else:
+        import jmespath
+        yield from jmespath.search(expression, getattr(client, operation)(**kwargs)) or []
+
+
+def iter_exoscale(exo, operation: str, key: str, **kwargs) -> Iterator:
+    """
+    Yields the items of an Exoscale v2 list call, e.g. `list_block_storage_volumes`.
+
+    The v2 list endpoints return the whole collection in one response, so this makes a single call.
+    It gives the Exoscale scripts the same iteration interface as `iter_aws`.
+
+    Args:
+        exo (exoscale.api.v2.Client): An Exoscale client.
+        operation (str): The client method, e.g. 'list_block_storage_volumes'.
+        key (str): The key holding the items in the response, e.g. 'block-storage-volumes'.
+        **kwargs: The arguments of the call.
+
+    Yields:
+        dict: The items, one at a time.
+    """
+    yield from getattr(exo, operation)(**kwargs).get(key, [])
@@ -0,0 +1,273 @@
+from pathlib import Path
+from typing import Iterable, Mapping, Optional
+import os
+import re
+
+
+# Keys holding the region (AWS) or zone (Exoscale) of a config, and the provider they imply.
+# Plain `REGION` belongs to the provider directory the config lives in, e.g. configs/aws/llm.env.
+_REGION_KEYS = {'AWS_REGION': 'aws', 'EXOSCALE_ZONE': 'exoscale'}
+PROVIDERS = ['aws', 'exoscale']
+# Environment variables that point each provider's SDK at credentials (or, for Exoscale, at a fake API)
+_CREDENTIAL_KEYS = {
+    'aws': [
+        'AWS_ACCESS_KEY_ID', 'AWS_PROFILE', 'AWS_WEB_IDENTITY_TOKEN_FILE',
+        'AWS_CONTAINER_CREDENTIALS_RELATIVE_URI', 'AWS_CONTAINER_CREDENTIALS_FULL_URI',
+    ],
+    'exoscale': ['EXOSCALE_API_KEY', 'EXOSCALE_API_URL'],
+}
+# Presets of VOLUME_PROFILE, as EBS volume type, IOPS and throughput in MiB/s
+VOLUME_PROFILES = {
+    # The gp3 baseline, included in the price of the storage
+    'notebook': {'type': 'gp3', 'iops': 3000, 'throughput': 125},
+    # Loading a model reads its weights once, sequentially, so this buys throughput rather than IOPS
+    'model-store': {'type': 'gp3', 'iops': 4000, 'throughput': 1000},
+}
+VOLUME_TYPES = ['gp3', 'gp2', 'io1', 'io2', 'st1', 'sc1']
+# The range of VOLUME_IOPS and VOLUME_THROUGHPUT per volume type. Types missing here take neither.
+_VOLUME_LIMITS = {
+    'gp3': {'iops': (3000, 80000), 'throughput': (125, 2000)},
+    'io1': {'iops': (100, 64000)},
+    'io2': {'iops': (100, 256000)},
+}
+
+
+def read_env_file(path) -> dict:
+    """
+    Parses a `.env` config file the way the workflows load it: `KEY=value` lines, comments and blank lines ignored.
+
+    Args:
+        path (str | Path): The path of the `.env` file.
+
+    Returns:
+        dict: The variables defined in the file.
+    """
+    variables = {}
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or not re.match(r'^[A-Za-z_][A-Za-z0-9_]*=', line):
+            continue
+        key, value = line.split('=', 1)
+        variables[key] = value.strip().strip('"\'')
+    return variables
+
+
+def config_provider(path) -> str:
+    """Returns the provider of a config from its directory, e.g. 'aws' for configs/aws/llm.env, or None."""
+    parent = Path(path).parent.name
+    return parent if parent in PROVIDERS else None
+
+
+def discover_regions(configs_dir='configs') -> dict:
+    """
+    Collects the AWS regions and Exoscale zones used by the configs under `configs_dir`.
+
+    Args:
+        configs_dir (str | Path, optional): The directory to search recursively for `*.env` files. Defaults to 'configs'.
+
+    Returns:
+        dict: A sorted list of regions (or zones) per provider, e.g. {'aws': ['ca-central-1'], 'exoscale': ['ch-gva-2']}.
+    """
+    regions = {provider: set() for provider in PROVIDERS}
+    for path in sorted(Path(configs_dir).glob('**/*.env')):
+        variables = read_env_file(path)
+        provider = config_provider(path)
+        if provider and variables.get('REGION'):
+            regions[provider].add(variables['REGION'])
+        for key, key_provider in _REGION_KEYS.items():
+            if variables.get(key):
+                regions[key_provider].add(variables[key])
+    return {provider: sorted(values) for provider, values in regions.items()}
+
+
+def get_regions(provider: str, configs_dir='configs') -> list[str]:
+    """
+    Retrieves the regions (AWS) or zones (Exoscale) to query for a provider.
+
+    Uses the explicit list in AWS_REGIONS / EXOSCALE_ZONES if set, then the regions discovered in the configs,
+    then the single AWS_REGION / EXOSCALE_ZONE.
+
+    Args:
+        provider (str): 'aws' or 'exoscale'.
+        configs_dir (str | Path, optional): The directory holding the `.env` configs. Defaults to 'configs'.
+
+    Returns:
+        list[str]: The regions or zones.
+
+    Raises:
+        ValueError: If the provider is unknown.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{provider}'. Choose one of: {', '.join(PROVIDERS)}.")
+    env = {'aws': 'AWS_REGION', 'exoscale': 'EXOSCALE_ZONE'}[provider]
+    explicit = os.getenv(env + 'S', '')
+    if explicit:
+        return [value.strip() for value in re.split(r'[;,]', explicit) if value.strip()]
+    discovered = discover_regions(configs_dir)[provider] if Path(configs_dir).is_dir() else []
+    if discovered:
+        return discovered
+    return [os.getenv(env, {'aws': 'ca-central-1', 'exoscale': 'ch-gva-2'}[provider])]
+
+
+def configured_providers(explicit: str = '') -> list[str]:
+    """
+    Retrieves the providers to talk to, so that nothing is imported or called for the others.
+
+    Uses the explicit list if given, e.g. from STATUS_PROVIDERS, and otherwise every provider with credentials in
+    the environment. AWS also counts as configured when its shared credentials or config file exists. Credentials
+    from the EC2 instance metadata service cannot be seen without a call, so list 'aws' explicitly there.
+
+    Args:
+        explicit (str, optional): Comma-delimited providers, e.g. 'aws,exoscale'. Defaults to detecting them.
+
+    Returns:
+        list[str]: The providers, in the order of PROVIDERS.
+
+    Raises:
+        ValueError: If an explicit provider is unknown.
+    """
+    if explicit:
+        providers = [value.strip() for value in re.split(r'[;,]', explicit) if value.strip()]
+        unknown = [provider for provider in providers if provider not in PROVIDERS]
+        if unknown:
+            raise ValueError(f"Unknown provider(s) {', '.join(unknown)}. Choose from: {', '.join(PROVIDERS)}.")
+        return [provider for provider in PROVIDERS if provider in providers]
+
+    configured = [provider for provider in PROVIDERS if any(os.getenv(key) for key in _CREDENTIAL_KEYS[provider])]
+    if 'aws' not in configured:
+        files = [os.getenv('AWS_SHARED_CREDENTIALS_FILE') or '~/.aws/credentials', os.getenv('AWS_CONFIG_FILE') or '~/.aws/config']
+        if any(Path(path).expanduser().is_file() for path in files):
+            configured.insert(0, 'aws')
+    return configured
+
+
+def get_volume_profile(variables: Optional[Mapping] = None) -> dict:
+    """
+    Retrieves the performance settings of an EBS volume from VOLUME_PROFILE, a key of `VOLUME_PROFILES`, and
+    VOLUME_TYPE, VOLUME_IOPS and VOLUME_THROUGHPUT, which override the profile. Changing the type drops the IOPS and
+    throughput of the profile.
+
+    Limits that depend on the size of the volume, e.g. at most 500 IOPS per GiB on gp3, are left to AWS.
+
+    Args:
+        variables (Mapping, optional): Where to read the settings, e.g. a config from `read_env_file`. Defaults to
+            the environment.
+
+    Returns:
+        dict: The `type`, `iops` and `throughput` (MiB/s) of the volume. `iops` and `throughput` are None if the
+            baseline of the type applies. Without any of the settings, a gp3 volume at its baseline.
+
+    Raises:
+        ValueError: If a setting is unknown, not a valid integer, out of range, or does not apply to the type.
+    """
+    variables = os.environ if variables is None else variables
+    name = variables.get('VOLUME_PROFILE', '')
+    if name and name not in VOLUME_PROFILES:
+        raise ValueError(f"VOLUME_PROFILE='{name}' is not a known profile. Choose one of: {', '.join(VOLUME_PROFILES)}.")
+    profile = {'type': 'gp3', 'iops': None, 'throughput': None, **VOLUME_PROFILES.get(name, {})}
+
+    volume_type = variables.get('VOLUME_TYPE', '')
+    if volume_type and volume_type not in VOLUME_TYPES:
+        raise ValueError(f"VOLUME_TYPE='{volume_type}' is not a known volume type. Choose one of: {', '.join(VOLUME_TYPES)}.")
+    if volume_type and volume_type != profile['type']:
+        profile = {'type': volume_type, 'iops': None, 'throughput': None}
+
+    limits = _VOLUME_LIMITS.get(profile['type'], {})
+    for key in ('iops', 'throughput'):
+        env = f'VOLUME_{key.upper()}'
+        value = variables.get(env, '')
+        if value:
+            try:
+                profile[key] = int(value)
+            except ValueError:
+                raise ValueError(f"{env}='{value}' is not a valid integer.")
+            if key not in limits:
+                raise ValueError(f"{env} does not apply to {profile['type']} volumes.")
+            low, high = limits[key]
+            if not low <= profile[key] <= high:
+                raise ValueError(f"{env}='{value}' is out of range for {profile['type']} volumes ({low}-{high}).")
+
+    if profile['type'] in ('io1', 'io2') and profile['iops'] is None:
+        raise ValueError(f"VOLUME_IOPS is required for {profile['type']} volumes.")
+    if profile['type'] == 'gp3' and (profile['throughput'] or 0) > (profile['iops'] or 3000) / 4:
+        raise ValueError(
+            f"VOLUME_THROUGHPUT ({profile['throughput']} MiB/s) is more than a gp3 volume allows at "
+            f"{profile['iops'] or 3000} IOPS, a quarter MiB/s per IOPS."
+        )
+    return profile
+
+
+def discover_volumes(provider: str, configs_dir='configs') -> list[dict]:
+    """
+    Collects the volumes that the configs of a provider define with VOLUME_NAME and VOLUME_SIZE.
+
+    Configs under configs/<provider>/ count with their REGION, and the others with the provider's AWS_REGION /
+    EXOSCALE_ZONE, if they set it. AWS volumes also carry the `profile` of their config, see `get_volume_profile`.
+
+    Args:
+        provider (str): 'aws' or 'exoscale'.
+        configs_dir (str | Path, optional): The directory to search recursively for `*.env` files. Defaults to 'configs'.
+
+    Returns:
+        list[dict]: The `name`, `size`, `region` and `config` path of each volume, in the order of the config paths.
+
+    Raises:
+        ValueError: If the profile of an AWS volume is invalid.
+    """
+    env = {'aws': 'AWS_REGION', 'exoscale': 'EXOSCALE_ZONE'}[provider]
+    volumes = []
+    for path in sorted(Path(configs_dir).glob('**/*.env')):
+        variables = read_env_file(path)
+        region = variables.get(env) or (variables.get('REGION') if config_provider(path) == provider else None)
+        if region and variables.get('VOLUME_NAME') and variables.get('VOLUME_SIZE'):
+            volume = {'name': variables['VOLUME_NAME'], 'size': int(variables['VOLUME_SIZE']), 'region': region, 'config': str(path)}
+            if provider == 'aws':
+                volume['profile'] = get_volume_profile(variables)
+            volumes.append(volume)
+    return volumes
+
+
+def volume_specs(provider: str, specs: Iterable[str] = (), configs_dir: Optional[str] = None) -> dict:
+    """
+    Collects the volumes to provision in one batch, by region (AWS) or zone (Exoscale).
+
+    Args:
+        provider (str): 'aws' or 'exoscale'.
+        specs (Iterable[str], optional): Volumes as 'NAME=SIZE' or 'NAME=SIZE@REGION'. The region defaults to
+            AWS_REGION / EXOSCALE_ZONE, or the provider's default.
+        configs_dir (str | Path, optional): Also every volume the configs under this directory define, see
+            `discover_volumes`.
+
+    Returns:
+        dict: Each volume by name, by region, with its `size` and, for an AWS volume of a config, the `profile` of
+            that config, e.g. {'ca-central-1': {'llm': {'size': 500, 'profile': {...}}, 'notebooks': {'size': 10}}}.
+            A volume named more than once in a region gets the largest size.
+
+    Raises:
+        ValueError: If a spec is malformed, or a config defines an invalid profile, or two configs define
+            different profiles for the same volume in the same region.
+    """
+    env, default = {'aws': ('AWS_REGION', 'ca-central-1'), 'exoscale': ('EXOSCALE_ZONE', 'ch-gva-2')}[provider]
+    volumes = discover_volumes(provider, configs_dir) if configs_dir else []
+    for spec in specs:
+        match = re.fullmatch(r'([A-Za-z0-9_.-]+)=([0-9]+)(?:@([a-z0-9-]+))?', spec.strip())
+        if not match:
+            raise ValueError(f"Invalid volume '{spec}'. Use NAME=SIZE or NAME=SIZE@REGION, e.g. llm=500@ca-central-1.")
+        name, size, region = match.groups()
+        volumes.append({'name': name, 'size': int(size), 'region': region or os.getenv(env) or default})
+
+    batches = {}
+    profile_configs = {}
+    for volume in volumes:
+        spec = batches.setdefault(volume['region'], {}).setdefault(volume['name'], {'size': 0})
+        spec['size'] = max(spec['size'], volume['size'])
+        if volume.get('profile'):
+            key = (volume['region'], volume['name'])
+            if spec.get('profile', volume['profile']) != volume['profile']:
+                raise ValueError(
+                    f"{profile_configs[key]} and {volume['config']} define different profiles for the volume "
+                    f"'{volume['name']}' in {volume['region']}."
+                )
+            spec['profile'] = volume['profile']
+            profile_configs.setdefault(key, volume['config'])
+    return batches
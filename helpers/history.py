@@ -0,0 +1,189 @@
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+import atexit
+import json
+import os
+import re
+import sys
+
+from helpers.instrumentation import API_STATS, instrument_default_session, instrument_from_env
+from helpers.tracing import TRACER, trace_from_env
+
+
+# Span categories that count as phases of a run; 'api' spans are counted through API_STATS instead
+_PHASE_CATEGORIES = {'phase', 'task', 'wait'}
+# Resource IDs in span names, e.g. the VPC in 'vpc-0abc.../classic-elbs', so runs on different resources compare
+_RESOURCE_ID = re.compile(r'\b[a-z]+-[0-9a-f]{8,17}\b')
+# History files this process appends to at exit
+_recording = set()
+# The type of the exception that ended this process, if one reached the top
+_failures = []
+
+
+def _noting_failures(hook):
+    # Wraps sys.excepthook, since atexit hooks cannot see the exception that ended the process
+    def excepthook(exc_type, exc, tb):
+        _failures.append(exc_type.__name__)
+        hook(exc_type, exc, tb)
+    return excepthook
+
+
+def run_key(script: str) -> dict:
+    """
+    Identifies what a run worked on, so that runs of the same script on the same config are compared.
+
+    Args:
+        script (str): The name of the script, starting with the provider, e.g. 'aws/volume/provision'.
+
+    Returns:
+        dict: {'script': ..., 'provider': ..., 'config': ...}. The config is CONFIG_FILE, as set by the workflows,
+            falling back to CLUSTER_NAME or VOLUME_NAME.
+    """
+    return {
+        'script': script,
+        'provider': script.split('/')[0],
+        'config': os.getenv('CONFIG_FILE') or os.getenv('CLUSTER_NAME') or os.getenv('VOLUME_NAME') or '',
+    }
+
+
+def phase_durations(events: list) -> dict:
+    """Sums the durations, in seconds, of the phase, task and wait spans of a trace by name, with resource IDs masked."""
+    durations = defaultdict(float)
+    for event in events:
+        if event.get('ph') == 'X' and event.get('cat') in _PHASE_CATEGORIES:
+            durations[_RESOURCE_ID.sub('*', event['name'])] += event['dur'] / 1e6
+    return {name: round(seconds, 3) for name, seconds in durations.items()}
+
+
+def append_run(path, record: dict):
+    """Appends one run to the JSON Lines history at `path`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def load_runs(path) -> list:
+    """Reads the runs of a history file, oldest first, skipping lines that do not parse."""
+    runs = []
+    if not Path(path).exists():
+        return runs
+    with open(path) as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def history_from_env(script: str) -> bool:
+    """
+    Records this run in the history file at RUN_HISTORY, if set.
+
+    Turns on the tracer and the API call hooks of the default boto3 session, and at exit appends the script, provider,
+    config, outcome, total duration, per-phase durations and API call counts to the file. The run is `ok` unless an
+    exception reached the top of the process, in which case its type is recorded as `error`.
+
+    Args:
+        script (str): The name of the script, e.g. 'aws/volume/provision'.
+
+    Returns:
+        bool: Whether the run is recorded.
+    """
+    path = os.getenv('RUN_HISTORY', '')
+    if not path:
+        return False
+    TRACER.enabled = True
+    instrument_default_session()
+    if path in _recording:
+        return True
+    if not _recording:
+        sys.excepthook = _noting_failures(sys.excepthook)
+    _recording.add(path)
+    start = perf_counter()
+
+    def record():
+        events = TRACER.snapshot()
+        append_run(path, {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            **run_key(script),
+            'ok': not _failures,
+            **({'error': _failures[0]} if _failures else {}),
+            'total': round(perf_counter() - start, 3),
+            'phases': phase_durations(events),
+            'api_calls': {f"{row['provider']} {row['operation']}": row['calls'] for row in API_STATS.summary()},
+        })
+
+    atexit.register(record)
+    return True
+
+
+def observe_from_env(script: str) -> bool:
+    """
+    Turns on, from the environment, everything that watches a run: API call stats (API_STATS, API_STATS_FILE),
+    the Chrome trace (TRACE_FILE) and the run history (RUN_HISTORY).
+
+    Args:
+        script (str): The name of the script, e.g. 'aws/volume/provision'.
+
+    Returns:
+        bool: Whether API calls are instrumented. Scripts that create their own boto3 sessions or Exoscale clients
+            instrument them with `instrument_boto3` and `instrument_exoscale` when it is.
+    """
+    instrumented = instrument_from_env()
+    trace_from_env()
+    return history_from_env(script) or instrumented
+
+
+def compare_runs(runs: list, threshold: float = 1.5, window: int = 10, min_seconds: float = 5) -> list:
+    """
+    Compares the latest run of each script, provider and config with the median of the runs before it. Failed runs,
+    which are often cut short or wait out a timeout, are left out on both sides.
+
+    A phase regressed when it took more than `threshold` times its rolling median and at least `min_seconds` longer.
+    API call counts are compared the same way, without the absolute minimum.
+
+    Args:
+        runs (list): The runs, oldest first, as returned by `load_runs`.
+        threshold (float, optional): The ratio to the median above which a value regressed. Defaults to 1.5.
+        window (int, optional): How many previous runs make up the median. Defaults to 10.
+        min_seconds (float, optional): Ignore slowdowns smaller than this, in seconds. Defaults to 5.
+
+    Returns:
+        list: A dict per regression with the script, provider, config, metric, latest value, median and ratio.
+    """
+    groups = defaultdict(list)
+    for run in runs:
+        if not run.get('ok', True):
+            continue
+        groups[(run.get('script'), run.get('provider'), run.get('config'))].append(run)
+
+    regressions = []
+    for (script, provider, config), group in sorted(groups.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        if len(group) < 2:
+            continue
+        latest, previous = group[-1], group[-1 - window:-1]
+        metrics = [('total', lambda run: run.get('total'), min_seconds)]
+        metrics += [(f'phase {name}', lambda run, name=name: run.get('phases', {}).get(name), min_seconds) for name in latest.get('phases', {})]
+        metrics += [(f'calls {name}', lambda run, name=name: run.get('api_calls', {}).get(name), 0) for name in latest.get('api_calls', {})]
+        for metric, value_of, minimum in metrics:
+            history = [value for value in map(value_of, previous) if value is not None]
+            value = value_of(latest)
+            if not history or value is None:
+                continue
+            baseline = median(history)
+            if value > baseline * threshold and value - baseline >= minimum:
+                regressions.append({
+                    'script': script,
+                    'provider': provider,
+                    'config': config,
+                    'metric': metric,
+                    'latest': value,
+                    'median': baseline,
+                    'ratio': round(value / baseline, 2) if baseline else None,
+                })
+    return regressions
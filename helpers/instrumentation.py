@@ -0,0 +1,259 @@
+from typing import Optional
+from collections import Counter, defaultdict, deque
+from threading import Lock
+from time import monotonic
+import atexit
+import json
+import os
+import sys
+
+
+# Error codes that mean the call was rate limited rather than wrong
+THROTTLING_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'TransactionInProgressException', 'RequestLimitExceeded',
+    'BandwidthLimitExceeded', 'LimitExceededException', 'RequestThrottled', 'SlowDown', 'EC2ThrottledException',
+}
+
+
+def _percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile of sorted values
+    return values[min(len(values) - 1, max(0, round(q * len(values) + 0.5) - 1))]
+
+
+class ApiStats:
+    """
+    Per-operation counts and latencies of cloud API calls.
+
+    Filled by the hooks that `instrument_boto3` and `instrument_exoscale` install. Latency percentiles are
+    computed over the last `max_samples` calls of each operation; counts cover every call. Safe to use from
+    several threads.
+
+    Args:
+        max_samples (int, optional): The latencies kept per operation. Defaults to 10000.
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.latencies = defaultdict(lambda: deque(maxlen=max_samples))
+        self.calls = Counter()
+        self.errors = Counter()
+        self.retries = Counter()
+        self.throttles = Counter()
+        self.total = Counter()
+        self.listeners = []
+        self._lock = Lock()
+
+    def record(self, provider: str, operation: str, seconds: float, error: Optional[str] = None, retries: int = 0):
+        """
+        Records one call.
+
+        Args:
+            provider (str): 'aws' or 'exoscale'.
+            operation (str): The operation, e.g. 'ec2.DescribeVolumes' or 'list_block_storage_volumes'.
+            seconds (float): The duration of the call, including retries.
+            error (str, optional): The error code if the call failed.
+            retries (int, optional): The retries the call needed.
+        """
+        key = (provider, operation)
+        with self._lock:
+            self.calls[key] += 1
+            self.total[key] += seconds
+            self.latencies[key].append(seconds)
+            self.retries[key] += retries
+            if error:
+                self.errors[key] += 1
+        for listener in self.listeners:
+            listener(provider, operation, seconds, error)
+
+    def throttled(self, provider: str, operation: str):
+        """Records one attempt rejected for rate limiting; the call itself may still succeed after a retry."""
+        with self._lock:
+            self.throttles[(provider, operation)] += 1
+
+    def summary(self) -> list:
+        """
+        Returns:
+            list: A dict per operation with its provider, operation, calls, errors, retries, throttles, total
+                seconds and p50/p90/p99/max latency, slowest total first.
+        """
+        with self._lock:
+            keys = set(self.calls) | set(self.throttles)
+            rows = []
+            for key in keys:
+                latencies = sorted(self.latencies[key]) or [0.0]
+                rows.append({
+                    'provider': key[0],
+                    'operation': key[1],
+                    'calls': self.calls[key],
+                    'errors': self.errors[key],
+                    'retries': self.retries[key],
+                    'throttles': self.throttles[key],
+                    'total': round(self.total[key], 3),
+                    'p50': round(_percentile(latencies, 0.5), 3),
+                    'p90': round(_percentile(latencies, 0.9), 3),
+                    'p99': round(_percentile(latencies, 0.99), 3),
+                    'max': round(latencies[-1], 3),
+                })
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def table(self) -> str:
+        """Formats `summary` as a text table."""
+        columns = ['calls', 'errors', 'retries', 'throttles', 'p50', 'p90', 'p99', 'max', 'total']
+        rows = self.summary()
+        width = max([len('API call')] + [len(f"{row['provider']} {row['operation']}") for row in rows])
+        lines = [f"{'API call':<{width}} " + ' '.join(f'{c:>9}' for c in columns)]
+        for row in rows:
+            lines.append(f"{row['provider'] + ' ' + row['operation']:<{width}} " + ' '.join(f'{row[c]:>9}' for c in columns))
+        return '\n'.join(lines)
+
+
+API_STATS = ApiStats()
+
+
+def instrument_boto3(target=None, stats: ApiStats = API_STATS):
+    """
+    Records every call made through a boto3 session or client in `stats`.
+
+    Hooks botocore's `before-call`, `after-call`, `after-call-error` and `needs-retry` events. Instrument a
+    session before creating its clients; clients that already exist are instrumented one by one. Instrumenting
+    the same target twice has no further effect.
+
+    Args:
+        target (optional): A boto3 Session or client. Defaults to the default boto3 session, used by `boto3.client`.
+        stats (ApiStats, optional): Where to record the calls. Defaults to API_STATS.
+
+    Returns:
+        The target.
+    """
+    if target is None:
+        import boto3
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        target = boto3.DEFAULT_SESSION
+    events = target.meta.events if hasattr(target, 'meta') else target.events
+
+    def operation(event_name: str) -> str:
+        # e.g. 'after-call.ec2.DescribeVolumes' -> 'ec2.DescribeVolumes'
+        return event_name.split('.', 1)[1]
+
+    def before_call(context, **kwargs):
+        context['api_stats_start'] = monotonic()
+
+    def after_call(context, parsed, event_name, **kwargs):
+        if 'api_stats_start' in context:
+            error = parsed.get('Error', {}).get('Code')
+            retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            stats.record('aws', operation(event_name), monotonic() - context.pop('api_stats_start'), error, retries)
+
+    def after_call_error(context, exception, event_name, **kwargs):
+        if 'api_stats_start' in context:
+            stats.record('aws', operation(event_name), monotonic() - context.pop('api_stats_start'), type(exception).__name__)
+
+    def needs_retry(response, event_name, **kwargs):
+        if response and response[1].get('Error', {}).get('Code') in THROTTLING_CODES:
+            stats.throttled('aws', operation(event_name))
+
+    for event, handler in (
+        ('before-call', before_call),
+        ('after-call', after_call),
+        ('after-call-error', after_call_error),
+        ('needs-retry', needs_retry),
+    ):
+        events.register(f'{event}.*.*', handler, unique_id=f'api-stats-{id(stats)}-{event}')
+    return target
+
+
+class InstrumentedExoscale:
+    """
+    Wraps an `exoscale.api.v2.Client`, recording the duration and outcome of every method call.
+
+    A call that raises an HTTP 429 is counted as throttled. Attributes other than methods pass through.
+
+    Args:
+        exo (exoscale.api.v2.Client): The client.
+        stats (ApiStats, optional): Where to record the calls. Defaults to API_STATS.
+    """
+
+    def __init__(self, exo, stats: ApiStats = API_STATS):
+        self._exo = exo
+        self._stats = stats
+
+    def __getattr__(self, operation: str):
+        method = getattr(self._exo, operation)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            start = monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status == 429:
+                    self._stats.throttled('exoscale', operation)
+                self._stats.record('exoscale', operation, monotonic() - start, str(status or type(e).__name__))
+                raise
+            self._stats.record('exoscale', operation, monotonic() - start)
+            return result
+        return call
+
+
+def instrument_exoscale(exo, stats: ApiStats = API_STATS):
+    """Returns the Exoscale client wrapped in `InstrumentedExoscale`, unless it already is."""
+    return exo if isinstance(exo, InstrumentedExoscale) else InstrumentedExoscale(exo, stats)
+
+
+_reporting = set()
+# Stats to record the default boto3 session's calls in, once something imports boto3
+_deferred = []
+
+
+def instrument_default_session(stats: ApiStats = API_STATS):
+    """
+    Instruments the default boto3 session, like `instrument_boto3()`, without importing boto3 for it.
+
+    If boto3 is not imported yet, e.g. in a run that only talks to Exoscale, the session is instrumented when
+    `helpers.clients.aws_client` first needs it, through `instrument_deferred`.
+    """
+    if 'boto3' in sys.modules:
+        instrument_boto3(stats=stats)
+    elif stats not in _deferred:
+        _deferred.append(stats)
+
+
+def instrument_deferred():
+    """Instruments the default boto3 session for the stats `instrument_default_session` deferred."""
+    while _deferred:
+        instrument_boto3(stats=_deferred.pop(0))
+
+
+def instrument_from_env(stats: ApiStats = API_STATS) -> bool:
+    """
+    Turns on instrumentation when API_STATS or API_STATS_FILE is set.
+
+    The default boto3 session is instrumented (see `instrument_default_session`), and at exit the summary is printed to stderr as a table
+    (API_STATS) and/or written as JSON to the path in API_STATS_FILE. Calling it again only instruments the
+    default session, which may have been replaced in the meantime.
+
+    Returns:
+        bool: Whether instrumentation is on. Scripts that create their own sessions or Exoscale clients
+            instrument them with `instrument_boto3` and `instrument_exoscale` when it is.
+    """
+    table, path = os.getenv('API_STATS', ''), os.getenv('API_STATS_FILE', '')
+    if not table and not path:
+        return False
+    instrument_default_session(stats)
+    # Scripts run again in the same process, e.g. by the benchmarks, report once
+    if id(stats) in _reporting:
+        return True
+    _reporting.add(id(stats))
+
+    def report():
+        if table:
+            print(stats.table(), file=sys.stderr)
+        if path:
+            with open(path, 'w') as f:
+                json.dump(stats.summary(), f, indent=2)
+
+    atexit.register(report)
+    return True
@@ -0,0 +1,142 @@
+from typing import Iterable, Optional
+from collections import defaultdict
+from threading import RLock
+
+from helpers.collectors import iter_aws
+
+
+# How each kind of resource is listed: (client, operation, items expression, ID key, VPC key, filterable by vpc-id)
+_KINDS = {
+    'classic_load_balancers': ('elb', 'describe_load_balancers', 'LoadBalancerDescriptions[]', 'LoadBalancerName', 'VPCId', False),
+    'v2_load_balancers': ('elbv2', 'describe_load_balancers', 'LoadBalancers[]', 'LoadBalancerArn', 'VpcId', False),
+    'security_groups': ('ec2', 'describe_security_groups', 'SecurityGroups[]', 'GroupId', 'VpcId', True),
+    'network_interfaces': ('ec2', 'describe_network_interfaces', 'NetworkInterfaces[]', 'NetworkInterfaceId', 'VpcId', True),
+    'nat_gateways': ('ec2', 'describe_nat_gateways', 'NatGateways[]', 'NatGatewayId', 'VpcId', True),
+    'instances': ('ec2', 'describe_instances', 'Reservations[].Instances[]', 'InstanceId', 'VpcId', True),
+}
+# Where the security groups of the kinds indexed by security group are
+_GROUPS_KEYS = {'network_interfaces': 'Groups', 'instances': 'SecurityGroups'}
+
+
+class VpcInventory:
+    """
+    An in-memory snapshot of the load balancers, security groups, network interfaces, NAT gateways,
+    instances and Elastic IPs of a set of VPCs.
+
+    Every kind is listed with a single paginated describe, filtered by `vpc-id` where the API allows it,
+    and indexed by ID, by VPC and, for network interfaces and instances, by security group. Callers keep it
+    current with `remove` and `update` after their own changes, and `refresh` a kind when AWS may have
+    changed it behind their back. All methods are safe to call from several threads.
+
+    Args:
+        ec2: A boto3 EC2 client.
+        elb: A boto3 ELB (classic) client.
+        elbv2: A boto3 ELBv2 client.
+        vpc_ids (Iterable[str]): The VPCs to cover.
+    """
+
+    def __init__(self, ec2, elb, elbv2, vpc_ids: Iterable[str]):
+        self.clients = {'ec2': ec2, 'elb': elb, 'elbv2': elbv2}
+        self.vpc_ids = list(vpc_ids)
+        self.items = {kind: {} for kind in _KINDS}
+        self.addresses = {}
+        # The same items by VPC and by security group, as {VPC or group ID: {resource ID: item}}
+        self._vpcs = {kind: defaultdict(dict) for kind in _KINDS}
+        self._groups = {kind: defaultdict(dict) for kind in _GROUPS_KEYS}
+        self._lock = RLock()
+
+    def _add(self, kind: str, item: dict):
+        # Callers hold the lock
+        id_key, vpc_key = _KINDS[kind][3], _KINDS[kind][4]
+        resource_id = item[id_key]
+        self._drop(kind, resource_id)
+        self.items[kind][resource_id] = item
+        self._vpcs[kind][item.get(vpc_key)][resource_id] = item
+        for group in item.get(_GROUPS_KEYS.get(kind), []):
+            self._groups[kind][group['GroupId']][resource_id] = item
+
+    def _drop(self, kind: str, resource_id: str):
+        # Callers hold the lock
+        item = self.items[kind].pop(resource_id, None)
+        if item is None:
+            return
+        for index, key in [(self._vpcs[kind], item.get(_KINDS[kind][4]))] + [
+            (self._groups[kind], group['GroupId']) for group in item.get(_GROUPS_KEYS.get(kind), [])
+        ]:
+            index[key].pop(resource_id, None)
+            if not index[key]:
+                del index[key]
+
+    def _describe(self, kind: str, vpc_ids: list) -> list:
+        client, operation, expression, _, vpc_key, filterable = _KINDS[kind]
+        kwargs = {'Filters': [{'Name': 'vpc-id', 'Values': vpc_ids}]} if filterable else {}
+        items = iter_aws(self.clients[client], operation, expression, **kwargs)
+        return [item for item in items if item.get(vpc_key) in vpc_ids]
+
+    def refresh(self, *kinds: str, vpc_id: Optional[str] = None):
+        """
+        Re-lists the given kinds of resources, or all of them, replacing what the inventory holds.
+
+        Args:
+            *kinds (str): The kinds to refresh, e.g. 'security_groups'. Defaults to all kinds and Elastic IPs.
+            vpc_id (str, optional): Only refresh the resources of this VPC.
+
+        Returns:
+            VpcInventory: The inventory itself.
+        """
+        vpc_ids = [vpc_id] if vpc_id else self.vpc_ids
+        for kind in kinds or list(_KINDS) + ['addresses']:
+            if kind == 'addresses':
+                addresses = list(iter_aws(self.clients['ec2'], 'describe_addresses', 'Addresses[]'))
+                with self._lock:
+                    self.addresses = {a['AllocationId']: a for a in addresses if 'AllocationId' in a}
+                continue
+            if kind not in _KINDS:
+                raise ValueError(f"Unknown resource kind '{kind}'. Choose one of: {', '.join(_KINDS)}, addresses.")
+            items = self._describe(kind, vpc_ids)
+            with self._lock:
+                for resource_id in [i for vpc in vpc_ids for i in self._vpcs[kind].get(vpc, {})]:
+                    self._drop(kind, resource_id)
+                for item in items:
+                    self._add(kind, item)
+        return self
+
+    def get(self, kind: str, resource_id: str) -> Optional[dict]:
+        with self._lock:
+            return self.items[kind].get(resource_id)
+
+    def update(self, kind: str, item: dict):
+        """Replaces, or adds, a single resource after a change made by the caller."""
+        with self._lock:
+            self._add(kind, item)
+
+    def remove(self, kind: str, resource_id: str):
+        """Drops a resource the caller has deleted."""
+        with self._lock:
+            self._drop(kind, resource_id)
+
+    def in_vpc(self, kind: str, vpc_id: str) -> list:
+        """Returns the resources of one kind in the given VPC."""
+        with self._lock:
+            return list(self._vpcs[kind].get(vpc_id, {}).values())
+
+    def by_vpc(self, kind: str) -> dict:
+        """Returns the IDs of the resources of one kind, grouped by VPC."""
+        with self._lock:
+            return {vpc_id: list(items) for vpc_id, items in self._vpcs[kind].items()}
+
+    def by_security_group(self, kind: str) -> dict:
+        """Returns the network interfaces or instances, grouped by the ID of each of their security groups."""
+        with self._lock:
+            return {group_id: list(items.values()) for group_id, items in self._groups[kind].items()}
+
+    def in_security_group(self, kind: str, group_id: str) -> list:
+        """Returns the network interfaces or instances that use the given security group."""
+        with self._lock:
+            return list(self._groups[kind].get(group_id, {}).values())
+
+    def addresses_in_vpc(self, vpc_id: str) -> list:
+        """Returns the Elastic IPs associated with a network interface of the given VPC."""
+        with self._lock:
+            enis = self._vpcs['network_interfaces'].get(vpc_id, {})
+            return [a for a in self.addresses.values() if a.get('NetworkInterfaceId') in enis]
@@ -0,0 +1,76 @@
+from typing import Iterable, Optional, Union
+
+from helpers.waiters import wait_for_each
+
+
+# Final states of an Exoscale operation other than 'success'
+OPERATION_FAILURES = {'failure', 'timeout'}
+
+
+def wait_for_operations(
+    exo,
+    operations: Iterable,
+    timeout: Optional[float] = None,
+    expected: Optional[Union[str, float]] = None,
+    strict: bool = True,
+) -> dict:
+    """
+    Waits for a batch of Exoscale asynchronous operations, e.g. the ones returned by `create_block_storage_volume`
+    or `delete_block_storage_volume`.
+
+    Each tick calls `get_operation` for the operations still pending only, so the cost does not grow with the
+    number of resources in the zone. A call that fails, e.g. with a transient 5xx, leaves its operation pending
+    until the next tick. Timings are the same as in `wait_for`.
+
+    Args:
+        exo (exoscale.api.v2.Client): The client.
+        operations (Iterable[dict | str]): The operations, as returned by the API, or their IDs.
+        timeout (float, optional): The hard deadline in seconds for the whole batch.
+        expected (str | float, optional): A key of `EXPECTED_DURATIONS` or a duration in seconds.
+        strict (bool, optional): Raise if any operation did not succeed. Otherwise return the states of all of
+            them, e.g. to carry on with the rest of a batch. Defaults to True.
+
+    Returns:
+        dict: The final state of each operation by ID, with the resource it acted on in
+            `operation['reference']['id']`. Without `strict`, operations still pending at the deadline keep their
+            last known state, with 'state' 'pending', or None if it was never fetched.
+
+    Raises:
+        RuntimeError: If `strict` and any operation failed, timed out on the Exoscale side, or was still pending at
+            the deadline.
+    """
+    ids = [operation['id'] if isinstance(operation, dict) else operation for operation in operations]
+    latest = {}
+    errors = {}
+
+    def check(pending: list) -> dict:
+        for operation_id in pending:
+            try:
+                latest[operation_id] = exo.get_operation(id=operation_id)
+                errors.pop(operation_id, None)
+            except Exception as e:
+                errors[operation_id] = e
+        return latest
+
+    completed = wait_for_each(
+        check=check,
+        ids=ids,
+        cond=lambda operation: operation is not None and operation.get('state') != 'pending',
+        timeout=timeout,
+        expected=expected,
+    )
+
+    if not strict:
+        return {operation_id: latest.get(operation_id) for operation_id in ids}
+    problems = []
+    for operation_id, seconds in completed.items():
+        operation = latest.get(operation_id, {})
+        command = operation.get('reference', {}).get('command', 'operation')
+        if seconds is None:
+            detail = f"last error: {errors[operation_id]}" if operation_id in errors else f"state {operation.get('state', 'unknown')}"
+            problems.append(f"{command} {operation_id} did not finish in time ({detail})")
+        elif operation.get('state') in OPERATION_FAILURES:
+            problems.append(f"{command} {operation_id} ended in {operation['state']}: {operation.get('reason') or 'no reason given'}")
+    if problems:
+        raise RuntimeError("Exoscale operation(s) did not succeed: " + '; '.join(problems))
+    return {operation_id: latest[operation_id] for operation_id in ids}
@@ -0,0 +1,117 @@
+from typing import Iterable, NamedTuple
+from collections import defaultdict
+
+from helpers.collectors import iter_aws
+
+
+class SecurityGroupReference(NamedTuple):
+    """A rule of `group_id` that refers to another security group."""
+    group_id: str
+    direction: str  # 'ingress' or 'egress'
+    permission: dict
+
+
+def _permission_key(permission: dict) -> tuple:
+    return permission.get('IpProtocol'), permission.get('FromPort'), permission.get('ToPort')
+
+
+class SecurityGroupReferences:
+    """
+    A reverse index from a security group ID to the rules of other groups that refer to it.
+
+    Built once from a list of security groups, e.g. from `VpcInventory` or a single paginated
+    `describe_security_groups`, so finding who refers to a group is a dictionary lookup instead of a scan
+    over every rule of every group in the VPC.
+
+    Args:
+        security_groups (Iterable[dict]): Security groups as returned by `describe_security_groups`.
+    """
+
+    def __init__(self, security_groups: Iterable[dict]):
+        self.index = defaultdict(list)
+        for group in security_groups:
+            for direction, key in (('ingress', 'IpPermissions'), ('egress', 'IpPermissionsEgress')):
+                for permission in group.get(key, []):
+                    for referenced_id in {pair.get('GroupId') for pair in permission.get('UserIdGroupPairs', [])}:
+                        if referenced_id:
+                            self.index[referenced_id].append(SecurityGroupReference(group['GroupId'], direction, permission))
+
+    @classmethod
+    def describe(cls, ec2, vpc_ids: Iterable[str]) -> 'SecurityGroupReferences':
+        """
+        Builds the index from one paginated `describe_security_groups` over the given VPCs.
+
+        Args:
+            ec2: A boto3 EC2 client.
+            vpc_ids (Iterable[str]): The VPCs whose security groups to index.
+
+        Returns:
+            SecurityGroupReferences: The index.
+        """
+        return cls(iter_aws(ec2, 'describe_security_groups', 'SecurityGroups[]', Filters=[{'Name': 'vpc-id', 'Values': list(vpc_ids)}]))
+
+    def referencing(self, group_id: str) -> list:
+        """Returns the rules, as `SecurityGroupReference`s, that refer to `group_id`."""
+        return list(self.index.get(group_id, []))
+
+    def revocations(self, group_ids: Iterable[str], skip: Iterable[str] = ()) -> dict:
+        """
+        Groups the rules referring to any of `group_ids` into one revocation per referencing group and direction.
+
+        Only the group pairs pointing at `group_ids` are revoked; CIDR ranges and other pairs of the same
+        rule are kept.
+
+        Args:
+            group_ids (Iterable[str]): The security groups to detach references from.
+            skip (Iterable[str], optional): Referencing groups to leave alone, e.g. the groups being deleted.
+
+        Returns:
+            dict: A list of `IpPermissions` per (referencing group ID, direction).
+        """
+        group_ids, skip = set(group_ids), set(skip)
+        pairs = defaultdict(dict)
+        for group_id in group_ids:
+            for ref in self.index.get(group_id, []):
+                if ref.group_id in skip:
+                    continue
+                permission_pairs = pairs[(ref.group_id, ref.direction)].setdefault(_permission_key(ref.permission), [])
+                for pair in ref.permission.get('UserIdGroupPairs', []):
+                    if pair.get('GroupId') in group_ids and pair not in permission_pairs:
+                        permission_pairs.append(pair)
+
+        revocations = {}
+        for (referencing_id, direction), by_permission in pairs.items():
+            revocations[(referencing_id, direction)] = [
+                {
+                    'IpProtocol': protocol,
+                    **({'FromPort': from_port} if from_port is not None else {}),
+                    **({'ToPort': to_port} if to_port is not None else {}),
+                    'UserIdGroupPairs': [{k: v for k, v in pair.items() if k in ('GroupId', 'UserId')} for pair in group_pairs],
+                }
+                for (protocol, from_port, to_port), group_pairs in by_permission.items()
+            ]
+        return revocations
+
+    def revoke(self, ec2, group_ids: Iterable[str], skip: Iterable[str] = ()) -> dict:
+        """
+        Revokes every rule of other groups that refers to any of `group_ids`, with one call per referencing
+        group and direction.
+
+        Args:
+            ec2: A boto3 EC2 client.
+            group_ids (Iterable[str]): The security groups to detach references from.
+            skip (Iterable[str], optional): Referencing groups to leave alone, e.g. the groups being deleted.
+
+        Returns:
+            dict: The revoked `IpPermissions` per (referencing group ID, direction).
+        """
+        group_ids, skip = set(group_ids), set(skip)
+        revocations = self.revocations(group_ids, skip)
+        for (referencing_id, direction), permissions in revocations.items():
+            if direction == 'ingress':
+                ec2.revoke_security_group_ingress(GroupId=referencing_id, IpPermissions=permissions)
+            else:
+                ec2.revoke_security_group_egress(GroupId=referencing_id, IpPermissions=permissions)
+        for group_id in group_ids:
+            self.index[group_id] = [ref for ref in self.index.get(group_id, []) if ref.group_id in skip]
+        return revocations
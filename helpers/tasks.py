@@ -0,0 +1,127 @@
+from typing import Any, Callable, Iterable, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+
+from helpers.tracing import span
+
+
+class TaskGraph:
+    """
+    A set of named tasks with dependencies, run concurrently on a bounded thread pool.
+
+    A task starts as soon as all the tasks it depends on have succeeded, so independent branches run in
+    parallel and only real dependencies block. When a task fails, the tasks depending on it are skipped,
+    the other branches still run to completion, and `run` raises at the end.
+
+    Example:
+        >>> graph = TaskGraph()
+        >>> graph.add('delete_lbs', delete_lbs)
+        >>> graph.add('delete_sgs', delete_sgs, deps=['delete_lbs'])
+        >>> graph.run(max_workers=4)
+    """
+
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name: str, fn: Callable, deps: Iterable[str] = (), kwargs: dict = None):
+        """
+        Adds a task to the graph.
+
+        Args:
+            name (str): The unique name of the task.
+            fn (Callable): The function to run.
+            deps (Iterable[str], optional): The names of the tasks that must succeed before this one starts.
+            kwargs (dict, optional): Keyword arguments to pass to `fn`.
+
+        Raises:
+            ValueError: If a task with the same name already exists.
+        """
+        if name in self.tasks:
+            raise ValueError(f"Task '{name}' is already in the graph.")
+        self.tasks[name] = (fn, list(deps), kwargs or {})
+
+    def _check(self):
+        for name, (_, deps, _) in self.tasks.items():
+            for dep in deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task '{name}' depends on unknown task '{dep}'.")
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Task '{name}' is part of a dependency cycle.")
+            visiting.add(name)
+            for dep in self.tasks[name][1]:
+                visit(dep)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self.tasks:
+            visit(name)
+
+    def run(self, max_workers: int = 4, verbose: bool = True, on_done: Optional[Callable[[str, Any], None]] = None) -> dict:
+        """
+        Runs every task once its dependencies have succeeded.
+
+        Args:
+            max_workers (int, optional): The size of the thread pool. Defaults to 4.
+            verbose (bool, optional): Print a line as each task finishes, is skipped or fails. Defaults to True.
+            on_done (Callable, optional): Called with the name and the return value of each task as soon as it
+                succeeds, on the thread calling `run`, e.g. to stream results before the whole graph is done.
+
+        Returns:
+            dict: The return value of each task, by name.
+
+        Raises:
+            ValueError: If a dependency is unknown or the graph has a cycle.
+            RuntimeError: If any task failed, with the name and error of every failed task, and the first error as
+                its cause. Tasks depending on a failed task are skipped.
+        """
+        self._check()
+        results, errors, skipped = {}, {}, []
+        waiting = dict(self.tasks)
+        running = {}
+
+        def timed(name, fn, kwargs):
+            start = monotonic()
+            with span(name, category='task'):
+                result = fn(**kwargs)
+            if verbose:
+                print(f"[{name}] done in {monotonic() - start:.1f}s")
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while waiting or running:
+                for name, (fn, deps, kwargs) in list(waiting.items()):
+                    if any(dep in errors or dep in skipped for dep in deps):
+                        if verbose:
+                            print(f"[{name}] skipped, a dependency failed")
+                        skipped.append(name)
+                        del waiting[name]
+                    elif all(dep in results for dep in deps):
+                        running[executor.submit(timed, name, fn, kwargs)] = name
+                        del waiting[name]
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        if verbose:
+                            print(f"[{name}] failed: {e!r}")
+                        errors[name] = e
+                    else:
+                        if on_done:
+                            on_done(name, results[name])
+
+        if errors:
+            # The reasons go in the message too, so the error stands on its own without the printed progress
+            failures = '; '.join(f'{name}: {e!r}' for name, e in errors.items())
+            raise RuntimeError(
+                f"{len(errors)} task(s) failed: {failures}. Skipped: {', '.join(skipped) or 'none'}."
+            ) from next(iter(errors.values()))
+        return results
@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+from threading import Lock, current_thread, get_ident
+from time import perf_counter
+import atexit
+import json
+import os
+
+
+class Tracer:
+    """
+    Collects timed spans and writes them in the Chrome trace event format.
+
+    The file opens in chrome://tracing or https://ui.perfetto.dev as a timeline with one row per thread, so
+    concurrent phases, e.g. the branches of a `TaskGraph`, show side by side. Nothing is recorded until
+    `enabled` is set, usually by `trace_from_env`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.threads = {}
+        self._origin = perf_counter()
+        self._lock = Lock()
+
+    def complete(self, name: str, category: str, start: float, end: float, args: dict = None):
+        """
+        Records a span that has ended.
+
+        Args:
+            name (str): The span name, e.g. 'wait nat_gateway_deleted'.
+            category (str): The kind of span, e.g. 'phase', 'task', 'wait' or 'api'.
+            start (float): `time.perf_counter()` at the start.
+            end (float): `time.perf_counter()` at the end.
+            args (dict, optional): Details shown with the span, e.g. the resource IDs.
+        """
+        thread_id = get_ident()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': os.getpid(),
+            'tid': thread_id,
+            'args': args or {},
+        }
+        with self._lock:
+            self.threads.setdefault(thread_id, current_thread().name)
+            self.events.append(event)
+
+    def snapshot(self) -> list:
+        """Returns a copy of the spans recorded so far, safe to read while other threads record more."""
+        with self._lock:
+            return list(self.events)
+
+    def write(self, path: str):
+        """Writes the spans recorded so far to `path` as a Chrome trace."""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id, 'args': {'name': thread_name}}
+            for thread_id, thread_name in threads.items()
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+TRACER = Tracer()
+
+
+@contextmanager
+def span(name: str, category: str = 'phase', **args):
+    """
+    Times a block, or every call of a function, as a span of TRACER.
+
+    Example:
+        >>> with span('delete classic ELBs', vpc_id=vpc_id):
+        ...     ...
+        >>> @span('create snapshot')
+        ... def create_snapshot(): ...
+
+    Args:
+        name (str): The span name.
+        category (str, optional): The kind of span. Defaults to 'phase'.
+        **args: Details shown with the span.
+    """
+    if not TRACER.enabled:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        TRACER.complete(name, category, start, perf_counter(), args)
+
+
+def trace_from_env() -> bool:
+    """
+    Turns tracing on when TRACE_FILE is set, and writes the trace to that path at exit.
+
+    If API calls are instrumented (see `instrument_from_env`), each call also becomes an 'api' span.
+
+    Returns:
+        bool: Whether tracing is on.
+    """
+    path = os.getenv('TRACE_FILE', '')
+    if not path or TRACER.enabled:
+        return TRACER.enabled
+    TRACER.enabled = True
+
+    from helpers.instrumentation import API_STATS
+
+    def api_span(provider, operation, seconds, error):
+        end = perf_counter()
+        TRACER.complete(f'{provider} {operation}', 'api', end - seconds, end, {'error': error} if error else None)
+
+    API_STATS.listeners.append(api_span)
+    atexit.register(TRACER.write, path)
+    return True
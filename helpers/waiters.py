@@ -0,0 +1,179 @@
+from typing import Any, Callable, Optional, Union
+from random import uniform
+from time import monotonic, sleep
+import os
+
+from helpers.tracing import span
+
+
+# Rough time, in seconds, that a resource takes to reach its target state.
+# Passing one of these keys as `expected=` to `wait_for` picks the polling
+# cadence and the default deadline, so callers don't have to tune timings.
+EXPECTED_DURATIONS = {
+    'ebs_volume_available': 10,
+    'ebs_volume_deleted': 10,
+    'classic_elb_deleted': 15,
+    'elbv2_deleted': 30,
+    'eni_detached': 10,
+    'eni_released': 60,
+    'nat_gateway_deleted': 60,
+    'exoscale_volume_ready': 15,
+    'exoscale_volume_deleted': 15,
+    'exoscale_snapshot_created': 60,
+    'exoscale_nlb_deleted': 30,
+}
+
+# Multiplies every timeout and polling interval. The benchmarks set it well below 1, since moto
+# reaches target states immediately and the real cadence would only add sleeps.
+WAIT_TIME_SCALE = float(os.getenv('WAIT_TIME_SCALE') or 1)
+
+
+def backoff_delays(first: float = 1, factor: float = 2.0, max_interval: float = 30, jitter: float = 0.2):
+    """
+    Yields an endless sequence of delays growing exponentially up to a cap, with random jitter.
+
+    Args:
+        first (float, optional): The first delay in seconds. Defaults to 1 second.
+        factor (float, optional): The multiplier applied after every delay. Defaults to 2.
+        max_interval (float, optional): The cap on a single delay, before jitter. Defaults to 30 seconds.
+        jitter (float, optional): The relative spread of the random jitter, e.g. 0.2 for +/-20%. Defaults to 0.2.
+
+    Yields:
+        float: The next delay in seconds.
+    """
+    delay = first
+    while True:
+        yield delay * uniform(1 - jitter, 1 + jitter) if jitter else delay
+        delay = min(delay * factor, max_interval)
+
+
+def _resolve_timings(expected: Optional[Union[str, float]], timeout, first_interval, max_interval):
+    if isinstance(expected, str):
+        if expected not in EXPECTED_DURATIONS:
+            raise ValueError(f"Unknown expected duration '{expected}'. Choose one of: {', '.join(EXPECTED_DURATIONS)}.")
+        expected = EXPECTED_DURATIONS[expected]
+    if expected:
+        timeout = timeout if timeout is not None else 5 * expected
+        first_interval = first_interval if first_interval is not None else min(max(expected / 10, 0.5), 5)
+        max_interval = max_interval if max_interval is not None else min(max(expected / 2, first_interval), 30)
+    else:
+        timeout = timeout if timeout is not None else 60
+        first_interval = first_interval if first_interval is not None else 1
+        max_interval = max_interval if max_interval is not None else 15
+    return timeout * WAIT_TIME_SCALE, first_interval * WAIT_TIME_SCALE, max_interval * WAIT_TIME_SCALE
+
+
+def _span_name(expected) -> str:
+    return f'wait {expected}' if isinstance(expected, str) else 'wait'
+
+
+def wait_for(
+    check: Callable,
+    kwargs: Optional[dict] = None,
+    cond: Callable[[Any], bool] = bool,
+    timeout: Optional[float] = None,
+    expected: Optional[Union[str, float]] = None,
+    first_interval: Optional[float] = None,
+    max_interval: Optional[float] = None,
+    factor: float = 2.0,
+    jitter: float = 0.2,
+    return_result: bool = False,
+):
+    """
+    Polls `check` with exponential backoff until `cond` holds on its result or a hard deadline passes.
+
+    The first call to `check` is made immediately. Later calls are spaced by `backoff_delays`, and the
+    last sleep is cut short so that the final probe happens at the deadline rather than after it.
+
+    Args:
+        check (Callable): The function to be called periodically with the specified arguments.
+        kwargs (dict, optional): Keyword arguments to pass to the `check` function. Defaults to none.
+        cond (Callable[[Any], bool], optional): Returns True when the result of `check` is in the desired state. Defaults to `bool`.
+        timeout (float, optional): The hard deadline in seconds. Defaults to five times the expected duration, or 60 seconds.
+        expected (str | float, optional): A key of `EXPECTED_DURATIONS` or a duration in seconds, used to derive the defaults of the other timings.
+        first_interval (float, optional): The delay before the second call to `check`.
+        max_interval (float, optional): The cap on the delay between two calls to `check`.
+        factor (float, optional): The backoff multiplier. Defaults to 2.
+        jitter (float, optional): The relative spread of the random jitter. Defaults to 0.2.
+        return_result (bool, optional): If True, return the last result of `check` along with the outcome. Defaults to False.
+
+    Returns:
+        bool | tuple[bool, Any]: Whether the condition was met before the deadline, and, if `return_result` is set,
+        the last result of `check`.
+    """
+    kwargs = kwargs or {}
+    timeout, first_interval, max_interval = _resolve_timings(expected, timeout, first_interval, max_interval)
+    deadline = monotonic() + timeout
+
+    with span(_span_name(expected), category='wait', timeout=timeout):
+        result = check(**kwargs)
+        met = cond(result)
+        delays = backoff_delays(first_interval, factor, max_interval, jitter)
+        while not met:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            sleep(min(next(delays), remaining))
+            result = check(**kwargs)
+            met = cond(result)
+
+    if return_result:
+        return met, result
+    return met
+
+
+def wait_for_each(
+    check: Callable[[list], dict],
+    ids,
+    cond: Callable[[Any], bool],
+    timeout: Optional[float] = None,
+    expected: Optional[Union[str, float]] = None,
+    first_interval: Optional[float] = None,
+    max_interval: Optional[float] = None,
+    factor: float = 2.0,
+    jitter: float = 0.2,
+) -> dict:
+    """
+    Waits for many resources at once, with a single call to `check` per tick for all of them.
+
+    `check` receives the list of IDs still pending and returns a mapping of ID to resource. An ID missing
+    from the mapping is passed to `cond` as None, which lets `cond` treat disappeared resources as done.
+    IDs are dropped from the poll as soon as they reach their target state, so the wait is bounded by the
+    slowest resource rather than by the sum. Timings are the same as in `wait_for`.
+
+    Args:
+        check (Callable[[list], dict]): Describes the given IDs in one batched call.
+        ids (Iterable[str]): The IDs of the resources to wait for.
+        cond (Callable[[Any], bool]): Returns True when a resource (or None) is in the desired state.
+        timeout (float, optional): The hard deadline in seconds for the whole batch.
+        expected (str | float, optional): A key of `EXPECTED_DURATIONS` or a duration in seconds.
+        first_interval (float, optional): The delay before the second call to `check`.
+        max_interval (float, optional): The cap on the delay between two calls to `check`.
+        factor (float, optional): The backoff multiplier. Defaults to 2.
+        jitter (float, optional): The relative spread of the random jitter. Defaults to 0.2.
+
+    Returns:
+        dict: The number of seconds each ID took to reach its target state, or None for IDs that did not
+        reach it before the deadline.
+    """
+    timeout, first_interval, max_interval = _resolve_timings(expected, timeout, first_interval, max_interval)
+    start = monotonic()
+    deadline = start + timeout
+    pending = list(dict.fromkeys(ids))
+    completed = {resource_id: None for resource_id in pending}
+
+    with span(_span_name(expected), category='wait', timeout=timeout, ids=len(pending)):
+        delays = backoff_delays(first_interval, factor, max_interval, jitter)
+        while pending:
+            resources = check(pending)
+            now = monotonic()
+            for resource_id in list(pending):
+                if cond(resources.get(resource_id)):
+                    completed[resource_id] = now - start
+                    pending.remove(resource_id)
+            remaining = deadline - now
+            if not pending or remaining <= 0:
+                break
+            sleep(min(next(delays), remaining))
+
+    return completed
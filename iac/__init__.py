@@ -0,0 +1 @@
+from iac.orchestrator import COMMANDS, STEPS, Orchestrator, load_script
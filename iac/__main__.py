@@ -0,0 +1,26 @@
+import argparse
+
+from helpers.configs import PROVIDERS
+from iac.orchestrator import COMMANDS, Orchestrator
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m iac', description="Run the steps of a config in a single process.")
+    parser.add_argument("command", choices=list(COMMANDS), help="; ".join(f"{command}: {', '.join(steps)}" for command, steps in COMMANDS.items()))
+    parser.add_argument("--config", required=True, help="The .env config, e.g. configs/aws/llm.env.")
+    parser.add_argument("--provider", choices=PROVIDERS, help="Defaults to the directory of the config.")
+    parser.add_argument("--steps", help="Comma-separated steps to run instead of all of the command's, from the command's steps.")
+    parser.add_argument("--outputs", help="The Pulumi outputs JSON file, for the subnets step.")
+    parser.add_argument("--output", help="The Markdown file of the status step. Defaults to STATUS-<config name>.md.")
+    args = parser.parse_args()
+
+    # Unknown steps, steps of another command and bad config values all end up here as ValueError
+    try:
+        orchestrator = Orchestrator(args.config, args.provider, args.outputs, args.output)
+        orchestrator.run(args.command, args.steps.split(',') if args.steps else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+from pathlib import Path
+from typing import Optional
+import importlib.util
+import os
+import sys
+
+from helpers.clients import aws_client, exoscale_client
+from helpers.configs import PROVIDERS, config_provider, read_env_file
+from helpers.history import observe_from_env
+from helpers.instrumentation import instrument_exoscale
+from helpers.tracing import span
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'scripts'
+# The steps each command runs, in order, and the only ones it may be told to run instead
+COMMANDS = {
+    'provision': ['volume', 'subnets'],
+    'teardown': ['load-balancers', 'volume'],
+    'status': ['status'],
+}
+STEPS = ['volume', 'subnets', 'load-balancers', 'status']
+# The environment variable naming the region (AWS) or zone (Exoscale) of each provider, and its default
+_REGION_ENV = {'aws': ('AWS_REGION', 'ca-central-1'), 'exoscale': ('EXOSCALE_ZONE', 'ch-gva-2')}
+
+
+def load_script(path: str):
+    """
+    Imports a script of `scripts/` as a module, once per process. Its `__main__` block does not run.
+
+    Args:
+        path (str): The script, relative to `scripts/` and without '.py', e.g. 'aws/volume/provision'.
+
+    Returns:
+        module: The script's module.
+    """
+    name = 'scripts.' + path.replace('/', '.')
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, SCRIPTS_DIR / f'{path}.py')
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+class Orchestrator:
+    """
+    Runs the steps of a config in one process, instead of one `python scripts/...` process per step.
+
+    Each step imports its script only when it runs, so only the selected provider's SDK is loaded. The steps share
+    the process-wide clients of `helpers.clients`, one STS identity check per run, and, on AWS, the VPC inventory of
+    the load balancer teardown.
+
+    Args:
+        config (str | Path): The `.env` config, e.g. 'configs/aws/llm.env'.
+        provider (str, optional): 'aws' or 'exoscale'. Defaults to the directory of the config.
+        outputs (str, optional): The Pulumi outputs JSON file the subnets step reads.
+        status_output (str, optional): The Markdown file the status step writes. Defaults to
+            STATUS-<config name>.md, so the full STATUS.md of `scripts/status.py` is left alone.
+
+    Raises:
+        ValueError: If the provider is unknown, or cannot be told from the config's directory.
+    """
+
+    def __init__(self, config, provider: Optional[str] = None, outputs: Optional[str] = None, status_output: Optional[str] = None):
+        self.config = Path(config)
+        self.provider = provider or config_provider(self.config)
+        if self.provider not in PROVIDERS:
+            raise ValueError(f"Cannot tell the provider of {self.config}. Pass one of: {', '.join(PROVIDERS)}.")
+        self.variables = read_env_file(self.config)
+        self.outputs = outputs
+        self.status_output = status_output or f'STATUS-{self.config.stem}.md'
+        self.instrumented = False
+        # The VPC inventory of the cluster, kept from one step to the next
+        self.inventory = None
+        # Whether the steps were chosen explicitly, rather than being the command's defaults
+        self.explicit_steps = False
+        self._exo = None
+
+    def apply(self):
+        """
+        Exports the config to the environment, the way the workflows `source` it, with the plain REGION of the config
+        as AWS_REGION or EXOSCALE_ZONE unless the config sets those.
+        """
+        os.environ.update(self.variables)
+        env, _ = _REGION_ENV[self.provider]
+        region = self.variables.get(env) or self.variables.get('REGION')
+        if region:
+            os.environ[env] = region
+        os.environ.setdefault('CONFIG_FILE', self.config.name)
+
+    @property
+    def region(self) -> str:
+        """The region (AWS) or zone (Exoscale) of the config."""
+        env, default = _REGION_ENV[self.provider]
+        return os.environ.get(env, default)
+
+    @property
+    def exo(self):
+        """The Exoscale client of the zone, created on first use and instrumented if API calls are."""
+        if self._exo is None:
+            self._exo = exoscale_client(self.region)
+            if self.instrumented:
+                self._exo = instrument_exoscale(self._exo)
+        return self._exo
+
+    def _clients(self) -> dict:
+        # The client arguments of the Exoscale step functions. The AWS ones share the clients of helpers.clients.
+        return {'exo': self.exo} if self.provider == 'exoscale' else {}
+
+    def volume(self, command: str):
+        """Provisions or tears down the volume of the config."""
+        if command not in ('provision', 'teardown'):
+            raise ValueError(f"The volume step cannot run for '{command}'.")
+        name = self.variables.get('VOLUME_NAME')
+        if not name:
+            print("Skipping volume: the config has no VOLUME_NAME")
+            return
+        if command == 'teardown' and self.variables.get('CLUSTER_NAME') and not self.explicit_steps:
+            # Volumes are the tier below clusters, and outlive them
+            print("Skipping volume: the config also defines a cluster. Pass --steps volume to tear the volume down.")
+            return
+        script = load_script(f'{self.provider}/volume/{command}')
+        if command == 'provision':
+            volume = script.provision_volume(name, int(self.variables['VOLUME_SIZE']), self.region, **self._clients())
+            script.write_volume_file(name, volume)
+        else:
+            script.teardown_volumes(name, self.region, **self._clients())
+
+    def subnets(self, command: str):
+        """Tags the public subnets of the cluster from the Pulumi outputs."""
+        if self.provider != 'aws' or not self.outputs:
+            print("Skipping subnets: only AWS clusters, with the Pulumi outputs file, have subnets to tag")
+            return
+        load_script('aws/cluster/tag_subnets').tag_subnets(self.outputs)
+
+    def load_balancers(self, command: str):
+        """Tears down the load balancers of the cluster."""
+        if command != 'teardown':
+            raise ValueError(f"The load-balancers step only tears load balancers down, it cannot run for '{command}'.")
+        cluster_name = self.variables.get('CLUSTER_NAME')
+        if not cluster_name:
+            print("Skipping load-balancers: the config has no CLUSTER_NAME")
+            return
+        script = load_script(f'{self.provider}/cluster/teardown_load_balancer')
+        if self.provider == 'aws':
+            self.inventory = script.teardown_load_balancers(cluster_name, self.region, inventory=self.inventory)
+        else:
+            script.teardown_load_balancers(cluster_name, self.region, exo=self.exo)
+
+    def status(self, command: str):
+        """Writes the status report of the config's region or zone."""
+        status = load_script('status')
+        aws = status.aws_clients([self.region]) if self.provider == 'aws' else {}
+        exoscale = {self.region: self.exo} if self.provider == 'exoscale' else {}
+        status.write_markdown(status.stream(list(aws), list(exoscale), verbose=False, aws=aws, exoscale=exoscale), self.status_output)
+        print(f"Wrote {self.status_output}")
+
+    def run(self, command: str, steps: Optional[list] = None):
+        """
+        Runs the steps of a command, in order.
+
+        Args:
+            command (str): A key of COMMANDS.
+            steps (list, optional): The steps to run, from the command's steps in COMMANDS. Defaults to all of them.
+
+        Raises:
+            ValueError: If the command is unknown, or a step is unknown or not one of the command's.
+        """
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command '{command}'. Choose one of: {', '.join(COMMANDS)}.")
+        self.explicit_steps = bool(steps)
+        steps = steps or COMMANDS[command]
+        unknown = [step for step in steps if step not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown step(s): {', '.join(unknown)}. Choose from: {', '.join(STEPS)}.")
+        # e.g. load-balancers only tears down, so it must not run for provision
+        foreign = [step for step in steps if step not in COMMANDS[command]]
+        if foreign:
+            raise ValueError(f"{command} cannot run step(s): {', '.join(foreign)}. Choose from: {', '.join(COMMANDS[command])}.")
+
+        self.apply()
+        # A single step keeps the run history name of its script, so it compares with the runs of that script
+        scripts = {
+            'volume': f'{self.provider}/volume/{command}',
+            'subnets': 'aws/cluster/tag_subnets',
+            'load-balancers': f'{self.provider}/cluster/teardown_load_balancer',
+            'status': f'{self.provider}/status',
+        }
+        self.instrumented = observe_from_env(scripts[steps[0]] if len(steps) == 1 else f'{self.provider}/iac/{command}')
+        if self.provider == 'aws' and steps != ['status']:
+            # Fail early if the credentials are missing, once for every step
+            aws_client('sts', self.region).get_caller_identity()
+
+        for step in steps:
+            print(f"== {command} {step} ({self.provider}, {self.region})")
+            with span(f'step {step}'):
+                getattr(self, step.replace('-', '_'))(command)
@@ -16,24 +16,24 @@ def main(cluster_name, repo_name):
     policy_pattern = f"{cluster_name}-{repo_name}-scoped-*"
 
     # Delete roles
-    for role in iam.list_roles()["Roles"]:
+    for role in iam.get_paginator("list_roles").paginate().search("Roles[]"):
         name = role["RoleName"]
         if name == role_pattern:
             print(f"Cleaning role {name}")
             # Detach inline and attached policies
-            for p in iam.list_attached_role_policies(RoleName=name)["AttachedPolicies"]:
+            for p in iam.get_paginator("list_attached_role_policies").paginate(RoleName=name).search("AttachedPolicies[]"):
                 iam.detach_role_policy(RoleName=name, PolicyArn=p["PolicyArn"])
-            for p in iam.list_role_policies(RoleName=name)["PolicyNames"]:
+            for p in iam.get_paginator("list_role_policies").paginate(RoleName=name).search("PolicyNames[]"):
                 iam.delete_role_policy(RoleName=name, PolicyName=p)
             iam.delete_role(RoleName=name)
 
     # Delete policies
-    for policy in iam.list_policies(Scope="Local")["Policies"]:
+    for policy in iam.get_paginator("list_policies").paginate(Scope="Local").search("Policies[]"):
         if fnmatch.fnmatch(policy["PolicyName"], policy_pattern):
             arn = policy["Arn"]
             print(f"Deleting policy {policy['PolicyName']}")
             # Delete old versions first
-            versions = iam.list_policy_versions(PolicyArn=arn)["Versions"]
+            versions = iam.get_paginator("list_policy_versions").paginate(PolicyArn=arn).search("Versions[]")
             for v in versions:
                 if not v["IsDefaultVersion"]:
                     iam.delete_policy_version(PolicyArn=arn, VersionId=v["VersionId"])
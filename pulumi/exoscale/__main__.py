@@ -80,6 +80,9 @@ if VOLUME_NAME:
         os.environ.get('EXOSCALE_API_SECRET', ''),
         zone=REGION
     )
+    if os.environ.get('EXOSCALE_API_URL'):
+        # A stand-in API, e.g. benchmarks/fake_exoscale.py
+        exo_client.endpoint = os.environ['EXOSCALE_API_URL'].format(zone=REGION).rstrip('/')
 
     exo_volumes_response = exo_client.list_block_storage_volumes()
     exo_volumes = exo_volumes_response.get('block-storage-volumes', [])
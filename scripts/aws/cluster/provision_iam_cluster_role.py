@@ -1,112 +1,28 @@
 import os
 import json
+from typing import Optional
 
-import boto3
-
-
-REGION = os.environ.get('AWS_REGION', 'ca-central-1')
-CLUSTER_NAME = os.environ.get('CLUSTER_NAME')
-AWS_ACCOUNT_ID = os.environ.get('AWS_ACCOUNT_ID')
-
-
-session = boto3.Session(region_name=REGION)
-iam_client = session.client('iam')
+from helpers import aws_client
 
 
 # The Cluster Role
-# Define the role name
-role_name = f'{CLUSTER_NAME}-eks-role'
-
-# Create the trust policy for the role
-trust_policy = {
-    "Version": "2012-10-17",
-    "Statement": [
-        {
-            "Effect": "Allow",
-            "Principal": {
-                "Service": [
-                    "eks.amazonaws.com",
-                    "ec2.amazonaws.com"
-                ]
-            },
-            "Action": "sts:AssumeRole"
-        }
-    ]
-}
-
-# Create the IAM role
-try:
-    response = iam_client.create_role(
-        RoleName=role_name,
-        AssumeRolePolicyDocument=json.dumps(trust_policy),
-        Description='Role for EKS Node Group'
-    )
-    node_role_arn = response['Role']['Arn']
-    print(f"Created role: {node_role_arn}")
-except iam_client.exceptions.EntityAlreadyExistsException:
-    response = iam_client.get_role(RoleName=role_name)
-    node_role_arn = response['Role']['Arn']
-    print(f"Role {role_name} already exists. Arn: {node_role_arn}.")
-    # TODO: Check if trust_policy is correct.
-
-# Attach necessary policies
-policies = [
+CLUSTER_ROLE_SERVICES = [
+    "eks.amazonaws.com",
+    "ec2.amazonaws.com"
+]
+CLUSTER_ROLE_POLICIES = [
     # 'AmazonEKSWorkerNodePolicy',
     # 'AmazonEC2ContainerRegistryReadOnly',
     # 'AmazonEKS_CNI_Policy',
     'AmazonEKSClusterPolicy',
     # 'AmazonSSMManagedInstanceCore',
 ]
-# Policy AmazonSSMManagedInstanceCore is not necessary, I used it for debugging, to connect to the node and run commands.
-
-for policy in policies:
-    try:
-        iam_client.attach_role_policy(
-            RoleName=role_name,
-            PolicyArn=f'arn:aws:iam::aws:policy/{policy}'
-        )
-        print(f"Attached policy {policy} to role {role_name}.")
-    except Exception as e:
-        print(f"Error attaching policy {policy}: {e}")
-
 
 # The Node Group Role
-# Define the role name
-role_name = f'{CLUSTER_NAME}-node-role'
-
-# Create the trust policy for the role
-trust_policy = {
-    "Version": "2012-10-17",
-    "Statement": [
-        {
-            "Effect": "Allow",
-            "Principal": {
-                "Service": [
-                    "ec2.amazonaws.com"
-                ]
-            },
-            "Action": "sts:AssumeRole"
-        }
-    ]
-}
-
-# Create the IAM role
-try:
-    response = iam_client.create_role(
-        RoleName=role_name,
-        AssumeRolePolicyDocument=json.dumps(trust_policy),
-        Description='Role for EKS Node Group'
-    )
-    node_role_arn = response['Role']['Arn']
-    print(f"Created role: {node_role_arn}")
-except iam_client.exceptions.EntityAlreadyExistsException:
-    response = iam_client.get_role(RoleName=role_name)
-    node_role_arn = response['Role']['Arn']
-    print(f"Role {role_name} already exists. Arn: {node_role_arn}.")
-    # TODO: Check if trust_policy is correct.
-
-# Attach necessary policies
-policies = [
+NODE_ROLE_SERVICES = [
+    "ec2.amazonaws.com"
+]
+NODE_ROLE_POLICIES = [
     'AmazonEKSWorkerNodePolicy',
     'AmazonEC2ContainerRegistryReadOnly',
     'AmazonEKS_CNI_Policy',
@@ -114,12 +30,74 @@ policies = [
 ]
 # Policy AmazonSSMManagedInstanceCore is not necessary, I used it for debugging, to connect to the node and run commands.
 
-for policy in policies:
+
+def provision_role(iam_client, role_name: str, services: list, policies: list) -> str:
+    """
+    Creates an IAM role that `services` can assume, or finds it if it exists, and attaches the AWS managed `policies`.
+
+    Returns:
+        str: The ARN of the role.
+    """
+    # Create the trust policy for the role
+    trust_policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {
+                    "Service": services
+                },
+                "Action": "sts:AssumeRole"
+            }
+        ]
+    }
+
+    # Create the IAM role
     try:
-        iam_client.attach_role_policy(
+        response = iam_client.create_role(
             RoleName=role_name,
-            PolicyArn=f'arn:aws:iam::aws:policy/{policy}'
+            AssumeRolePolicyDocument=json.dumps(trust_policy),
+            Description='Role for EKS Node Group'
         )
-        print(f"Attached policy {policy} to role {role_name}.")
-    except Exception as e:
-        print(f"Error attaching policy {policy}: {e}")
\ No newline at end of file
+        node_role_arn = response['Role']['Arn']
+        print(f"Created role: {node_role_arn}")
+    except iam_client.exceptions.EntityAlreadyExistsException:
+        response = iam_client.get_role(RoleName=role_name)
+        node_role_arn = response['Role']['Arn']
+        print(f"Role {role_name} already exists. Arn: {node_role_arn}.")
+        # TODO: Check if trust_policy is correct.
+
+    # Attach necessary policies
+    for policy in policies:
+        try:
+            iam_client.attach_role_policy(
+                RoleName=role_name,
+                PolicyArn=f'arn:aws:iam::aws:policy/{policy}'
+            )
+            print(f"Attached policy {policy} to role {role_name}.")
+        except Exception as e:
+            print(f"Error attaching policy {policy}: {e}")
+    return node_role_arn
+
+
+def provision_cluster_roles(cluster_name: Optional[str], region: Optional[str] = None) -> dict:
+    """
+    Provisions the EKS cluster role, <cluster_name>-eks-role, and the node group role, <cluster_name>-node-role.
+
+    Returns:
+        dict: The ARN of each role, by name.
+    """
+    iam_client = aws_client('iam', region or os.environ.get('AWS_REGION', 'ca-central-1'))
+    roles = {
+        f'{cluster_name}-eks-role': (CLUSTER_ROLE_SERVICES, CLUSTER_ROLE_POLICIES),
+        f'{cluster_name}-node-role': (NODE_ROLE_SERVICES, NODE_ROLE_POLICIES),
+    }
+    return {role_name: provision_role(iam_client, role_name, services, policies) for role_name, (services, policies) in roles.items()}
+
+
+def main():
+    provision_cluster_roles(os.environ.get('CLUSTER_NAME'))
+
+
+if __name__ == '__main__':
+    main()
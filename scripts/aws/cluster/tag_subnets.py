@@ -1,7 +1,8 @@
 import argparse
 import json
 import os
-import boto3
+
+from helpers import aws_client
 
 def tag_subnets(outputs_file):
     with open(outputs_file) as f:
@@ -12,7 +13,7 @@ def tag_subnets(outputs_file):
     cluster_name = data["cluster_name"]
     subnet_ids = data["public_subnet_ids"]
 
-    ec2 = boto3.client("ec2", region_name=region)
+    ec2 = aws_client("ec2", region)
     tag_key = f"kubernetes.io/cluster/{cluster_name}"
 
     # subnet_arns = [f"arn:aws:ec2:{region}:{account_id}:subnet/{sid}" for sid in subnet_ids]
@@ -24,9 +25,14 @@ def tag_subnets(outputs_file):
 
     print(f"Tagged subnets: {len(subnet_ids)} with {tag_key}=owned")
 
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Tag public subnets from Pulumi output with cluster name.")
     parser.add_argument("outputs_file", help="Path to Pulumi outputs JSON file.")
     args = parser.parse_args()
 
     tag_subnets(args.outputs_file)
+
+
+if __name__ == "__main__":
+    main()
+
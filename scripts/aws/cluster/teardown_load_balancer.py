@@ -1,131 +1,134 @@
 import os
-import boto3
-from typing import List
-from time import sleep
-
-from helpers import wait_until
-
-
-REGION = os.environ.get('AWS_REGION', 'ca-central-1')
-CLUSTER_NAME = os.environ['CLUSTER_NAME']
-
-session = boto3.Session(region_name=REGION)
-# eks_client = session.client('eks')
-ec2_client = session.client('ec2')
-# iam_client = session.client('iam')
-elb_client = session.client('elb')
-elbv2_client = session.client('elbv2')  # Application/Network Load Balancers
-
-aws_account_id = boto3.client('sts').get_caller_identity().get('Account')
-
-response = ec2_client.describe_vpcs(Filters=[{'Name': f'tag:cluster_name', 'Values': [CLUSTER_NAME]}])
-vpc_ids = [vpc['VpcId'] for vpc in response['Vpcs']]
-for vpc_id in vpc_ids:
-    print("VPC ID:", vpc_id, ", deleting associated load balancers...")
-
-    # Delete Classic Load Balancers (ELBv1)
-    classic_lbs = elb_client.describe_load_balancers()['LoadBalancerDescriptions']
-    deleted_classic_lb_names: List[str] = []
-
-    for lb in classic_lbs:
-        if lb['VPCId'] == vpc_id:
-            lb_name = lb['LoadBalancerName']
-            print(f"Deleting Classic ELB: {lb_name}")
-            response = elb_client.delete_load_balancer(LoadBalancerName=lb_name)
-            print(response)
-            assert response['ResponseMetadata']['HTTPStatusCode'] == 200
-            deleted_classic_lb_names.append(lb_name)
-            print(f"Deleted Classic ELB {lb_name}")
-
-    # Wait for classic LBs to be deleted
-    if deleted_classic_lb_names:
-        print(f"Waiting for {len(deleted_classic_lb_names)} Classic ELB(s) to be deleted...")
-        for lb_name in deleted_classic_lb_names:
-            # Keep checking if the LB still exists in the full list
-            all_lbs = elb_client.describe_load_balancers()['LoadBalancerDescriptions']
-            remaining_names = [lb['LoadBalancerName'] for lb in all_lbs]
-
-            if lb_name in remaining_names:
-                wait_until(
-                    check=lambda: [lb['LoadBalancerName'] for lb in elb_client.describe_load_balancers()['LoadBalancerDescriptions']],
-                    kwargs={},
-                    cond=lambda x: lb_name not in x,
-                    timeout=300,
-                    wait_interval=10,
-                )
-        print(f"All Classic ELBs deleted")
-
-    # Delete ALB/NLB (ELBv2)
-    v2_load_balancers = elbv2_client.describe_load_balancers()['LoadBalancers']
-    deleted_lb_arns: List[str] = []
-
-    for lb in v2_load_balancers:
-        if lb['VpcId'] == vpc_id:
-            lb_arn = lb['LoadBalancerArn']
-            lb_name = lb['LoadBalancerName']
-            print(f"Deleting ALB/NLB: {lb_name}")
-            response = elbv2_client.delete_load_balancer(LoadBalancerArn=lb_arn)
-            print(response)
-            assert response['ResponseMetadata']['HTTPStatusCode'] == 200
-            deleted_lb_arns.append(lb_arn)
-            print(f"Deleted {lb_name}")
-
-    def check_lbs_deleted(res):
-        # If LoadBalancerNotFoundException is raised, it means they're all deleted
-        # Otherwise check if the list is empty
-        return
-
-    wait_until(
-        check=elbv2_client.describe_load_balancers,
-        kwargs={"LoadBalancerArns": deleted_lb_arns},
-        cond=lambda x: len(x.get('LoadBalancers', [])) == 0,
-        timeout=300,
-        wait_interval=10,
-    )
-
-    # Delete security groups created by Kubernetes/Helm for load balancers
-    print("Checking for Kubernetes-managed security groups...")
-    all_sgs = ec2_client.describe_security_groups(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])
-    k8s_elb_sgs = []
-
-    for sg in all_sgs['SecurityGroups']:
-        sg_name = sg.get('GroupName', '')
-        sg_id = sg['GroupId']
-
-        # Check if this is a k8s-managed ELB security group (NOT cluster or node SGs)
-        if sg_name.startswith('k8s-elb-'):
-            # Skip default SG and cluster/node security groups
-            if sg_name == 'default' or 'eks-cluster-sg' in sg_name or 'nodeSecurityGroup' in sg_name:
-                continue
-
-            print(f"Found Kubernetes ELB security group: {sg_name} ({sg_id})")
-            k8s_elb_sgs.append(sg_id)
-
-    # Delete the security groups (need to wait for LBs to be fully deleted first)
-    if k8s_elb_sgs:
-        print(f"Waiting for load balancers and network interfaces to be fully cleaned up...")
-        wait_until(
-            check=lambda: ec2_client.describe_network_interfaces(
-                Filters=[{"Name": "group-id", "Values": k8s_elb_sgs}]
-            ),
-            kwargs={},
-            cond=lambda res: len(res.get('NetworkInterfaces', [])) == 0,
+from typing import List, Optional
+
+from helpers import (
+    SecurityGroupReferences, TaskGraph, VpcInventory, aws_client, get_env_count, iter_aws, observe_from_env, span,
+    wait_for, wait_for_each,
+)
+
+
+MAX_WORKERS = get_env_count('TEARDOWN_MAX_WORKERS') or 8
+
+
+class LoadBalancerTeardown:
+    """
+    Deletes the load balancers in the VPCs of a cluster, and what they leave behind that blocks the VPC teardown:
+    the k8s ELB security groups, NAT gateways, ELB network interfaces and Elastic IPs.
+
+    Args:
+        region (str, optional): The region. Defaults to AWS_REGION, or 'ca-central-1'.
+        max_workers (int, optional): The size of the teardown graph's pool. Defaults to MAX_WORKERS.
+        inventory (VpcInventory, optional): An inventory of the cluster's VPCs to reuse, e.g. from an earlier
+            step of the same run. Defaults to listing the VPC resources in `run`.
+    """
+
+    def __init__(self, region: Optional[str] = None, max_workers: int = MAX_WORKERS, inventory: Optional[VpcInventory] = None):
+        self.region = region or os.environ.get('AWS_REGION', 'ca-central-1')
+        self.max_workers = max_workers
+        # Shared clients, with a connection pool for every worker of the teardown graph
+        self.ec2_client = aws_client('ec2', self.region, max_workers)
+        self.elb_client = aws_client('elb', self.region, max_workers)
+        self.elbv2_client = aws_client('elbv2', self.region, max_workers)  # Application/Network Load Balancers
+        self.inventory = inventory
+
+    def delete_classic_load_balancers(self, vpc_id: str):
+        # Delete Classic Load Balancers (ELBv1)
+        deleted_classic_lb_names: List[str] = []
+
+        with span('delete classic ELBs', vpc_id=vpc_id):
+            for lb in self.inventory.in_vpc('classic_load_balancers', vpc_id):
+                lb_name = lb['LoadBalancerName']
+                print(f"Deleting Classic ELB: {lb_name}")
+                response = self.elb_client.delete_load_balancer(LoadBalancerName=lb_name)
+                print(response)
+                assert response['ResponseMetadata']['HTTPStatusCode'] == 200
+                deleted_classic_lb_names.append(lb_name)
+                self.inventory.remove('classic_load_balancers', lb_name)
+                print(f"Deleted Classic ELB {lb_name}")
+
+        # Wait for classic LBs to be deleted
+        if deleted_classic_lb_names:
+            print(f"Waiting for {len(deleted_classic_lb_names)} Classic ELB(s) to be deleted...")
+            # Keep checking which LBs still exist in the full list, one listing per tick for all of them
+            completed = wait_for_each(
+                check=lambda names: {lb['LoadBalancerName']: lb for lb in iter_aws(self.elb_client, 'describe_load_balancers', 'LoadBalancerDescriptions[]')},
+                ids=deleted_classic_lb_names,
+                cond=lambda lb: lb is None,
+                timeout=300,
+                expected='classic_elb_deleted',
+            )
+            for lb_name, seconds in completed.items():
+                print(f"Classic ELB {lb_name} " + (f"deleted after {seconds:.0f}s" if seconds is not None else "still present"))
+            print(f"All Classic ELBs deleted")
+
+
+    def delete_v2_load_balancers(self, vpc_id: str):
+        # Delete ALB/NLB (ELBv2)
+        deleted_lb_arns: List[str] = []
+
+        with span('delete ALBs/NLBs', vpc_id=vpc_id):
+            for lb in self.inventory.in_vpc('v2_load_balancers', vpc_id):
+                lb_arn = lb['LoadBalancerArn']
+                lb_name = lb['LoadBalancerName']
+                print(f"Deleting ALB/NLB: {lb_name}")
+                response = self.elbv2_client.delete_load_balancer(LoadBalancerArn=lb_arn)
+                print(response)
+                assert response['ResponseMetadata']['HTTPStatusCode'] == 200
+                deleted_lb_arns.append(lb_arn)
+                self.inventory.remove('v2_load_balancers', lb_arn)
+                print(f"Deleted {lb_name}")
+
+        # Describing a deleted ARN raises LoadBalancerNotFoundException, so list them all and look for ours
+        completed = wait_for_each(
+            check=lambda arns: {lb['LoadBalancerArn']: lb for lb in iter_aws(self.elbv2_client, 'describe_load_balancers', 'LoadBalancers[]')},
+            ids=deleted_lb_arns,
+            cond=lambda lb: lb is None,
             timeout=300,
-            wait_interval=10,
+            expected='elbv2_deleted',
         )
-
-        for sg_id in k8s_elb_sgs:
-            print(f"Deleting security group {sg_id}")
-
-            # Step 1: Check for instances using this security group
-            print(f"  - Checking for instances associated with security group {sg_id}")
-            instances_response = ec2_client.describe_instances(
-                Filters=[{"Name": "instance.group-id", "Values": [sg_id]}]
+        for lb_arn, seconds in completed.items():
+            print(f"ALB/NLB {lb_arn} " + (f"deleted after {seconds:.0f}s" if seconds is not None else "still present"))
+
+
+    def delete_k8s_elb_security_groups(self, vpc_id: str):
+        # Delete security groups created by Kubernetes/Helm for load balancers
+        print("Checking for Kubernetes-managed security groups...")
+        k8s_elb_sgs = []
+
+        for sg in self.inventory.in_vpc('security_groups', vpc_id):
+            sg_name = sg.get('GroupName', '')
+            sg_id = sg['GroupId']
+
+            # Check if this is a k8s-managed ELB security group (NOT cluster or node SGs)
+            if sg_name.startswith('k8s-elb-'):
+                # Skip default SG and cluster/node security groups
+                if sg_name == 'default' or 'eks-cluster-sg' in sg_name or 'nodeSecurityGroup' in sg_name:
+                    continue
+
+                print(f"Found Kubernetes ELB security group: {sg_name} ({sg_id})")
+                k8s_elb_sgs.append(sg_id)
+
+        # Delete the security groups (need to wait for LBs to be fully deleted first)
+        if k8s_elb_sgs:
+            print(f"Waiting for load balancers and network interfaces to be fully cleaned up...")
+            wait_for(
+                check=lambda: self.ec2_client.describe_network_interfaces(
+                    Filters=[{"Name": "group-id", "Values": k8s_elb_sgs}]
+                ),
+                cond=lambda res: len(res.get('NetworkInterfaces', [])) == 0,
+                timeout=300,
+                expected='eni_released',
             )
+            # The load balancers took their network interfaces and instances with them
+            self.inventory.refresh('network_interfaces', 'instances', vpc_id=vpc_id)
+
+            for sg_id in k8s_elb_sgs:
+                print(f"Deleting security group {sg_id}")
 
-            instance_ids = []
-            for reservation in instances_response.get('Reservations', []):
-                for instance in reservation.get('Instances', []):
+                # Step 1: Check for instances using this security group
+                print(f"  - Checking for instances associated with security group {sg_id}")
+                instance_ids = []
+                for instance in self.inventory.in_security_group('instances', sg_id):
                     instance_id = instance['InstanceId']
                     instance_state = instance['State']['Name']
                     instance_ids.append(instance_id)
@@ -138,222 +141,287 @@ for vpc_id in vpc_ids:
 
                     if new_sgs:
                         print(f"      - Updating instance security groups from {current_sgs} to {new_sgs}")
-                        ec2_client.modify_instance_attribute(
+                        self.ec2_client.modify_instance_attribute(
                             InstanceId=instance_id,
                             Groups=new_sgs
                         )
                         print(f"      - Disassociated security group from instance {instance_id}")
+                        self.inventory.update('instances', {**instance, 'SecurityGroups': [g for g in instance['SecurityGroups'] if g['GroupId'] != sg_id]})
                     else:
                         print(f"      - WARNING: Instance {instance_id} only has this security group, cannot remove")
 
-            # Step 2: Find and handle all network interfaces using this security group
-            print(f"  - Finding network interfaces associated with security group {sg_id}")
-            eni_response = ec2_client.describe_network_interfaces(
-                Filters=[{"Name": "group-id", "Values": [sg_id]}]
-            )
-
-            for eni in eni_response.get('NetworkInterfaces', []):
-                eni_id = eni['NetworkInterfaceId']
-                attachment = eni.get('Attachment', {})
-                eni_status = eni.get('Status')
+                # Step 2: Find and handle all network interfaces using this security group
+                print(f"  - Finding network interfaces associated with security group {sg_id}")
+                for eni in self.inventory.in_security_group('network_interfaces', sg_id):
+                    eni_id = eni['NetworkInterfaceId']
+                    attachment = eni.get('Attachment', {})
+                    eni_status = eni.get('Status')
 
-                print(f"    - Network interface {eni_id} (status: {eni_status})")
+                    print(f"    - Network interface {eni_id} (status: {eni_status})")
 
-                # Get current security groups on this ENI
-                current_sgs = [sg['GroupId'] for sg in eni.get('Groups', [])]
-                new_sgs = [sg for sg in current_sgs if sg != sg_id]
+                    # Get current security groups on this ENI
+                    current_sgs = [sg['GroupId'] for sg in eni.get('Groups', [])]
+                    new_sgs = [sg for sg in current_sgs if sg != sg_id]
 
-                # Try to modify the ENI to remove this security group
-                if new_sgs:
-                    print(f"      - Modifying ENI security groups from {current_sgs} to {new_sgs}")
-                    ec2_client.modify_network_interface_attribute(
-                        NetworkInterfaceId=eni_id,
-                        Groups=new_sgs
-                    )
-                    print(f"      - Disassociated security group from ENI {eni_id}")
-                    continue  # Don't try to delete if we just modified
+                    # Try to modify the ENI to remove this security group
+                    if new_sgs:
+                        print(f"      - Modifying ENI security groups from {current_sgs} to {new_sgs}")
+                        self.ec2_client.modify_network_interface_attribute(
+                            NetworkInterfaceId=eni_id,
+                            Groups=new_sgs
+                        )
+                        print(f"      - Disassociated security group from ENI {eni_id}")
+                        self.inventory.update('network_interfaces', {**eni, 'Groups': [g for g in eni['Groups'] if g['GroupId'] != sg_id]})
+                        continue  # Don't try to delete if we just modified
 
 
-                # If attached, try to detach
-                if 'AttachmentId' in attachment:
-                    print(f"      - Detaching network interface (Attachment: {attachment.get('AttachmentId')})")
-                    ec2_client.detach_network_interface(
-                        AttachmentId=attachment['AttachmentId'],
-                        Force=True
-                    )
-                    print(f"      - Waiting for detachment...")
-                    wait_until(
-                        check=ec2_client.describe_network_interfaces,
-                        kwargs={"NetworkInterfaceIds": [eni_id]},
-                        cond=lambda res: res['NetworkInterfaces'][0].get('Attachment') is None or res['NetworkInterfaces'][0]['Status'] == 'available',
-                        timeout=60,
-                        wait_interval=5,
+                    # If attached, try to detach
+                    if 'AttachmentId' in attachment:
+                        print(f"      - Detaching network interface (Attachment: {attachment.get('AttachmentId')})")
+                        self.ec2_client.detach_network_interface(
+                            AttachmentId=attachment['AttachmentId'],
+                            Force=True
+                        )
+                        print(f"      - Waiting for detachment...")
+                        wait_for(
+                            check=self.ec2_client.describe_network_interfaces,
+                            kwargs={"NetworkInterfaceIds": [eni_id]},
+                            cond=lambda res: res['NetworkInterfaces'][0].get('Attachment') is None or res['NetworkInterfaces'][0]['Status'] == 'available',
+                            timeout=60,
+                            expected='eni_detached',
+                        )
+                        print(f"      - Detached {eni_id}")
+
+                    # If ENI is available or has no attachment, try to delete it
+                    if eni_status == 'available' or 'AttachmentId' not in attachment:
+                        print(f"      - Deleting available network interface {eni_id}")
+                        self.ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
+                        self.inventory.remove('network_interfaces', eni_id)
+                        print(f"      - Deleted {eni_id}")
+
+                # Step 3: Remove all ingress and egress rules to remove cross-SG dependencies
+                sg_details = self.inventory.get('security_groups', sg_id)
+
+                if sg_details['IpPermissions']:
+                    print(f"  - Removing {len(sg_details['IpPermissions'])} ingress rule(s)")
+                    self.ec2_client.revoke_security_group_ingress(
+                        GroupId=sg_id,
+                        IpPermissions=sg_details['IpPermissions']
                     )
-                    print(f"      - Detached {eni_id}")
-
-                # If ENI is available or has no attachment, try to delete it
-                if eni_status == 'available' or 'AttachmentId' not in attachment:
-                    print(f"      - Deleting available network interface {eni_id}")
-                    ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
-                    print(f"      - Deleted {eni_id}")
-
-            # Step 3: Remove all ingress and egress rules to remove cross-SG dependencies
-            sg_details = ec2_client.describe_security_groups(GroupIds=[sg_id])['SecurityGroups'][0]
-
-            if sg_details['IpPermissions']:
-                print(f"  - Removing {len(sg_details['IpPermissions'])} ingress rule(s)")
-                ec2_client.revoke_security_group_ingress(
-                    GroupId=sg_id,
-                    IpPermissions=sg_details['IpPermissions']
-                )
-
-            if sg_details['IpPermissionsEgress']:
-                print(f"  - Removing {len(sg_details['IpPermissionsEgress'])} egress rule(s)")
-                ec2_client.revoke_security_group_egress(
-                    GroupId=sg_id,
-                    IpPermissions=sg_details['IpPermissionsEgress']
-                )
 
-            # Step 3.5: Check if any OTHER security groups reference this one
-            print(f"  - Checking for security groups that reference {sg_id}")
-            all_vpc_sgs = ec2_client.describe_security_groups(
-                Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
-            )['SecurityGroups']
-
-            for other_sg in all_vpc_sgs:
-                if other_sg['GroupId'] == sg_id:
-                    continue  # Skip the SG we're trying to delete
-
-                # Check if this SG references our target SG in ingress rules
-                rules_to_revoke = []
-                for perm in other_sg.get('IpPermissions', []):
-                    for group_pair in perm.get('UserIdGroupPairs', []):
-                        if group_pair.get('GroupId') == sg_id:
-                            rules_to_revoke.append(perm)
-                            break
-
-                if rules_to_revoke:
-                    print(f"    - Removing {len(rules_to_revoke)} rule(s) from {other_sg['GroupId']} that reference {sg_id}")
-                    ec2_client.revoke_security_group_ingress(
-                        GroupId=other_sg['GroupId'],
-                        IpPermissions=rules_to_revoke
+                if sg_details['IpPermissionsEgress']:
+                    print(f"  - Removing {len(sg_details['IpPermissionsEgress'])} egress rule(s)")
+                    self.ec2_client.revoke_security_group_egress(
+                        GroupId=sg_id,
+                        IpPermissions=sg_details['IpPermissionsEgress']
                     )
+                self.inventory.update('security_groups', {**sg_details, 'IpPermissions': [], 'IpPermissionsEgress': []})
+
+            # Step 3.5: Remove the rules of OTHER security groups that reference the ones being deleted,
+            # with one revoke per referencing group and direction
+            print(f"  - Checking for security groups that reference {', '.join(k8s_elb_sgs)}")
+            with span('revoke SG refs', vpc_id=vpc_id, groups=len(k8s_elb_sgs)):
+                references = SecurityGroupReferences(self.inventory.in_vpc('security_groups', vpc_id))
+                revoked = references.revoke(self.ec2_client, k8s_elb_sgs, skip=k8s_elb_sgs)
+                for (other_sg_id, direction), permissions in revoked.items():
+                    print(f"    - Removed {len(permissions)} {direction} rule(s) from {other_sg_id} that reference the deleted group(s)")
+                self.inventory.refresh('security_groups', vpc_id=vpc_id)
+
+            for sg_id in k8s_elb_sgs:
+                # Step 4: Wait for all modifications to propagate, then delete the security group
+                print(f"  - Waiting for security group modifications to propagate...")
+                wait_for(
+                    check=lambda: self.ec2_client.describe_network_interfaces(
+                        Filters=[{"Name": "group-id", "Values": [sg_id]}]
+                    ),
+                    cond=lambda res: len(res.get('NetworkInterfaces', [])) == 0,
+                    timeout=120,
+                    expected='eni_released',
+                )
+                self.ec2_client.delete_security_group(GroupId=sg_id)
+                self.inventory.remove('security_groups', sg_id)
+                print(f"  - ✅ Deleted security group {sg_id}")
+
+
+    def delete_nat_gateways(self, vpc_id: str):
+        # Additional cleanup: Release Elastic IPs associated with the VPC
+        # 1. Delete NAT Gateways in the VPC (they block IGW deletion)
+        nat_gateway_ids = []
+        with span('delete NAT gateways', vpc_id=vpc_id):
+            for ngw in self.inventory.in_vpc('nat_gateways', vpc_id):
+                if ngw["State"] == "deleted":
+                    continue
+                ngw_id = ngw["NatGatewayId"]
+                print("Deleting NAT Gateway", ngw_id)
+                nat_gateway_ids.append(ngw_id)
+                self.ec2_client.delete_nat_gateway(NatGatewayId=ngw_id)
+
+        # Wait for ALL NAT gateways to be deleted
+        if nat_gateway_ids:
+            print(f"Waiting for {len(nat_gateway_ids)} NAT Gateway(s) to be fully deleted...")
+            completed = wait_for_each(
+                check=lambda ids: {g["NatGatewayId"]: g for g in iter_aws(self.ec2_client, 'describe_nat_gateways', 'NatGateways[]', NatGatewayIds=ids)},
+                ids=nat_gateway_ids,
+                cond=lambda g: g is None or g["State"] == "deleted",
+                timeout=300,
+                expected='nat_gateway_deleted',
+            )
+            for ngw_id, seconds in completed.items():
+                print(f"NAT Gateway {ngw_id} " + (f"deleted after {seconds:.0f}s" if seconds is not None else "not deleted yet"))
+
+            print("Waiting for the NAT Gateway network interfaces to release their EIPs...")
+            wait_for(
+                check=self.ec2_client.describe_network_interfaces,
+                kwargs={"Filters": [
+                    {"Name": "vpc-id", "Values": [vpc_id]},
+                    {"Name": "interface-type", "Values": ["nat_gateway"]},
+                ]},
+                cond=lambda res: len(res.get("NetworkInterfaces", [])) == 0,
+                timeout=120,
+                expected='eni_released',
+            )
 
-                # Check egress rules
-                egress_rules_to_revoke = []
-                for perm in other_sg.get('IpPermissionsEgress', []):
-                    for group_pair in perm.get('UserIdGroupPairs', []):
-                        if group_pair.get('GroupId') == sg_id:
-                            egress_rules_to_revoke.append(perm)
-                            break
-
-                if egress_rules_to_revoke:
-                    print(f"    - Removing {len(egress_rules_to_revoke)} egress rule(s) from {other_sg['GroupId']} that reference {sg_id}")
-                    ec2_client.revoke_security_group_egress(
-                        GroupId=other_sg['GroupId'],
-                        IpPermissions=egress_rules_to_revoke
-                    )
 
-            # Step 4: Wait for all modifications to propagate, then delete the security group
-            print(f"  - Waiting for security group modifications to propagate...")
-            wait_until(
-                check=lambda: ec2_client.describe_network_interfaces(
-                    Filters=[{"Name": "group-id", "Values": [sg_id]}]
-                ),
-                kwargs={},
-                cond=lambda res: len(res.get('NetworkInterfaces', [])) == 0,
+    def release_elastic_ips(self, vpc_id: str):
+        # 2. Find and release ALL Elastic IPs in the VPC
+        print("Checking for Elastic IPs in the VPC...")
+        # Load balancer, security group and NAT gateway deletions have changed the network interfaces by now
+        self.inventory.refresh('network_interfaces', vpc_id=vpc_id)
+        self.inventory.refresh('addresses')
+        deleted_eni_ids = []
+
+        for eni in self.inventory.in_vpc('network_interfaces', vpc_id):
+            assoc = eni.get("Association")
+            if assoc and "PublicIp" in assoc:
+                public_ip = assoc["PublicIp"]
+                eni_id = eni["NetworkInterfaceId"]
+                print(f"Found EIP {public_ip} on network interface {eni_id}")
+
+                # Check what's using this ENI
+                attachment = eni.get("Attachment", {})
+                instance_id = attachment.get("InstanceId")
+                if instance_id:
+                    print(f"  - Attached to EC2 instance: {instance_id}")
+
+                requester_id = eni.get("RequesterId")
+                print(f"  - Requester: {requester_id}")
+                print(f"  - Status: {eni.get('Status')}")
+
+                # If owned by amazon-elb, force delete the network interface
+                if requester_id == "amazon-elb":
+                    print(f"  - Detaching and deleting ELB-owned network interface {eni_id}")
+                    # First, try to detach if attached
+                    if attachment and "AttachmentId" in attachment:
+                        self.ec2_client.detach_network_interface(
+                            AttachmentId=attachment["AttachmentId"],
+                            Force=True
+                        )
+                        wait_for(
+                            check=self.ec2_client.describe_network_interfaces,
+                            kwargs={"NetworkInterfaceIds": [eni_id]},
+                            cond=lambda res: res['NetworkInterfaces'][0].get('Attachment') is None or res['NetworkInterfaces'][0]['Status'] == 'available',
+                            timeout=60,
+                            expected='eni_detached',
+                        )
+                        print(f"  - Detached network interface")
+
+                    # Then delete the network interface
+                    self.ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
+                    print(f"  - Deleted network interface {eni_id}")
+                    deleted_eni_ids.append(eni_id)
+                    self.inventory.remove('network_interfaces', eni_id)
+
+                # If the ENI is available (not attached), we can try to delete it
+                elif eni.get("Status") == "available":
+                    print(f"  - Deleting available network interface {eni_id}")
+                    self.ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
+                    deleted_eni_ids.append(eni_id)
+                    self.inventory.remove('network_interfaces', eni_id)
+
+        # 3. Also check for standalone Elastic IPs
+        for eip in self.inventory.addresses_in_vpc(vpc_id):
+            print(f"Found standalone EIP {eip.get('PublicIp')} associated with VPC")
+            print(f"  - Association ID: {eip.get('AssociationId')}")
+            print(f"  - Network Interface: {eip.get('NetworkInterfaceId')}")
+
+        if deleted_eni_ids:
+            print(f"Waiting for {len(deleted_eni_ids)} network interface(s) to disappear so their EIPs are released...")
+            wait_for_each(
+                check=lambda ids: {eni["NetworkInterfaceId"]: eni for eni in iter_aws(
+                    self.ec2_client, 'describe_network_interfaces', 'NetworkInterfaces[]',
+                    Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
+                )},
+                ids=deleted_eni_ids,
+                cond=lambda eni: eni is None,
                 timeout=120,
-                wait_interval=5,
+                expected='eni_released',
             )
-            ec2_client.delete_security_group(GroupId=sg_id)
-            print(f"  - ✅ Deleted security group {sg_id}")
-
-    # Additional cleanup: Release Elastic IPs associated with the VPC
-    # 1. Delete NAT Gateways in the VPC (they block IGW deletion)
-    ngws = ec2_client.describe_nat_gateways(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])
-    nat_gateway_ids = []
-    for ngw in ngws.get("NatGateways", []):
-        ngw_id = ngw["NatGatewayId"]
-        print("Deleting NAT Gateway", ngw_id)
-        nat_gateway_ids.append(ngw_id)
-        ec2_client.delete_nat_gateway(NatGatewayId=ngw_id)
-
-    # Wait for ALL NAT gateways to be deleted
-    if nat_gateway_ids:
-        print(f"Waiting for {len(nat_gateway_ids)} NAT Gateway(s) to be fully deleted...")
-        for ngw_id in nat_gateway_ids:
-            print(f"Waiting for NAT Gateway {ngw_id}...")
-            wait_until(
-                check=ec2_client.describe_nat_gateways,
-                kwargs={"NatGatewayIds": [ngw_id]},
-                cond=lambda res: all(g["State"] == "deleted" for g in res.get("NatGateways", [])),
-                timeout=300,
-                wait_interval=10,
+
+    def run(self, cluster_name: str) -> Optional[VpcInventory]:
+        """
+        Tears down the VPCs tagged with `cluster_name`, each on its own branch of a task graph.
+
+        Returns:
+            VpcInventory: The inventory after the teardown, or None if the cluster has no VPCs.
+        """
+        # Teardown order, per VPC. Only real dependencies block:
+        #   classic ELBs ─┐
+        #   ALBs/NLBs ────┴─> k8s ELB security groups ─┐
+        #   NAT gateways ──────────────────────────────┴─> ELB network interfaces and Elastic IPs
+        # Security groups can only go once the load balancers (and their network interfaces) are gone,
+        # and the Elastic IP cleanup touches the same network interfaces, so it runs last.
+        response = self.ec2_client.describe_vpcs(Filters=[{'Name': f'tag:cluster_name', 'Values': [cluster_name]}])
+        vpc_ids = [vpc['VpcId'] for vpc in response['Vpcs']]
+        if not vpc_ids:
+            return None
+        # One paginated describe per resource type for all VPCs, instead of re-listing inside every step
+        if self.inventory is None or set(self.inventory.vpc_ids) != set(vpc_ids):
+            with span('list VPC resources', vpcs=len(vpc_ids)):
+                self.inventory = VpcInventory(self.ec2_client, self.elb_client, self.elbv2_client, vpc_ids).refresh()
+        graph = TaskGraph()
+        for vpc_id in vpc_ids:
+            print("VPC ID:", vpc_id, ", deleting associated load balancers...")
+            kwargs = {'vpc_id': vpc_id}
+            graph.add(f'{vpc_id}/classic-elbs', self.delete_classic_load_balancers, kwargs=kwargs)
+            graph.add(f'{vpc_id}/elbv2s', self.delete_v2_load_balancers, kwargs=kwargs)
+            graph.add(f'{vpc_id}/nat-gateways', self.delete_nat_gateways, kwargs=kwargs)
+            graph.add(
+                f'{vpc_id}/k8s-elb-security-groups',
+                self.delete_k8s_elb_security_groups,
+                deps=[f'{vpc_id}/classic-elbs', f'{vpc_id}/elbv2s'],
+                kwargs=kwargs,
             )
-            print(f"NAT Gateway {ngw_id} deleted")
-
-        print("All NAT Gateways deleted. Waiting additional 30 seconds for EIP cleanup...")
-        sleep(30)
-
-    # 2. Find and release ALL Elastic IPs in the VPC
-    print("Checking for Elastic IPs in the VPC...")
-    enins = ec2_client.describe_network_interfaces(Filters=[{"Name": "vpc-id", "Values": [vpc_id]}])
-    eip_released = False
-
-    for eni in enins["NetworkInterfaces"]:
-        assoc = eni.get("Association")
-        if assoc and "PublicIp" in assoc:
-            public_ip = assoc["PublicIp"]
-            eni_id = eni["NetworkInterfaceId"]
-            print(f"Found EIP {public_ip} on network interface {eni_id}")
-
-            # Check what's using this ENI
-            attachment = eni.get("Attachment", {})
-            instance_id = attachment.get("InstanceId")
-            if instance_id:
-                print(f"  - Attached to EC2 instance: {instance_id}")
-
-            requester_id = eni.get("RequesterId")
-            print(f"  - Requester: {requester_id}")
-            print(f"  - Status: {eni.get('Status')}")
-
-            # If owned by amazon-elb, force delete the network interface
-            if requester_id == "amazon-elb":
-                print(f"  - Detaching and deleting ELB-owned network interface {eni_id}")
-                # First, try to detach if attached
-                if attachment and "AttachmentId" in attachment:
-                    ec2_client.detach_network_interface(
-                        AttachmentId=attachment["AttachmentId"],
-                        Force=True
-                    )
-                    print(f"  - Detached network interface")
-                    sleep(5)
-
-                # Then delete the network interface
-                ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
-                print(f"  - Deleted network interface {eni_id}")
-                eip_released = True
-
-            # If the ENI is available (not attached), we can try to delete it
-            elif eni.get("Status") == "available":
-                print(f"  - Deleting available network interface {eni_id}")
-                ec2_client.delete_network_interface(NetworkInterfaceId=eni_id)
-                eip_released = True
-
-    # 3. Also check for standalone Elastic IPs
-    all_eips = ec2_client.describe_addresses()["Addresses"]
-    for eip in all_eips:
-        # Check if this EIP is in our VPC
-        if "NetworkInterfaceId" in eip:
-            try:
-                eni_info = ec2_client.describe_network_interfaces(NetworkInterfaceIds=[eip["NetworkInterfaceId"]])
-                if eni_info["NetworkInterfaces"] and eni_info["NetworkInterfaces"][0].get("VpcId") == vpc_id:
-                    print(f"Found standalone EIP {eip.get('PublicIp')} associated with VPC")
-                    print(f"  - Association ID: {eip.get('AssociationId')}")
-                    print(f"  - Network Interface: {eip.get('NetworkInterfaceId')}")
-            except:
-                pass
-
-    if eip_released:
-        print("Waiting 30 seconds for EIP cleanup to propagate...")
-        sleep(30)
+            graph.add(
+                f'{vpc_id}/elastic-ips',
+                self.release_elastic_ips,
+                deps=[f'{vpc_id}/nat-gateways', f'{vpc_id}/k8s-elb-security-groups'],
+                kwargs=kwargs,
+            )
+        graph.run(max_workers=self.max_workers)
+        return self.inventory
+
+
+def teardown_load_balancers(
+    cluster_name: str,
+    region: Optional[str] = None,
+    max_workers: int = MAX_WORKERS,
+    inventory: Optional[VpcInventory] = None,
+) -> Optional[VpcInventory]:
+    """Runs a `LoadBalancerTeardown` of `cluster_name`, and returns its inventory for later steps to reuse."""
+    return LoadBalancerTeardown(region, max_workers, inventory).run(cluster_name)
+
+
+def main():
+    region = os.environ.get('AWS_REGION', 'ca-central-1')
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call, with TRACE_FILE set, write a Chrome
+    # trace of the phases and waits, and with RUN_HISTORY set, append the phase durations to that history, at exit
+    observe_from_env('aws/cluster/teardown_load_balancer')
+
+    # Fail early if the credentials are missing
+    aws_client('sts', region).get_caller_identity()
+    teardown_load_balancers(os.environ['CLUSTER_NAME'], region)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,95 +1,327 @@
 import os
-import boto3
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from operator import itemgetter
+from typing import Optional
 
-from helpers import wait_until
-
-
-# Load environment variables
-NAME = os.environ['VOLUME_NAME']
-EBS_VOLUME_SIZE = int(os.environ['VOLUME_SIZE'])
-
-# Hardcoded constants
-REGION = os.environ.get('AWS_REGION', 'ca-central-1')
-TAGS = {'name': NAME}
-FILTERS = [{'Name': f'tag:{k}', 'Values': [v]} for k, v in TAGS.items()]
-
-# Boto3 session
-session = boto3.Session(region_name=REGION)
-ec2_client = session.client('ec2')
-sts_client = session.client('sts')
-aws_account_id = sts_client.get_caller_identity().get('Account')
-
-# Main logic
-volume_id = None
-availability_zone = None
-
-response = ec2_client.describe_volumes(Filters=FILTERS)
-volumes = sorted(response.get('Volumes', []), key=itemgetter('CreateTime'), reverse=True)
-
-if volumes:
-    volume_id = volumes[0]['VolumeId']
-    availability_zone = volumes[0]['AvailabilityZone']
-    if volumes[0]['State'].lower() == 'deleting':
-        raise RuntimeError('Volume is being deleted. Please wait and try again.')
-else:
-    # Try to find the most recent snapshot
-    snapshots = []
-    response = ec2_client.describe_snapshots(Filters=FILTERS)
-    snapshots = sorted(response.get('Snapshots', []), key=itemgetter('StartTime'), reverse=True)
-
-    response = ec2_client.describe_availability_zones()
-    availability_zones = response['AvailabilityZones']
-    availability_zone = availability_zones[0]['ZoneName']
-
-    if snapshots:
-        snapshot = snapshots[0]
-        snapshot_id = snapshot['SnapshotId']
-        snapshot_size = snapshot['VolumeSize']  # in GiB
-
-        if EBS_VOLUME_SIZE < snapshot_size:
-            raise ValueError(
-                f"EBS_VOLUME_SIZE ({EBS_VOLUME_SIZE} GiB) is smaller than the snapshot volume size "
-                f"({snapshot_size} GiB). Cannot create volume."
+from helpers import (
+    aws_client, get_env_count, get_env_flag, get_volume_profile, iter_aws, observe_from_env, span, volume_specs,
+    wait_for_each,
+)
+
+
+# How many volumes of a batch to create at once
+MAX_WORKERS = get_env_count('VOLUME_MAX_WORKERS') or 8
+# AWS enables Fast Snapshot Restore in about an hour per TiB of snapshot
+FAST_RESTORE_SECONDS_PER_TIB = 3600
+# States of a snapshot's FSR in an availability zone once it was enabled, and until it is disabled
+FAST_RESTORE_ON = {'enabling', 'optimizing', 'enabled'}
+
+
+def create_volume(
+    ec2_client, name: str, size: int, availability_zone: str, snapshot_id: Optional[str] = None, profile: Optional[dict] = None,
+) -> str:
+    """
+    Creates a volume tagged with `name`, from `snapshot_id` if given, and returns its ID without waiting. The volume
+    has the type, IOPS and throughput of `profile`, from `get_volume_profile`, or is a baseline gp3 volume.
+    """
+    profile = profile or {'type': 'gp3'}
+    tags = {'name': name}
+    response = ec2_client.create_volume(
+        **({'SnapshotId': snapshot_id} if snapshot_id else {}),
+        **({'Iops': profile['iops']} if profile.get('iops') else {}),
+        **({'Throughput': profile['throughput']} if profile.get('throughput') else {}),
+        Size=size,
+        AvailabilityZone=availability_zone,
+        VolumeType=profile['type'],
+        TagSpecifications=[{
+            'ResourceType': 'volume',
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]
+                    + [{'Key': 'Name', 'Value': name}]
+        }]
+    )
+    return response['VolumeId']
+
+
+@contextmanager
+def fast_snapshot_restore(ec2_client, snapshots: list, availability_zone: str):
+    """
+    Enables Fast Snapshot Restore (FSR) on `snapshots` in `availability_zone`, and waits until it is enabled, so
+    that the volumes created from them inside the block deliver their full performance at once, instead of loading
+    every block from S3 on its first read. Disables FSR again on the way out, since it is billed per snapshot and
+    availability zone for every hour it is on. Snapshots that already had FSR are left as they were.
+
+    Snapshots on which FSR cannot be enabled, or not in time, are still restored, lazily.
+
+    Args:
+        ec2_client: The EC2 client.
+        snapshots (list[dict]): The snapshots, as returned by `describe_snapshots`.
+        availability_zone (str): The availability zone of the new volumes.
+
+    Yields:
+        set: The IDs of the snapshots with FSR enabled.
+    """
+    snapshot_ids = [snapshot['SnapshotId'] for snapshot in snapshots]
+
+    def describe(ids: list) -> dict:
+        return {restore['SnapshotId']: restore for restore in iter_aws(
+            ec2_client, 'describe_fast_snapshot_restores', 'FastSnapshotRestores[]',
+            Filters=[{'Name': 'snapshot-id', 'Values': ids}, {'Name': 'availability-zone', 'Values': [availability_zone]}],
+        )}
+
+    with span('enable fast snapshot restore', snapshots=len(snapshot_ids)):
+        # A 'disabling' or 'disabled' record is left from an earlier restore, and needs enabling again
+        already = {snapshot_id for snapshot_id, restore in describe(snapshot_ids).items() if restore['State'] in FAST_RESTORE_ON}
+        enabled = set()
+        if len(already) < len(snapshot_ids):
+            print(f"Enabling fast snapshot restore in {availability_zone}...")
+            try:
+                response = ec2_client.enable_fast_snapshot_restores(
+                    AvailabilityZones=[availability_zone],
+                    SourceSnapshotIds=[snapshot_id for snapshot_id in snapshot_ids if snapshot_id not in already],
+                )
+            except Exception as e:
+                print(f"Could not enable fast snapshot restore, restoring lazily: {e}")
+                response = {}
+            enabled = {restore['SnapshotId'] for restore in response.get('Successful', [])}
+            for failure in response.get('Unsuccessful', []):
+                reasons = '; '.join(error['Error']['Message'] for error in failure.get('FastSnapshotRestoreStateErrors', []))
+                print(f"Could not enable fast snapshot restore on {failure['SnapshotId']}, restoring it lazily: {reasons}")
+
+    try:
+        pending = [snapshot_id for snapshot_id in snapshot_ids if snapshot_id in already | enabled]
+        ready = set()
+        if pending:
+            size = max(snapshot['VolumeSize'] for snapshot in snapshots if snapshot['SnapshotId'] in pending)
+            print(f"Waiting for fast snapshot restore on {len(pending)} snapshot(s)...")
+            completed = wait_for_each(
+                check=describe,
+                ids=pending,
+                cond=lambda restore: restore is not None and restore['State'] == 'enabled',
+                expected=max(FAST_RESTORE_SECONDS_PER_TIB * size / 1024, 60),
+            )
+            for snapshot_id, seconds in completed.items():
+                if seconds is None:
+                    print(f"Fast snapshot restore on {snapshot_id} is not enabled in time, restoring it lazily")
+                else:
+                    print(f"Fast snapshot restore on {snapshot_id} enabled after {seconds:.0f}s")
+                    ready.add(snapshot_id)
+        yield ready
+    finally:
+        if enabled:
+            print(f"Disabling fast snapshot restore on {len(enabled)} snapshot(s)")
+            ec2_client.disable_fast_snapshot_restores(AvailabilityZones=[availability_zone], SourceSnapshotIds=sorted(enabled))
+
+
+def provision_volume(
+    name: str, size: int, region: Optional[str] = None, fast_restore: Optional[bool] = None, profile: Optional[dict] = None,
+) -> dict:
+    """
+    Finds the EBS volume tagged with `name`, or creates it, from the most recent snapshot tagged with `name` if
+    there is one, and waits until it is available. A batch of one for `provision_volumes`.
+
+    Args:
+        name (str): The volume name, VOLUME_NAME.
+        size (int): The size of a new volume in GiB, VOLUME_SIZE.
+        region (str, optional): The region. Defaults to AWS_REGION, or 'ca-central-1'.
+        fast_restore (bool, optional): Restore from the snapshot with `fast_snapshot_restore`. Defaults to
+            VOLUME_FAST_RESTORE.
+        profile (dict, optional): The performance of a new volume, from `get_volume_profile`. Defaults to the one
+            of the environment. An existing volume is left as it is.
+
+    Returns:
+        dict: The `volume_id` and `availability_zone` of the volume.
+
+    Raises:
+        RuntimeError: If the volume is being deleted, or does not become available.
+        ValueError: If `size` is smaller than the snapshot, or the profile in the environment is invalid.
+    """
+    volume = provision_volumes({name: size}, region, fast_restore=fast_restore, profiles={name: profile} if profile else None)[name]
+    if 'error' in volume:
+        raise volume['error']
+    print(f"Provisioned Volume ID: {volume['volume_id']}")
+    print(f"Availability Zone: {volume['availability_zone']}")
+    return volume
+
+
+def provision_volumes(
+    volumes: dict,
+    region: Optional[str] = None,
+    max_workers: int = MAX_WORKERS,
+    fast_restore: Optional[bool] = None,
+    profiles: Optional[dict] = None,
+) -> dict:
+    """
+    Provisions a batch of volumes in one region, in the time of the slowest one. Each volume is found by its tag
+    `name`, or created, from the most recent snapshot tagged with its name if there is one.
+
+    One describe of the volumes and one of the snapshots cover every name, the creations run on a bounded pool, and
+    a single wait covers every new volume. A volume that cannot be provisioned does not stop the others.
+
+    Args:
+        volumes (dict): The size of each volume in GiB, by name.
+        region (str, optional): The region. Defaults to AWS_REGION, or 'ca-central-1'.
+        max_workers (int, optional): How many volumes to create at once. Defaults to MAX_WORKERS.
+        fast_restore (bool, optional): Restore from the snapshots with `fast_snapshot_restore`, all enabled and
+            waited for together. Defaults to VOLUME_FAST_RESTORE.
+        profiles (dict, optional): The performance of each new volume by name, from `get_volume_profile`. Volumes
+            missing here take the one of the environment.
+
+    Returns:
+        dict: By name, the `volume_id` and `availability_zone` of the volume, or the `error` that stopped it: a
+            RuntimeError if the volume is being deleted or does not become available, a ValueError if its size is
+            smaller than the snapshot, or what `create_volume` raised.
+    """
+    region = region or os.environ.get('AWS_REGION', 'ca-central-1')
+    fast_restore = fast_restore if fast_restore is not None else get_env_flag('VOLUME_FAST_RESTORE')
+    profile = get_volume_profile()
+    profiles = {name: (profiles or {}).get(name) or profile for name in volumes}
+    ec2_client = aws_client('ec2', region, max_workers)
+    filters = [{'Name': 'tag:name', 'Values': list(volumes)}]
+    results = {}
+
+    def latest(items: list, time_key: str) -> dict:
+        # The most recent item of each name
+        by_name = {}
+        for item in sorted(items, key=itemgetter(time_key)):
+            name = next((tag['Value'] for tag in item.get('Tags', []) if tag['Key'] == 'name'), None)
+            if name in volumes:
+                by_name[name] = item
+        return by_name
+
+    with span('find volumes', volumes=len(volumes)):
+        existing = latest(list(iter_aws(ec2_client, 'describe_volumes', 'Volumes[]', Filters=filters)), 'CreateTime')
+    for name, volume in existing.items():
+        if volume['State'].lower() == 'deleting':
+            results[name] = {'error': RuntimeError('Volume is being deleted. Please wait and try again.')}
+        else:
+            print(f"Found existing volume {name}: {volume['VolumeId']}")
+            results[name] = {'volume_id': volume['VolumeId'], 'availability_zone': volume['AvailabilityZone']}
+
+    missing = [name for name in volumes if name not in existing]
+    if missing:
+        with span('find snapshots', volumes=len(missing)):
+            snapshots = latest(list(iter_aws(ec2_client, 'describe_snapshots', 'Snapshots[]', Filters=filters)), 'StartTime')
+            availability_zone = next(iter_aws(ec2_client, 'describe_availability_zones', 'AvailabilityZones[].ZoneName'))
+
+        def create(name: str) -> str:
+            snapshot = snapshots.get(name)
+            if snapshot is None:
+                print(f"Creating new empty volume {name}")
+                return create_volume(ec2_client, name, volumes[name], availability_zone, profile=profiles[name])
+            if volumes[name] < snapshot['VolumeSize']:
+                raise ValueError(
+                    f"The size of {name} ({volumes[name]} GiB) is smaller than the snapshot volume size "
+                    f"({snapshot['VolumeSize']} GiB). Cannot create volume."
+                )
+            print(f"Creating volume {name} from snapshot: {snapshot['SnapshotId']}")
+            return create_volume(ec2_client, name, volumes[name], availability_zone, snapshot['SnapshotId'], profiles[name])
+
+        restorable = [snapshots[name] for name in missing if name in snapshots and volumes[name] >= snapshots[name]['VolumeSize']]
+        with fast_snapshot_restore(ec2_client, restorable, availability_zone) if restorable and fast_restore else nullcontext():
+            created = {}
+            with span('create volumes', volumes=len(missing)), ThreadPoolExecutor(max_workers=max_workers) as pool:
+                for name, future in [(name, pool.submit(create, name)) for name in missing]:
+                    try:
+                        created[future.result()] = name
+                    except Exception as e:
+                        results[name] = {'error': e}
+
+            if created:
+                print(f"Waiting for {len(created)} volume(s) to be available...")
+                completed = wait_for_each(
+                    check=lambda ids: {v['VolumeId']: v for v in iter_aws(ec2_client, 'describe_volumes', 'Volumes[]', VolumeIds=ids)},
+                    ids=list(created),
+                    cond=lambda v: v is not None and v['State'].lower() == 'available',
+                    expected='ebs_volume_available',
+                )
+                for volume_id, seconds in completed.items():
+                    name = created[volume_id]
+                    if seconds is None:
+                        results[name] = {'error': RuntimeError(f"Volume {volume_id} did not become available in time.")}
+                    else:
+                        print(f"Volume {name} ({volume_id}) available after {seconds:.0f}s")
+                        results[name] = {'volume_id': volume_id, 'availability_zone': availability_zone}
+    return {name: results[name] for name in volumes}
+
+
+def provision_batches(batches: dict) -> dict:
+    """
+    Runs `provision_volumes` for the batch of every region at once, and writes the volume file of each volume.
+
+    Args:
+        batches (dict): The size and, optionally, the profile of each volume by name, by region, as returned by
+            `volume_specs`. A volume without a profile gets the one of the environment.
+
+    Returns:
+        dict: The results of `provision_volumes`, by region.
+
+    Raises:
+        RuntimeError: After the rest of the batch, if any volume could not be provisioned.
+    """
+    if not batches:
+        print("No volumes to provision")
+        return {}
+    with ThreadPoolExecutor(max_workers=max(len(batches), 1)) as pool:
+        futures = {
+            region: pool.submit(
+                provision_volumes, {name: volume['size'] for name, volume in volumes.items()}, region,
+                profiles={name: volume['profile'] for name, volume in volumes.items() if volume.get('profile')},
             )
+            for region, volumes in batches.items()
+        }
+    results = {region: future.result() for region, future in futures.items()}
+
+    problems = []
+    for region, volumes in results.items():
+        for name, volume in volumes.items():
+            if 'error' in volume:
+                problems.append(f"{name} ({region}): {volume['error']}")
+            else:
+                print(f"Provisioned {name} ({region}): {volume['volume_id']} in {volume['availability_zone']}")
+                write_volume_file(name, volume)
+    if problems:
+        raise RuntimeError(f"{len(problems)} volume(s) could not be provisioned: " + '; '.join(problems))
+    return results
+
 
-        print(f"Creating volume from snapshot: {snapshot_id}")
-        response = ec2_client.create_volume(
-            SnapshotId=snapshot_id,
-            Size=EBS_VOLUME_SIZE,
-            AvailabilityZone=availability_zone,
-            VolumeType='gp3',
-            TagSpecifications=[{
-                'ResourceType': 'volume',
-                'Tags': [{'Key': k, 'Value': v} for k, v in TAGS.items()]
-                        + [{'Key': 'Name', 'Value': NAME}]
-            }]
-        )
+def write_volume_file(name: str, volume: dict):
+    """Writes volume-aws-<name>.json, the artifact the workflow uploads."""
+    with open(f'volume-aws-{name}.json', 'w') as f:
+        json.dump({
+            'volume_id': volume['volume_id'],
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or restore the EBS volume VOLUME_NAME, or a batch of volumes.")
+    parser.add_argument("--volume", action="append", default=[], metavar="NAME=SIZE[@REGION]", help="A volume of the batch, size in GiB. Repeat for more.")
+    parser.add_argument("--all-configs", action="store_true", help="Add every volume that the AWS configs define to the batch.")
+    parser.add_argument("--configs-dir", default="configs", help="Where --all-configs looks. Defaults to configs.")
+    args = parser.parse_args()
+    batch = bool(args.volume or args.all_configs)
+    try:
+        # Volumes of a config get the profile of that config, the others the one of the environment
+        batches = volume_specs('aws', args.volume, args.configs_dir if args.all_configs else None) if batch else {}
+        profile = get_volume_profile()
+    except ValueError as e:
+        parser.error(str(e))
+    region = os.environ.get('AWS_REGION', 'ca-central-1')
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call, with TRACE_FILE set, write a Chrome
+    # trace of the phases and waits, and with RUN_HISTORY set, append the phase durations to that history, at exit
+    observe_from_env('aws/volume/provision_batch' if batch else 'aws/volume/provision')
+
+    # Fail early if the credentials are missing
+    aws_client('sts', region).get_caller_identity()
+    if batch:
+        provision_batches(batches)
     else:
-        print("Creating new empty volume")
-        response = ec2_client.create_volume(
-            Size=EBS_VOLUME_SIZE,
-            AvailabilityZone=availability_zone,
-            VolumeType='gp3',
-            TagSpecifications=[{
-                'ResourceType': 'volume',
-                'Tags': [{'Key': k, 'Value': v} for k, v in TAGS.items()]
-                        + [{'Key': 'Name', 'Value': NAME}]
-            }]
-        )
-    volume_id = response['VolumeId']
-
-    wait_until(
-        check=ec2_client.describe_volumes,
-        kwargs={'VolumeIds': [volume_id]},
-        cond=lambda x: x['Volumes'][0]['State'].lower() == 'available'
-    )
+        name = os.environ['VOLUME_NAME']
+        write_volume_file(name, provision_volume(name, int(os.environ['VOLUME_SIZE']), region, profile=profile))
 
-print(f"Provisioned Volume ID: {volume_id}")
-print(f"Availability Zone: {availability_zone}")
 
-with open(f'volume-aws-{NAME}.json', 'w') as f:
-    json.dump({
-        'volume_id': volume_id,
-    }, f)
+if __name__ == '__main__':
+    main()
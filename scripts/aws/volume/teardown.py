@@ -1,44 +1,65 @@
 import os
-import boto3
-
-from helpers import wait_until
-
-# Load environment variables
-NAME = os.environ['VOLUME_NAME']
-EBS_VOLUME_SIZE = int(os.environ['VOLUME_SIZE'])
-
-# Hardcoded constants
-REGION = os.environ.get('AWS_REGION', 'ca-central-1')
-TAGS = {'name': NAME}
-FILTERS = [{'Name': f'tag:{k}', 'Values': [v]} for k, v in TAGS.items()]
-
-# Boto3 session
-session = boto3.Session(region_name=REGION)
-ec2_client = session.client('ec2')
-sts_client = session.client('sts')
-aws_account_id = sts_client.get_caller_identity().get('Account')
-
-response = ec2_client.describe_volumes(Filters=FILTERS)
-volumes = response.get('Volumes', [])
-if not volumes:
-    raise RuntimeError(f'No volumes found matching the filter: {FILTERS}')
-volume_ids = [volume['VolumeId'] for volume in volumes]
-
-for volume_id in volume_ids:
-    response = ec2_client.create_snapshot(
-        VolumeId=volume_id,
-        Description=f"Snapshot For: {volume_id}. Tags: {TAGS}",
-        TagSpecifications=[
-            {
-                'ResourceType': 'snapshot',
-                'Tags': [{'Key': k, 'Value': TAGS[k]} for k in TAGS]
-            }
-        ]
-    )
-
-snapshot_id = response['SnapshotId']
-
-for volume_id in volume_ids:
-    ec2_client.delete_volume(VolumeId=volume_id)
-
-wait_until(ec2_client.describe_volumes, {'Filters': FILTERS}, lambda x: len(x['Volumes']) == 0)
\ No newline at end of file
+from typing import Optional
+
+from helpers import aws_client, iter_aws, observe_from_env, span, wait_for
+
+
+def teardown_volumes(name: str, region: Optional[str] = None) -> list:
+    """
+    Snapshots every EBS volume tagged with `name`, deletes them, and waits until they are gone.
+
+    Args:
+        name (str): The volume name, VOLUME_NAME.
+        region (str, optional): The region. Defaults to AWS_REGION, or 'ca-central-1'.
+
+    Returns:
+        list: The IDs of the deleted volumes.
+
+    Raises:
+        RuntimeError: If no volume is tagged with `name`.
+    """
+    region = region or os.environ.get('AWS_REGION', 'ca-central-1')
+    tags = {'name': name}
+    filters = [{'Name': f'tag:{k}', 'Values': [v]} for k, v in tags.items()]
+    ec2_client = aws_client('ec2', region)
+
+    volumes = list(iter_aws(ec2_client, 'describe_volumes', 'Volumes[]', Filters=filters))
+    if not volumes:
+        raise RuntimeError(f'No volumes found matching the filter: {filters}')
+    volume_ids = [volume['VolumeId'] for volume in volumes]
+
+    with span('create snapshot', volumes=len(volume_ids)):
+        for volume_id in volume_ids:
+            ec2_client.create_snapshot(
+                VolumeId=volume_id,
+                Description=f"Snapshot For: {volume_id}. Tags: {tags}",
+                TagSpecifications=[
+                    {
+                        'ResourceType': 'snapshot',
+                        'Tags': [{'Key': k, 'Value': tags[k]} for k in tags]
+                    }
+                ]
+            )
+
+    with span('delete volume', volumes=len(volume_ids)):
+        for volume_id in volume_ids:
+            ec2_client.delete_volume(VolumeId=volume_id)
+
+    wait_for(ec2_client.describe_volumes, {'Filters': filters}, lambda x: len(x['Volumes']) == 0, expected='ebs_volume_deleted')
+    return volume_ids
+
+
+def main():
+    region = os.environ.get('AWS_REGION', 'ca-central-1')
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call, with TRACE_FILE set, write a Chrome
+    # trace of the phases and waits, and with RUN_HISTORY set, append the phase durations to that history, at exit
+    observe_from_env('aws/volume/teardown')
+
+    # Fail early if the credentials are missing
+    aws_client('sts', region).get_caller_identity()
+    teardown_volumes(os.environ['VOLUME_NAME'], region)
+
+
+if __name__ == '__main__':
+    main()
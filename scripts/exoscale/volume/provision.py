@@ -1,98 +1,208 @@
 import os
 import json
-from operator import itemgetter
-from datetime import datetime
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from exoscale.api.v2 import Client
-from helpers import wait_until
-
-
-# Load environment variables
-NAME = os.environ['VOLUME_NAME']
-VOLUME_SIZE = int(os.environ['VOLUME_SIZE'])  # in GB
-
-# Hardcoded constants
-ZONE = os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
-LABELS = {'name': NAME}
-
-# Exoscale client
-exo = Client(
-    os.environ['EXOSCALE_API_KEY'],
-    os.environ['EXOSCALE_API_SECRET'],
-    zone=ZONE
+from helpers import (
+    exoscale_client, get_env_count, instrument_exoscale, iter_exoscale, observe_from_env, span, volume_specs,
+    wait_for_operations,
 )
 
-# Main logic
-volume_id = None
-volume = None
-
-# Try to find existing volume
-volumes_response = exo.list_block_storage_volumes()
-volumes = volumes_response.get('block-storage-volumes', [])
-matching_volumes = [v for v in volumes if v.get('labels') == LABELS]
-
-if matching_volumes:
-    # Sort by creation time, most recent first
-    matching_volumes.sort(key=lambda v: v.get('created-at', ''), reverse=True)
-    volume = matching_volumes[0]
-    volume_id = volume['id']
-
-    if volume.get('state', '').lower() == 'deleting':
-        raise RuntimeError('Volume is being deleted. Please wait and try again.')
-
-    print(f"Found existing volume: {volume_id}")
-else:
-    # Try to find the most recent snapshot
-    snapshots_response = exo.list_block_storage_snapshots()
-    snapshots = snapshots_response.get('block-storage-snapshots', [])
-    matching_snapshots = [s for s in snapshots if s.get('labels') == LABELS]
-
-    if matching_snapshots:
-        # Sort by creation time, most recent first
-        matching_snapshots.sort(key=lambda s: s.get('created-at', ''), reverse=True)
-        snapshot = matching_snapshots[0]
-        snapshot_id = snapshot['id']
-        snapshot_size = snapshot['size']  # in GB
-
-        if VOLUME_SIZE < snapshot_size:
-            raise ValueError(
-                f"VOLUME_SIZE ({VOLUME_SIZE} GB) is smaller than the snapshot volume size "
-                f"({snapshot_size} GB). Cannot create volume."
+
+# How many volumes of a batch to create at once. The shared rate limit of the Exoscale clients still applies.
+MAX_WORKERS = get_env_count('VOLUME_MAX_WORKERS') or 8
+
+
+def provision_volume(name: str, size: int, zone: Optional[str] = None, exo=None) -> dict:
+    """
+    Finds the block storage volume labelled with `name`, or creates it, from the most recent snapshot labelled
+    with `name` if there is one, and waits until it is ready. A batch of one for `provision_volumes`.
+
+    Args:
+        name (str): The volume name, VOLUME_NAME.
+        size (int): The size of a new volume in GB, VOLUME_SIZE.
+        zone (str, optional): The zone. Defaults to EXOSCALE_ZONE, or 'ch-gva-2'.
+        exo (exoscale.api.v2.Client, optional): The client to reuse. Defaults to the shared client of the zone.
+
+    Returns:
+        dict: The `volume_id` and `zone` of the volume.
+
+    Raises:
+        RuntimeError: If the volume is being deleted, or its creation fails.
+        ValueError: If `size` is smaller than the snapshot.
+    """
+    volume = provision_volumes({name: size}, zone, exo)[name]
+    if 'error' in volume:
+        raise volume['error']
+    print(f"Provisioned Volume ID: {volume['volume_id']}")
+    print(f"Zone: {volume['zone']}")
+    return volume
+
+
+def provision_volumes(volumes: dict, zone: Optional[str] = None, exo=None, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Provisions a batch of volumes in one zone, in the time of the slowest one. Each volume is found by its label
+    `name`, or created, from the most recent snapshot labelled with its name if there is one.
+
+    One listing of the volumes and one of the snapshots cover every name, the creations run on a bounded pool, and
+    a single wait covers every creation operation. A volume that cannot be provisioned does not stop the others.
+
+    Args:
+        volumes (dict): The size of each volume in GB, by name.
+        zone (str, optional): The zone. Defaults to EXOSCALE_ZONE, or 'ch-gva-2'.
+        exo (exoscale.api.v2.Client, optional): The client to reuse. Defaults to the shared client of the zone.
+        max_workers (int, optional): How many volumes to create at once. Defaults to MAX_WORKERS.
+
+    Returns:
+        dict: By name, the `volume_id` and `zone` of the volume, or the `error` that stopped it: a RuntimeError if
+            the volume is being deleted or its creation fails or does not finish in time, a ValueError if its size
+            is smaller than the snapshot, or what the API raised.
+    """
+    zone = zone or os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
+    exo = exo or exoscale_client(zone)
+    results = {}
+
+    def latest(items) -> dict:
+        # The most recent item of each name
+        by_name = {}
+        for item in sorted(items, key=lambda i: i.get('created-at', '')):
+            name = (item.get('labels') or {}).get('name')
+            if name in volumes and item.get('labels') == {'name': name}:
+                by_name[name] = item
+        return by_name
+
+    with span('find volumes', volumes=len(volumes)):
+        existing = latest(iter_exoscale(exo, 'list_block_storage_volumes', 'block-storage-volumes'))
+    for name, volume in existing.items():
+        if volume.get('state', '').lower() == 'deleting':
+            results[name] = {'error': RuntimeError('Volume is being deleted. Please wait and try again.')}
+        else:
+            print(f"Found existing volume {name}: {volume['id']}")
+            results[name] = {'volume_id': volume['id'], 'zone': zone}
+
+    missing = [name for name in volumes if name not in existing]
+    if missing:
+        with span('find snapshots', volumes=len(missing)):
+            snapshots = latest(iter_exoscale(exo, 'list_block_storage_snapshots', 'block-storage-snapshots'))
+
+        def create(name: str) -> dict:
+            snapshot = snapshots.get(name)
+            if snapshot is None:
+                print(f"Creating new empty volume {name}")
+                return exo.create_block_storage_volume(name=name, size=volumes[name], labels={'name': name})
+            if volumes[name] < snapshot['size']:
+                raise ValueError(
+                    f"The size of {name} ({volumes[name]} GB) is smaller than the snapshot volume size "
+                    f"({snapshot['size']} GB). Cannot create volume."
+                )
+            print(f"Creating volume {name} from snapshot: {snapshot['id']}")
+            return exo.create_block_storage_volume(
+                name=name,
+                size=volumes[name],
+                block_storage_snapshot={'id': snapshot['id']},
+                labels={'name': name}
             )
 
-        print(f"Creating volume from snapshot: {snapshot_id}")
-        operation = exo.create_block_storage_volume(
-            name=NAME,
-            size=VOLUME_SIZE,
-            block_storage_snapshot={'id': snapshot_id},
-            labels=LABELS
-        )
-        volume_id = operation['reference']['id']
+        operations = {}
+        with span('create volumes', volumes=len(missing)), ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for name, future in [(name, pool.submit(create, name)) for name in missing]:
+                try:
+                    operations[future.result()['id']] = name
+                except Exception as e:
+                    results[name] = {'error': e}
+
+        if operations:
+            print(f"Waiting for {len(operations)} operation(s) to create the volumes...")
+            for operation_id, operation in wait_for_operations(exo, operations, expected='exoscale_volume_ready', strict=False).items():
+                name = operations[operation_id]
+                state = (operation or {}).get('state', 'pending')
+                if state == 'success':
+                    print(f"Volume {name} ({operation['reference']['id']}) ready")
+                    results[name] = {'volume_id': operation['reference']['id'], 'zone': zone}
+                elif state == 'pending':
+                    results[name] = {'error': RuntimeError(f"Operation {operation_id} did not finish in time.")}
+                else:
+                    results[name] = {'error': RuntimeError(
+                        f"Operation {operation_id} ended in {state}: {operation.get('reason') or 'no reason given'}"
+                    )}
+    return {name: results[name] for name in volumes}
+
+
+def provision_batches(batches: dict, exo_for_zone=None) -> dict:
+    """
+    Runs `provision_volumes` for the batch of every zone at once, and writes the volume file of each volume.
+
+    Args:
+        batches (dict): Each volume by name, by zone, with its `size`, as returned by `volume_specs`.
+        exo_for_zone (Callable, optional): Returns the client to use for a zone. Defaults to the shared clients.
+
+    Returns:
+        dict: The results of `provision_volumes`, by zone.
+
+    Raises:
+        RuntimeError: After the rest of the batch, if any volume could not be provisioned.
+    """
+    exo_for_zone = exo_for_zone or exoscale_client
+    if not batches:
+        print("No volumes to provision")
+        return {}
+    with ThreadPoolExecutor(max_workers=max(len(batches), 1)) as pool:
+        futures = {
+            zone: pool.submit(provision_volumes, {name: volume['size'] for name, volume in volumes.items()}, zone, exo_for_zone(zone))
+            for zone, volumes in batches.items()
+        }
+    results = {zone: future.result() for zone, future in futures.items()}
+
+    problems = []
+    for zone, volumes in results.items():
+        for name, volume in volumes.items():
+            if 'error' in volume:
+                problems.append(f"{name} ({zone}): {volume['error']}")
+            else:
+                print(f"Provisioned {name} ({zone}): {volume['volume_id']}")
+                write_volume_file(name, volume)
+    if problems:
+        raise RuntimeError(f"{len(problems)} volume(s) could not be provisioned: " + '; '.join(problems))
+    return results
+
+
+def write_volume_file(name: str, volume: dict):
+    """Writes volume-exoscale-<name>.json, the artifact the workflow uploads."""
+    with open(f'volume-exoscale-{name}.json', 'w') as f:
+        json.dump({
+            'volume_id': volume['volume_id'],
+            'zone': volume['zone'],
+        }, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or restore the block storage volume VOLUME_NAME, or a batch of volumes.")
+    parser.add_argument("--volume", action="append", default=[], metavar="NAME=SIZE[@ZONE]", help="A volume of the batch, size in GB. Repeat for more.")
+    parser.add_argument("--all-configs", action="store_true", help="Add every volume that the Exoscale configs define to the batch.")
+    parser.add_argument("--configs-dir", default="configs", help="Where --all-configs looks. Defaults to configs.")
+    args = parser.parse_args()
+    batch = bool(args.volume or args.all_configs)
+    try:
+        batches = volume_specs('exoscale', args.volume, args.configs_dir if args.all_configs else None) if batch else {}
+    except ValueError as e:
+        parser.error(str(e))
+    zone = os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call, with TRACE_FILE set, write a Chrome
+    # trace of the phases and waits, and with RUN_HISTORY set, append the phase durations to that history, at exit
+    instrumented = observe_from_env('exoscale/volume/provision_batch' if batch else 'exoscale/volume/provision')
+
+    def client(zone: str):
+        exo = exoscale_client(zone, os.environ['EXOSCALE_API_KEY'], os.environ['EXOSCALE_API_SECRET'])
+        return instrument_exoscale(exo) if instrumented else exo
+
+    if batch:
+        provision_batches(batches, client)
     else:
-        print("Creating new empty volume")
-        operation = exo.create_block_storage_volume(
-            name=NAME,
-            size=VOLUME_SIZE,
-            labels=LABELS
-        )
-        volume_id = operation['reference']['id']
-    # Wait until volume is ready
-    def check_volume():
-        v = exo.get_block_storage_volume(id=volume_id)
-        state = v.get('state', '').lower()
-        return state in ['attached', 'detached']
-
-    wait_until(
-        check=check_volume,
-        kwargs={},
-        cond=lambda result: result
-    )
-
-print(f"Provisioned Volume ID: {volume_id}")
-print(f"Zone: {ZONE}")
-
-with open(f'volume-exoscale-{NAME}.json', 'w') as f:
-    json.dump({
-        'volume_id': volume_id,
-        'zone': ZONE,
-    }, f)
+        name = os.environ['VOLUME_NAME']
+        write_volume_file(name, provision_volume(name, int(os.environ['VOLUME_SIZE']), zone, client(zone)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,98 @@
 import os
-from exoscale.api.v2 import Client
-from helpers import wait_until
-
-# Load environment variables
-NAME = os.environ['VOLUME_NAME']
-VOLUME_SIZE = int(os.environ['VOLUME_SIZE'])
-
-# Hardcoded constants
-ZONE = os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
-LABELS = {'name': NAME}
-
-# Exoscale client
-exo = Client(
-    os.environ['EXOSCALE_API_KEY'],
-    os.environ['EXOSCALE_API_SECRET'],
-    zone=ZONE
-)
+from typing import Optional
 
-# Find all volumes matching labels
-volumes_response = exo.list_block_storage_volumes()
-volumes = volumes_response.get('block-storage-volumes', [])
-matching_volumes = [v for v in volumes if v.get('labels') == LABELS]
-
-if not matching_volumes:
-    raise RuntimeError(f'No volumes found matching the labels: {LABELS}')
-
-volume_ids = [v['id'] for v in matching_volumes]
-
-# Create snapshots for each volume
-for volume in matching_volumes:
-    volume_id = volume['id']
-    snapshot_name = f"{NAME}-snapshot-{volume_id[:8]}"
-
-    print(f"Creating snapshot for volume: {volume_id}")
-    operation = exo.create_block_storage_snapshot(
-        id=volume_id,
-        name=snapshot_name,
-        labels=LABELS
-    )
-
-    print(f"Created snapshot operation: {operation['id']}")
-
-# Delete all matching volumes
-for volume_id in volume_ids:
-    print(f"Deleting volume: {volume_id}")
-    exo.delete_block_storage_volume(id=volume_id)
-
-# Wait until all volumes are deleted
-def check_volumes_deleted():
-    volumes_response = exo.list_block_storage_volumes()
-    volumes = volumes_response.get('block-storage-volumes', [])
-    remaining = [v for v in volumes if v.get('labels') == LABELS]
-    return len(remaining) == 0
-
-wait_until(
-    check=check_volumes_deleted,
-    kwargs={},
-    cond=lambda result: result
+from helpers import (
+    EXPECTED_DURATIONS, exoscale_client, get_env_count, instrument_exoscale, iter_exoscale, observe_from_env, span,
+    wait_for_operations,
 )
-print("All volumes deleted successfully")
+
+# A snapshot copies the whole volume, so its expected duration grows with the size of the largest one
+SNAPSHOT_SECONDS_PER_GIB = 3
+# The hard deadline, in seconds, for the snapshots of a teardown; 0 uses five times their expected duration
+SNAPSHOT_TIMEOUT = get_env_count('SNAPSHOT_TIMEOUT')
+
+
+def teardown_volumes(name: str, zone: Optional[str] = None, exo=None) -> list:
+    """
+    Snapshots every block storage volume labelled with `name`, waits for the snapshots, then deletes the volumes
+    and waits until they are gone. No volume is deleted unless every snapshot was created.
+
+    The snapshot wait expects SNAPSHOT_SECONDS_PER_GIB seconds per GiB of the largest volume, and no less than the
+    'exoscale_snapshot_created' duration. SNAPSHOT_TIMEOUT, if set, replaces its deadline.
+
+    Args:
+        name (str): The volume name, VOLUME_NAME.
+        zone (str, optional): The zone. Defaults to EXOSCALE_ZONE, or 'ch-gva-2'.
+        exo (exoscale.api.v2.Client, optional): The client to reuse. Defaults to the shared client of the zone.
+
+    Returns:
+        list: The IDs of the deleted volumes.
+
+    Raises:
+        RuntimeError: If no volume is labelled with `name`, or a snapshot or deletion fails.
+    """
+    zone = zone or os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
+    labels = {'name': name}
+    exo = exo or exoscale_client(zone)
+
+    # Find all volumes matching labels
+    volumes = iter_exoscale(exo, 'list_block_storage_volumes', 'block-storage-volumes')
+    matching_volumes = [v for v in volumes if v.get('labels') == labels]
+
+    if not matching_volumes:
+        raise RuntimeError(f'No volumes found matching the labels: {labels}')
+
+    volume_ids = [v['id'] for v in matching_volumes]
+
+    # Create snapshots for each volume, and wait for them before deleting anything
+    with span('create snapshot', volumes=len(matching_volumes)):
+        snapshot_operations = []
+        for volume in matching_volumes:
+            volume_id = volume['id']
+            snapshot_name = f"{name}-snapshot-{volume_id[:8]}"
+
+            print(f"Creating snapshot for volume: {volume_id}")
+            operation = exo.create_block_storage_snapshot(
+                id=volume_id,
+                name=snapshot_name,
+                labels=labels
+            )
+            snapshot_operations.append(operation)
+            print(f"Created snapshot operation: {operation['id']}")
+
+        expected = max(
+            EXPECTED_DURATIONS['exoscale_snapshot_created'],
+            SNAPSHOT_SECONDS_PER_GIB * max(volume.get('size', 0) for volume in matching_volumes),
+        )
+        snapshots = wait_for_operations(exo, snapshot_operations, timeout=SNAPSHOT_TIMEOUT or None, expected=expected)
+        for operation in snapshots.values():
+            print(f"Snapshot {operation['reference']['id']} created")
+
+    # Delete all matching volumes
+    with span('delete volume', volumes=len(volume_ids)):
+        delete_operations = []
+        for volume_id in volume_ids:
+            print(f"Deleting volume: {volume_id}")
+            delete_operations.append(exo.delete_block_storage_volume(id=volume_id))
+
+        # Wait until all volumes are deleted
+        wait_for_operations(exo, delete_operations, expected='exoscale_volume_deleted')
+    print("All volumes deleted successfully")
+    return volume_ids
+
+
+def main():
+    zone = os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call, with TRACE_FILE set, write a Chrome
+    # trace of the phases and waits, and with RUN_HISTORY set, append the phase durations to that history, at exit
+    instrumented = observe_from_env('exoscale/volume/teardown')
+
+    exo = exoscale_client(zone, os.environ['EXOSCALE_API_KEY'], os.environ['EXOSCALE_API_SECRET'])
+    if instrumented:
+        exo = instrument_exoscale(exo)
+    teardown_volumes(os.environ['VOLUME_NAME'], zone, exo)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import argparse
+
+from helpers import compare_runs, load_runs
+
+# Compare the latest runs in the history that RUN_HISTORY records with the runs before them.
+#
+#   PYTHONPATH=. python scripts/history.py compare
+#   PYTHONPATH=. python scripts/history.py compare --threshold 2 --window 5 --fail
+RUN_HISTORY = os.getenv('RUN_HISTORY') or '.run-history.jsonl'
+
+
+def compare(args) -> int:
+    runs = load_runs(args.file)
+    if not runs:
+        print(f"No runs in {args.file}")
+        return 0
+    regressions = compare_runs(runs, threshold=args.threshold, window=args.window, min_seconds=args.min_seconds)
+    latest = {(run.get('script'), run.get('config')) for run in runs if run.get('ok', True)}
+    failed = sum(1 for run in runs if not run.get('ok', True))
+    print(f"Compared the latest run of {len(latest)} script/config pair(s) with the median of up to {args.window} runs before it.")
+    if failed:
+        print(f"Left out {failed} failed run(s).")
+    if not regressions:
+        print("No regressions.")
+        return 0
+    for regression in regressions:
+        ratio = f"{regression['ratio']}x" if regression['ratio'] is not None else 'new'
+        print(
+            f"REGRESSION {regression['script']} ({regression['config'] or 'no config'}): {regression['metric']} "
+            f"{regression['latest']} vs median {regression['median']} ({ratio})"
+        )
+    return 1 if args.fail else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare provisioning and teardown runs with their history.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compare_parser = subparsers.add_parser('compare', help="Flag phases of the latest runs that are slower than the rolling median.")
+    compare_parser.add_argument("--file", default=RUN_HISTORY, help="The run history, as written by RUN_HISTORY.")
+    compare_parser.add_argument("--threshold", type=float, default=1.5, help="Flag values above this multiple of the median.")
+    compare_parser.add_argument("--window", type=int, default=10, help="How many previous runs make up the median.")
+    compare_parser.add_argument("--min-seconds", type=float, default=5, help="Ignore phases that slowed down by less than this.")
+    compare_parser.add_argument("--fail", action="store_true", help="Exit with status 1 if anything regressed.")
+    args = parser.parse_args()
+
+    sys.exit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,19 @@
+from typing import Iterable, Iterator
 import os
+import sys
 import json
-from datetime import timezone
+import argparse
+from time import sleep
+from queue import Queue
+from threading import Thread
 from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
-from exoscale.api.v2 import Client
+from helpers import (
+    PROVIDERS, ResourceCache, TaskGraph, aws_client, backoff_delays, configured_providers, exoscale_client, get_env_count,
+    get_regions, instrument_exoscale, instrument_from_env, iter_aws, iter_exoscale, trace_from_env,
+)
 
 # Expected logical volume names
 VOLUME_NAMES = [
@@ -16,196 +25,579 @@ VOLUME_NAMES = [
     'personal-cloud',
 ]
 
-AWS_REGION = os.environ.get('AWS_REGION', 'ca-central-1')
-EXOSCALE_ZONE = os.environ.get('EXOSCALE_ZONE', 'ch-gva-2')
 AWS_VOLUME_FILTERS = [{'Name': f'tag:name', 'Values': VOLUME_NAMES}]
-
-# AWS clients
-ec2 = boto3.client('ec2', region_name=AWS_REGION)
-eks = boto3.client('eks', region_name=AWS_REGION)
-
-# Exoscale client
-exo = Client(
-    os.environ.get('EXOSCALE_API_KEY', ''),
-    os.environ.get('EXOSCALE_API_SECRET', ''),
-    zone=EXOSCALE_ZONE
-)
-
-# Fetch AWS volumes
-aws_volumes = ec2.describe_volumes(Filters=AWS_VOLUME_FILTERS)['Volumes']
-
-# Index AWS volumes by tag:name
-aws_name_to_volume = {}
-for v in aws_volumes:
-    tags = {t['Key']: t['Value'] for t in v.get('Tags', [])}
-    name = tags.get('name')
-    if name:
-        aws_name_to_volume[name] = v
-
-# Fetch all relevant AWS snapshots by tag
-aws_snapshots = ec2.describe_snapshots(
-    Filters=AWS_VOLUME_FILTERS,
-    OwnerIds=['self'],
-)['Snapshots']
-
-# Index latest AWS snapshot per name
-aws_name_to_snapshots = defaultdict(list)
-for snap in aws_snapshots:
-    tags = {t['Key']: t['Value'] for t in snap.get('Tags', [])}
-    name = tags.get('name')
-    if name:
-        aws_name_to_snapshots[name].append(snap)
-
-# Get latest AWS snapshot ID and its completion time per name
-aws_name_to_latest_snapshot_info = {}
-for name, snaps in aws_name_to_snapshots.items():
-    latest = sorted(snaps, key=lambda s: s['StartTime'], reverse=True)[0]
-    snapshot_id = latest['SnapshotId']
-    snapshot_time = latest['StartTime'].astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
-    aws_name_to_latest_snapshot_info[name] = (snapshot_id, snapshot_time)
-
-# Fetch Exoscale volumes
-exoscale_name_to_volume = {}
-exoscale_name_to_latest_snapshot_info = {}
-
-exo_volumes_response = exo.list_block_storage_volumes()
-exo_volumes = exo_volumes_response.get('block-storage-volumes', [])
-for v in exo_volumes:
-    name = v.get('labels', {}).get('name') if v.get('labels') else None
-    if name in VOLUME_NAMES:
-        exoscale_name_to_volume[name] = v
-
-# Fetch Exoscale snapshots
-exo_snapshots_response = exo.list_block_storage_snapshots()
-exo_snapshots = exo_snapshots_response.get('block-storage-snapshots', [])
-exo_name_to_snapshots = defaultdict(list)
-for snap in exo_snapshots:
-    name = snap.get('labels', {}).get('name') if snap.get('labels') else None
-    if name in VOLUME_NAMES:
-        exo_name_to_snapshots[name].append(snap)
-
-# Get latest Exoscale snapshot
-for name, snaps in exo_name_to_snapshots.items():
-    latest = sorted(snaps, key=lambda s: s.get('created-at', ''), reverse=True)[0]
-    snapshot_id = latest['id']
-    snapshot_time = latest.get('created-at', '')
-    exoscale_name_to_latest_snapshot_info[name] = (snapshot_id, snapshot_time)
-
-# Markdown Table for AWS Volumes
-aws_header =  "| Name | State   | Volume ID | Created | Mounted | Snapshot ID | Snapshot Time |\n"
-aws_divider = "|------|---------|-----------|---------|---------|-------------|---------------|\n"
-aws_rows = []
-
-for name in VOLUME_NAMES:
-    aws_volume = aws_name_to_volume.get(name)
-    if aws_volume:
-        snapshot_id, snapshot_time = aws_name_to_latest_snapshot_info.get(name, ("—", "—"))
-        state = aws_volume['State']
-        status_icon = "✅" if state == "available" else "❌"
-        volume_id = aws_volume['VolumeId']
-        created = aws_volume['CreateTime'].astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
-        mounted = "✅" if aws_volume.get('Attachments') else "❌"
-    else:
-        state = "—"
-        status_icon = "❌"
-        volume_id = created = mounted = "—"
-        snapshot_id, snapshot_time = ("—", "—")
-
-    aws_rows.append(f"| {name} | {status_icon} {state} | {volume_id} | {created} | {mounted} | {snapshot_id} | {snapshot_time} |")
-
-# Markdown Table for Exoscale Volumes
-exo_header =  "| Name | State   | Volume ID | Created | Mounted | Snapshot ID | Snapshot Time |\n"
-exo_divider = "|------|---------|-----------|---------|---------|-------------|---------------|\n"
-exo_rows = []
-
-for name in VOLUME_NAMES:
-    exo_volume = exoscale_name_to_volume.get(name)
-    if exo_volume:
-        snapshot_id, snapshot_time = exoscale_name_to_latest_snapshot_info.get(name, ("—", "—"))
-        state = exo_volume.get('state', 'unknown')
-        status_icon = "✅" if state.lower() in ["attached", "detached"] else "❌"
-        volume_id = exo_volume['id']
-        created = exo_volume.get('created-at', '—')
-        mounted = "✅" if state.lower() == "attached" else "❌"
+MAX_WORKERS = get_env_count('STATUS_MAX_WORKERS') or 8
+CLUSTER_WORKERS = get_env_count('STATUS_CLUSTER_WORKERS') or 4
+
+# Snapshots and cluster details seen by earlier runs, refreshed in full every STATUS_CACHE_TTL seconds.
+# Set STATUS_CACHE to an empty string to always fetch everything.
+STATUS_CACHE = os.environ.get('STATUS_CACHE', '.status-cache.json')
+STATUS_CACHE_TTL = get_env_count('STATUS_CACHE_TTL') or 6 * 3600
+# A snapshot delta spans at most this many days, one start-time value each; an older cursor takes a full fetch
+STATUS_DELTA_DAYS = get_env_count('STATUS_DELTA_DAYS') or 7
+
+# Watch mode polls every WATCH_MIN_INTERVAL seconds while anything is changing, and backs off towards
+# WATCH_MAX_INTERVAL while everything is steady
+WATCH_MIN_INTERVAL = get_env_count('STATUS_WATCH_MIN_INTERVAL') or 10
+WATCH_MAX_INTERVAL = get_env_count('STATUS_WATCH_MAX_INTERVAL') or 300
+TRANSITIONAL_STATES = {'creating', 'deleting', 'pending', 'updating', 'attaching', 'detaching', 'snapshotting'}
+
+# Whether API calls are instrumented, which `main` turns on from the environment
+API_STATS_ENABLED = False
+
+
+def regions(providers: list = None) -> dict:
+    """
+    Retrieves the AWS regions and Exoscale zones to report on: AWS_REGIONS / EXOSCALE_ZONES, or every REGION in
+    configs/. Providers without credentials, or missing from STATUS_PROVIDERS when that is set, get none, so
+    their SDK is never imported.
+
+    Args:
+        providers (list, optional): The providers to report on. Defaults to `configured_providers`.
+
+    Returns:
+        dict: The regions (or zones) per provider.
+    """
+    providers = providers if providers is not None else configured_providers(os.getenv('STATUS_PROVIDERS', ''))
+    return {provider: get_regions(provider) if provider in providers else [] for provider in PROVIDERS}
+
+
+def aws_clients(regions: list) -> dict:
+    # One shared client per service and region, with a connection pool for every worker that uses it
+    return {region: {'ec2': aws_client('ec2', region, MAX_WORKERS), 'eks': aws_client('eks', region, CLUSTER_WORKERS)} for region in regions}
+
+
+def exoscale_clients(zones: list) -> dict:
+    clients = {zone: exoscale_client(zone) for zone in zones}
+    return {zone: instrument_exoscale(exo) for zone, exo in clients.items()} if API_STATS_ENABLED else clients
+
+
+def fetch_aws_volumes(ec2) -> dict:
+    # Index AWS volumes by tag:name
+    aws_name_to_volume = {}
+    for v in iter_aws(ec2, 'describe_volumes', 'Volumes[]', Filters=AWS_VOLUME_FILTERS):
+        tags = {t['Key']: t['Value'] for t in v.get('Tags', [])}
+        name = tags.get('name')
+        if name:
+            aws_name_to_volume[name] = v
+    return aws_name_to_volume
+
+
+def fetch_aws_snapshots(ec2, region: str = None, cache: ResourceCache = None) -> dict:
+    # With a fresh cache entry, only ask for the snapshots started on or after the day of the last fetch.
+    # The start-time filter matches on the timestamp string, so each day is a wildcard value.
+    fetched_at = datetime.now(timezone.utc)
+    cached = cache.get('aws', region, 'snapshots') if cache else None
+    if cached and (
+        not cached['items'] or (fetched_at.date() - datetime.fromisoformat(cached['cursor']).date()).days >= STATUS_DELTA_DAYS
+    ):
+        # Nothing to check the delta against, or too many days for one filter: fetch in full
+        cached = None
+    if cached:
+        # A cached latest snapshot may have been deleted since. The snapshots before it are not in the cache, so
+        # that takes a full fetch; otherwise the deleted one would be reported until the entry's TTL.
+        # The check also asks for the day each cached snapshot started, with the same kind of wildcard as the delta.
+        # EC2 does not document wildcards on start-time: if they stop matching, the cached snapshots go missing
+        # here too, and the fetch falls back to a full one instead of silently finding no new snapshots.
+        snapshot_ids = {item['SnapshotId'] for item in cached['items'].values()}
+        started = {f"{datetime.fromisoformat(item['StartTime']).astimezone(timezone.utc):%Y-%m-%d}*" for item in cached['items'].values()}
+        present = set(iter_aws(
+            ec2, 'describe_snapshots', 'Snapshots[].SnapshotId',
+            Filters=[
+                {'Name': 'snapshot-id', 'Values': sorted(snapshot_ids)},
+                {'Name': 'start-time', 'Values': sorted(started)},
+            ],
+            OwnerIds=['self'],
+        ))
+        if present != snapshot_ids:
+            cached = None
+    filters = list(AWS_VOLUME_FILTERS)
+    since = None
+    if cached:
+        since = datetime.fromisoformat(cached['cursor'])
+        days = [since.date() + timedelta(days=i) for i in range((fetched_at.date() - since.date()).days + 1)]
+        filters.append({'Name': 'start-time', 'Values': [f'{day:%Y-%m-%d}*' for day in days]})
+
+    # Fetch all relevant AWS snapshots by tag
+    aws_snapshots = iter_aws(
+        ec2, 'describe_snapshots', 'Snapshots[]',
+        Filters=filters,
+        OwnerIds=['self'],
+    )
+
+    # Keep only the latest AWS snapshot per name while streaming through the pages
+    aws_name_to_latest_snapshot = {
+        name: {'SnapshotId': snap['SnapshotId'], 'StartTime': datetime.fromisoformat(snap['StartTime'])}
+        for name, snap in (cached['items'] if cached else {}).items()
+    }
+    for snap in aws_snapshots:
+        tags = {t['Key']: t['Value'] for t in snap.get('Tags', [])}
+        name = tags.get('name')
+        if since and snap['StartTime'] < since.replace(hour=0, minute=0, second=0, microsecond=0):
+            continue
+        if name and (name not in aws_name_to_latest_snapshot or snap['StartTime'] > aws_name_to_latest_snapshot[name]['StartTime']):
+            aws_name_to_latest_snapshot[name] = snap
+
+    if cache:
+        cache.put(
+            'aws', region, 'snapshots',
+            {name: {'SnapshotId': snap['SnapshotId'], 'StartTime': snap['StartTime'].isoformat()} for name, snap in aws_name_to_latest_snapshot.items()},
+            cursor=fetched_at.isoformat(),
+            refreshed=cached['refreshed'] if cached else None,
+        )
+
+    # Get latest AWS snapshot ID and its start time per name
+    aws_name_to_latest_snapshot_info = {}
+    for name, latest in aws_name_to_latest_snapshot.items():
+        snapshot_id = latest['SnapshotId']
+        snapshot_time = latest['StartTime'].astimezone(timezone.utc).isoformat()
+        aws_name_to_latest_snapshot_info[name] = (snapshot_id, snapshot_time)
+    return aws_name_to_latest_snapshot_info
+
+
+def fetch_vpcs(ec2) -> list:
+    return list(iter_aws(ec2, 'describe_vpcs', 'Vpcs[]'))
+
+
+def fetch_aws_clusters(eks, region: str = None, cache: ResourceCache = None) -> list:
+    # list_clusters is cheap; describe_cluster is one call per cluster, so while the cache is fresh only new
+    # clusters, and those still being created, updated or deleted, are described, on a small pool
+    cached = cache.get('aws', region, 'clusters') if cache else None
+    known = cached['items'] if cached else {}
+    cluster_names = list(iter_aws(eks, 'list_clusters', 'clusters[]'))
+    new_names = [
+        cluster_name for cluster_name in cluster_names
+        if cluster_name not in known or known[cluster_name].get('status', '').lower() in TRANSITIONAL_STATES
+    ]
+    with ThreadPoolExecutor(max_workers=CLUSTER_WORKERS) as executor:
+        described = dict(zip(new_names, executor.map(lambda cluster_name: eks.describe_cluster(name=cluster_name)['cluster'], new_names)))
+    clusters = {cluster_name: described.get(cluster_name) or known[cluster_name] for cluster_name in cluster_names}
+
+    if cache:
+        cache.put('aws', region, 'clusters', clusters, refreshed=cached['refreshed'] if cached else None)
+    return list(clusters.values())
+
+
+def fetch_exoscale_volumes(exo) -> dict:
+    exoscale_name_to_volume = {}
+    for v in iter_exoscale(exo, 'list_block_storage_volumes', 'block-storage-volumes'):
+        name = v.get('labels', {}).get('name') if v.get('labels') else None
+        if name in VOLUME_NAMES:
+            exoscale_name_to_volume[name] = v
+    return exoscale_name_to_volume
+
+
+def fetch_exoscale_snapshots(exo) -> dict:
+    exo_name_to_latest_snapshot = {}
+    for snap in iter_exoscale(exo, 'list_block_storage_snapshots', 'block-storage-snapshots'):
+        name = snap.get('labels', {}).get('name') if snap.get('labels') else None
+        if name in VOLUME_NAMES and snap.get('created-at', '') >= exo_name_to_latest_snapshot.get(name, {}).get('created-at', ''):
+            exo_name_to_latest_snapshot[name] = snap
+
+    # Get latest Exoscale snapshot
+    exoscale_name_to_latest_snapshot_info = {}
+    for name, latest in exo_name_to_latest_snapshot.items():
+        snapshot_id = latest['id']
+        snapshot_time = latest.get('created-at', '')
+        exoscale_name_to_latest_snapshot_info[name] = (snapshot_id, snapshot_time)
+    return exoscale_name_to_latest_snapshot_info
+
+
+def fetch_exoscale_clusters(exo) -> list:
+    return list(iter_exoscale(exo, 'list_sks_clusters', 'sks-clusters'))
+
+
+def _graph(aws: dict, exoscale: dict, cache: ResourceCache = None) -> TaskGraph:
+    # One task per fetch and region (or zone), named '<table>/<region>'
+    cached_fetches = {fetch_aws_snapshots, fetch_aws_clusters}
+    fetches = {
+        'aws_volumes': ('ec2', fetch_aws_volumes),
+        'aws_snapshots': ('ec2', fetch_aws_snapshots),
+        'vpcs': ('ec2', fetch_vpcs),
+        'aws_clusters': ('eks', fetch_aws_clusters),
+    }
+    exoscale_fetches = {
+        'exoscale_volumes': fetch_exoscale_volumes,
+        'exoscale_snapshots': fetch_exoscale_snapshots,
+        'exoscale_clusters': fetch_exoscale_clusters,
+    }
+
+    graph = TaskGraph()
+    for region, clients in aws.items():
+        for table, (service, fetch) in fetches.items():
+            kwargs = {service: clients[service]}
+            if fetch in cached_fetches:
+                kwargs.update(region=region, cache=cache)
+            graph.add(f'{table}/{region}', fetch, kwargs=kwargs)
+    for zone, exo in exoscale.items():
+        for table, fetch in exoscale_fetches.items():
+            graph.add(f'{table}/{zone}', fetch, kwargs={'exo': exo})
+    return graph
+
+
+def records(table: str, region: str, result) -> Iterator[dict]:
+    """
+    Turns the result of one fetch into one record per resource.
+
+    Every record has the provider, region (the zone, for Exoscale), kind, id, name and state of the resource,
+    plus `created`, `attached` and `size` for volumes, `created` for snapshots and `version` for clusters. AWS
+    volumes also have their `type`, `iops` and `throughput` (MiB/s); Exoscale has no performance settings.
+    Timestamps are ISO 8601 strings, so records go through JSON unchanged.
+
+    Args:
+        table (str): The fetch, e.g. 'aws_volumes'.
+        region (str): The region or zone it ran in.
+        result: What the fetch returned.
+
+    Yields:
+        dict: The records.
+    """
+    if table == 'aws_volumes':
+        for name, v in result.items():
+            yield {
+                'provider': 'aws', 'region': region, 'kind': 'volume', 'id': v['VolumeId'], 'name': name, 'state': v['State'],
+                'created': v['CreateTime'].astimezone(timezone.utc).isoformat(), 'attached': bool(v.get('Attachments')), 'size': v.get('Size'),
+                'type': v.get('VolumeType'), 'iops': v.get('Iops'), 'throughput': v.get('Throughput'),
+            }
+    elif table == 'exoscale_volumes':
+        for name, v in result.items():
+            state = v.get('state', 'unknown')
+            yield {
+                'provider': 'exoscale', 'region': region, 'kind': 'volume', 'id': v['id'], 'name': name, 'state': state,
+                'created': v.get('created-at'), 'attached': state.lower() == 'attached', 'size': v.get('size'),
+            }
+    elif table in ('aws_snapshots', 'exoscale_snapshots'):
+        for name, (snapshot_id, snapshot_time) in result.items():
+            yield {
+                'provider': table.split('_')[0], 'region': region, 'kind': 'snapshot', 'id': snapshot_id, 'name': name, 'state': None,
+                'created': snapshot_time,
+            }
+    elif table == 'vpcs':
+        for vpc in result:
+            tags = {t['Key']: t['Value'] for t in vpc.get('Tags', [])}
+            yield {
+                'provider': 'aws', 'region': region, 'kind': 'vpc', 'id': vpc.get('VpcId'),
+                'name': tags.get('Name', tags.get('name')),  # Capital 'N' is standard in AWS for VPC 'Name' tag
+                'state': vpc.get('State'),
+            }
+    elif table == 'aws_clusters':
+        for cluster in result:
+            yield {
+                'provider': 'aws', 'region': region, 'kind': 'cluster', 'id': cluster.get('name'),  # EKS uses name as ID
+                'name': cluster.get('name'), 'state': cluster.get('status'), 'version': cluster.get('version'),
+            }
+    elif table == 'exoscale_clusters':
+        for cluster in result:
+            yield {
+                'provider': 'exoscale', 'region': cluster.get('zone', region), 'kind': 'cluster', 'id': cluster.get('id'),
+                'name': cluster.get('name'), 'state': cluster.get('state'), 'version': cluster.get('version'),
+            }
+
+
+def stream(
+    aws_regions: list = None,
+    exoscale_zones: list = None,
+    cache: ResourceCache = None,
+    verbose: bool = True,
+    aws: dict = None,
+    exoscale: dict = None,
+) -> Iterator[dict]:
+    """
+    Runs every fetch, in every region and zone, concurrently, and yields the records of each one as soon as
+    it finishes. The calls are independent of each other, so the report takes as long as the slowest call
+    rather than the sum of all of them, and the first records arrive with the fastest one.
+
+    Args:
+        aws_regions (list, optional): The AWS regions to query. Defaults to the ones of `regions`.
+        exoscale_zones (list, optional): The Exoscale zones to query. Defaults to the ones of `regions`.
+        cache (ResourceCache, optional): Snapshots and cluster details from earlier runs, used to only fetch
+            what changed since. It is updated, but not saved. Defaults to no cache.
+        verbose (bool, optional): Print a line as each fetch finishes. Defaults to True.
+        aws (dict, optional): Clients to reuse, as returned by `aws_clients`. Defaults to new clients for `aws_regions`.
+        exoscale (dict, optional): Clients to reuse, as returned by `exoscale_clients`. Defaults to new clients
+            for `exoscale_zones`.
+
+    Yields:
+        dict: The records, as described in `records`.
+
+    Raises:
+        RuntimeError: After the records of the other fetches, if any fetch failed.
+    """
+    if (aws is None and aws_regions is None) or (exoscale is None and exoscale_zones is None):
+        configured = regions()
+        aws_regions = aws_regions if aws_regions is not None else configured['aws']
+        exoscale_zones = exoscale_zones if exoscale_zones is not None else configured['exoscale']
+    aws = aws if aws is not None else aws_clients(aws_regions)
+    exoscale = exoscale if exoscale is not None else exoscale_clients(exoscale_zones)
+    graph = _graph(aws, exoscale, cache)
+    finished = Queue()
+
+    def run():
+        try:
+            graph.run(max_workers=MAX_WORKERS, verbose=verbose, on_done=lambda name, result: finished.put((name, result)))
+        except Exception as e:
+            finished.put(e)
+        else:
+            finished.put(None)
+
+    Thread(target=run, daemon=True).start()
+    while (item := finished.get()) is not None:
+        if isinstance(item, Exception):
+            raise item
+        name, result = item
+        yield from records(*name.split('/', 1), result)
+
+
+def collect(aws_regions: list = None, exoscale_zones: list = None, cache: ResourceCache = None, verbose: bool = True) -> dict:
+    """
+    Runs `stream` to completion.
+
+    Returns:
+        dict: The records, keyed by (provider, region, kind, id).
+    """
+    return {
+        (record['provider'], record['region'], record['kind'], record['id']): record
+        for record in stream(aws_regions, exoscale_zones, cache=cache, verbose=verbose)
+    }
+
+
+def write_ndjson(records: Iterable[dict], out=sys.stdout):
+    """Writes one JSON object per record, flushing each line as it is written."""
+    for record in records:
+        out.write(json.dumps(record, default=str) + "\n")
+        out.flush()
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    """Reads the records written by `write_ndjson`."""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _utc(timestamp: str) -> str:
+    return datetime.fromisoformat(timestamp).astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
+
+
+def _performance(volume: dict) -> str:
+    # e.g. 'gp3 · 4000 IOPS · 1000 MiB/s', with what the volume reports
+    iops, throughput = volume.get('iops'), volume.get('throughput')
+    parts = [volume.get('type'), iops and f"{iops} IOPS", throughput and f"{throughput} MiB/s"]
+    return ' · '.join(filter(None, parts)) or '—'
+
+
+def volume_rows(provider: str, volumes: list, snapshots: list) -> list:
+    # One row per volume name and region it exists in, or a single placeholder row if it exists nowhere. AWS rows
+    # also show the performance of the volume.
+    latest_snapshots = {(snap['region'], snap['name']): snap for snap in snapshots}
+    rows = []
+    for name in VOLUME_NAMES:
+        found = sorted((v for v in volumes if v['name'] == name), key=lambda v: v['region'])
+        for volume in found or [None]:
+            if volume:
+                region = volume['region']
+                snapshot = latest_snapshots.get((region, name))
+                snapshot_id, snapshot_time = (snapshot['id'], snapshot['created']) if snapshot else ("—", "—")
+                state = volume['state']
+                if provider == 'aws':
+                    status_icon = "✅" if state == "available" else "❌"
+                    created = _utc(volume['created'])
+                    snapshot_time = _utc(snapshot_time) if snapshot else snapshot_time
+                else:
+                    status_icon = "✅" if state.lower() in ["attached", "detached"] else "❌"
+                    created = volume['created'] or '—'
+                volume_id = volume['id']
+                mounted = "✅" if volume['attached'] else "❌"
+            else:
+                region = "—"
+                state = "—"
+                status_icon = "❌"
+                volume_id = created = mounted = "—"
+                snapshot_id, snapshot_time = ("—", "—")
+
+            cells = [name, region, f"{status_icon} {state}", volume_id, created, mounted, snapshot_id, snapshot_time]
+            if provider == 'aws':
+                cells.insert(4, _performance(volume) if volume else "—")
+            rows.append(f"| {' | '.join(cells)} |")
+    return rows
+
+
+def vpc_rows(vpcs: list) -> list:
+    rows = []
+    for vpc in sorted(vpcs, key=lambda vpc: vpc['region']):
+        state = vpc['state'] or "—"
+        state_icon = "✅" if state == "available" else "❌"
+        rows.append(f"| {vpc['name'] or '—'} | {vpc['id'] or '—'} | {vpc['region']} | {state_icon} {state} |")
+    return rows
+
+
+def cluster_rows(clusters: list) -> list:
+    rows = []
+    for cluster in sorted(clusters, key=lambda cluster: cluster['region']):
+        rows.append(f"| {cluster['id'] or '—'} | {cluster['name'] or '—'} | {cluster['region']} | {cluster['version'] or '—'} |")
+    return rows
+
+
+def write_markdown(records: Iterable[dict], path: str = "STATUS.md"):
+    """
+    Renders records, from `stream` or `read_ndjson`, as the tables of STATUS.md.
+
+    Args:
+        records (Iterable[dict]): The records.
+        path (str, optional): The file to write. Defaults to "STATUS.md".
+    """
+    by_kind = defaultdict(list)
+    for record in records:
+        by_kind[(record['provider'], record['kind'])].append(record)
+
+    # Markdown Table for AWS Volumes
+    aws_header =  "| Name | Region | State   | Volume ID | Performance | Created | Mounted | Snapshot ID | Snapshot Time |\n"
+    aws_divider = "|------|--------|---------|-----------|-------------|---------|---------|-------------|---------------|\n"
+    aws_rows = volume_rows('aws', by_kind['aws', 'volume'], by_kind['aws', 'snapshot'])
+
+    # Markdown Table for Exoscale Volumes
+    exo_header =  "| Name | Zone | State   | Volume ID | Created | Mounted | Snapshot ID | Snapshot Time |\n"
+    exo_divider = "|------|------|---------|-----------|---------|---------|-------------|---------------|\n"
+    exo_rows = volume_rows('exoscale', by_kind['exoscale', 'volume'], by_kind['exoscale', 'snapshot'])
+
+    # Markdown Table for VPCs
+    vpc_header =  "| VPC Name | VPC ID | Region | VPC State |\n"
+    vpc_divider = "|----------|--------|--------|-----------|\n"
+
+    # Markdown Table for AWS Clusters
+    aws_cluster_header =  "| Cluster ID | Name | Region | Kubernetes Version |\n"
+    aws_cluster_divider = "|------------|------|--------|--------------------|\n"
+
+    # Markdown Table for Exoscale Clusters
+    exo_cluster_header =  "| Cluster ID | Name | Zone | Kubernetes Version |\n"
+    exo_cluster_divider = "|------------|------|------|--------------------|\n"
+
+    with open(path, "w") as f:
+        f.write("# AWS Volumes\n\n")
+        f.write(aws_header)
+        f.write(aws_divider)
+        f.write("\n".join(aws_rows))
+        f.write("\n")
+
+        f.write("\n\n# Exoscale Volumes\n\n")
+        f.write(exo_header)
+        f.write(exo_divider)
+        f.write("\n".join(exo_rows))
+        f.write("\n")
+
+        f.write("\n\n# VPCs\n\n")
+        f.write(vpc_header)
+        f.write(vpc_divider)
+        f.write("\n".join(vpc_rows(by_kind['aws', 'vpc'])))
+        f.write("\n")
+
+        f.write("\n\n# AWS Clusters\n\n")
+        f.write(aws_cluster_header)
+        f.write(aws_cluster_divider)
+        f.write("\n".join(cluster_rows(by_kind['aws', 'cluster'])))
+        f.write("\n")
+
+        f.write("\n\n# Exoscale Clusters\n\n")
+        f.write(exo_cluster_header)
+        f.write(exo_cluster_divider)
+        f.write("\n".join(cluster_rows(by_kind['exoscale', 'cluster'])))
+        f.write("\n")
+
+
+def changes(previous: dict, current: dict) -> list:
+    """
+    Compares two results of `collect`.
+
+    Returns:
+        list: A dict per added, removed or changed resource: the record, with a `change` key and, for
+            changes, the `previous` record.
+    """
+    diff = []
+    for key, record in current.items():
+        if key not in previous:
+            diff.append({'change': 'added', **record})
+        elif record != previous[key]:
+            diff.append({'change': 'changed', **record, 'previous': previous[key]})
+    for key, record in previous.items():
+        if key not in current:
+            diff.append({'change': 'removed', **record})
+    return diff
+
+
+def _format_change(change: dict) -> str:
+    symbol = {'added': '+', 'removed': '-', 'changed': '~'}[change['change']]
+    state = change['state'] or '—'
+    if change['change'] == 'changed':
+        state = f"{change['previous']['state'] or '—'} -> {state}"
+    return f"{symbol} {change['provider']} {change['region']} {change['kind']} {change['id']} ({change['name'] or '—'}) {state}"
+
+
+def watch(ndjson: bool = False, cache: ResourceCache = None, min_interval: float = WATCH_MIN_INTERVAL, max_interval: float = WATCH_MAX_INTERVAL):
+    """
+    Polls every region and zone until interrupted, writing only what changed to stdout.
+
+    The first poll reports every resource as added. While any resource is in a transitional state,
+    e.g. a volume `creating` or a cluster `DELETING`, polls are `min_interval` apart; once everything is
+    steady, the interval doubles up to `max_interval`.
+
+    Args:
+        ndjson (bool, optional): Write one JSON object per change instead of a line of text. Defaults to False.
+        cache (ResourceCache, optional): Passed to `collect`, and saved after every poll.
+        min_interval (float, optional): Seconds between polls while something is changing.
+        max_interval (float, optional): The longest wait between polls.
+    """
+    previous = {}
+    delays = backoff_delays(first=min_interval, max_interval=max_interval, jitter=0)
+    while True:
+        try:
+            current = collect(cache=cache, verbose=False)
+        except RuntimeError as e:
+            print(f"Poll failed, keeping the previous state: {e}", file=sys.stderr)
+            current = previous
+        for change in changes(previous, current):
+            print(json.dumps(change, default=str) if ndjson else _format_change(change), flush=True)
+        if cache:
+            cache.save()
+        if any((record['state'] or '').lower() in TRANSITIONAL_STATES for record in current.values()):
+            delays = backoff_delays(first=min_interval, max_interval=max_interval, jitter=0)
+        previous = current
+        sleep(next(delays))
+
+
+def main():
+    global API_STATS_ENABLED
+
+    parser = argparse.ArgumentParser(description="Report the volumes, snapshots, VPCs and clusters of every configured region and zone.")
+    parser.add_argument("--watch", action="store_true", help="Keep polling and print only what changes, instead of writing STATUS.md.")
+    parser.add_argument("--ndjson", action="store_true", help="Print one JSON object per resource (or, with --watch, per change) instead of writing STATUS.md.")
+    parser.add_argument("--from", dest="source", help="Render STATUS.md from the output of --ndjson in this file ('-' for stdin) instead of querying the clouds.")
+    parser.add_argument("--output", default="STATUS.md", help="The Markdown file to write. Defaults to STATUS.md.")
+    args = parser.parse_args()
+
+    if args.source:
+        with (sys.stdin if args.source == '-' else open(args.source)) as f:
+            write_markdown(read_ndjson(f), args.output)
+        return
+
+    # With API_STATS or API_STATS_FILE set, count and time every API call and report at exit, and with TRACE_FILE
+    # set, write a Chrome trace of the fetches
+    API_STATS_ENABLED = instrument_from_env()
+    trace_from_env()
+
+    cache = ResourceCache(STATUS_CACHE, ttl=STATUS_CACHE_TTL) if STATUS_CACHE else None
+    if args.watch:
+        try:
+            watch(ndjson=args.ndjson, cache=cache)
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.ndjson:
+        write_ndjson(stream(cache=cache, verbose=False))
     else:
-        state = "—"
-        status_icon = "❌"
-        volume_id = created = mounted = "—"
-        snapshot_id, snapshot_time = ("—", "—")
-
-    exo_rows.append(f"| {name} | {status_icon} {state} | {volume_id} | {created} | {mounted} | {snapshot_id} | {snapshot_time} |")
-
-# Markdown Table for VPCs
-vpc_header =  "| VPC Name | VPC ID | Region | VPC State |\n"
-vpc_divider = "|----------|--------|--------|-----------|\n"
-vpc_rows = []
-
-vpcs = ec2.describe_vpcs()['Vpcs']
-for vpc in vpcs:
-    tags = {t['Key']: t['Value'] for t in vpc.get('Tags', [])}
-    name = tags.get('Name', tags.get('name', '—'))  # Capital 'N' is standard in AWS for VPC 'Name' tag
-    vpc_id = vpc.get('VpcId', "—")
-    state = vpc.get('State', "—")
-    state_icon = "✅" if state == "available" else "❌"
-    vpc_rows.append(f"| {name} | {vpc_id} | {AWS_REGION} | {state_icon} {state} |")
-
-# Markdown Table for AWS Clusters
-aws_cluster_header =  "| Cluster ID | Name | Region | Kubernetes Version |\n"
-aws_cluster_divider = "|------------|------|--------|--------------------|\n"
-aws_cluster_rows = []
-
-cluster_names = eks.list_clusters()['clusters']
-for cluster_name in cluster_names:
-    cluster_details = eks.describe_cluster(name=cluster_name)['cluster']
-    cluster_id = cluster_details.get('name', '—')  # EKS uses name as ID
-    name = cluster_details.get('name', '—')
-    region = AWS_REGION
-    k8s_version = cluster_details.get('version', '—')
-    aws_cluster_rows.append(f"| {cluster_id} | {name} | {region} | {k8s_version} |")
-
-# Markdown Table for Exoscale Clusters
-exo_cluster_header =  "| Cluster ID | Name | Zone | Kubernetes Version |\n"
-exo_cluster_divider = "|------------|------|------|--------------------|\n"
-exo_cluster_rows = []
-
-exo_clusters_response = exo.list_sks_clusters()
-exo_clusters = exo_clusters_response.get('sks-clusters', [])
-for cluster in exo_clusters:
-    cluster_id = cluster.get('id', '—')
-    name = cluster.get('name', '—')
-    zone = cluster.get('zone', '—')
-    k8s_version = cluster.get('version', '—')
-    exo_cluster_rows.append(f"| {cluster_id} | {name} | {zone} | {k8s_version} |")
-
-# Write markdown
-with open("STATUS.md", "w") as f:
-    f.write("# AWS Volumes\n\n")
-    f.write(aws_header)
-    f.write(aws_divider)
-    f.write("\n".join(aws_rows))
-    f.write("\n")
-
-    f.write("\n\n# Exoscale Volumes\n\n")
-    f.write(exo_header)
-    f.write(exo_divider)
-    f.write("\n".join(exo_rows))
-    f.write("\n")
-
-    f.write("\n\n# VPCs\n\n")
-    f.write(vpc_header)
-    f.write(vpc_divider)
-    f.write("\n".join(vpc_rows))
-    f.write("\n")
-
-    f.write("\n\n# AWS Clusters\n\n")
-    f.write(aws_cluster_header)
-    f.write(aws_cluster_divider)
-    f.write("\n".join(aws_cluster_rows))
-    f.write("\n")
-
-    f.write("\n\n# Exoscale Clusters\n\n")
-    f.write(exo_cluster_header)
-    f.write(exo_cluster_divider)
-    f.write("\n".join(exo_cluster_rows))
-    f.write("\n")
+        write_markdown(stream(cache=cache), args.output)
+    if cache:
+        cache.save()
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import os
+import sys
+import argparse
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from helpers import API_STATS, ResourceCache, get_env_count, instrument_boto3, instrument_exoscale
+
+import status
+
+# Prometheus exporter for the status.py inventory.
+#
+#   PYTHONPATH=. python scripts/status_exporter.py                       # serve http://0.0.0.0:9101/metrics
+#   PYTHONPATH=. python scripts/status_exporter.py --textfile iac.prom   # write once, for node_exporter
+EXPORTER_PORT = get_env_count('STATUS_EXPORTER_PORT') or 9101
+EXPORTER_INTERVAL = get_env_count('STATUS_EXPORTER_INTERVAL') or 300
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class Histogram:
+    """
+    A Prometheus histogram with labels, rendered in the text exposition format.
+
+    Args:
+        name (str): The metric name.
+        help (str): The HELP text.
+        buckets (list): The upper bounds of the buckets, in increasing order.
+    """
+
+    def __init__(self, name: str, help: str, buckets: list = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self._lock = Lock()
+
+    def observe(self, labels: dict, value: float):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self.series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.series[key] = (counts, total + value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+API_LATENCY = Histogram('iac_api_call_duration_seconds', 'Duration of cloud API calls made by the collectors.')
+
+
+def _observe_latency(provider: str, operation: str, seconds: float, error):
+    API_LATENCY.observe({'provider': provider, 'operation': operation}, seconds)
+
+
+def _escape(value) -> str:
+    return '' if value is None else str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict) -> str:
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}' if labels else ''
+
+
+def _gauge(name: str, help: str, samples: list) -> list:
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+    return lines
+
+
+def _age(timestamp: str, now: datetime):
+    try:
+        created = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (now - created).total_seconds()
+
+
+def metrics(records: list, scrape_seconds: float, success: bool) -> str:
+    """
+    Renders the records of `status.stream`, and the API latency so far, in the Prometheus text format.
+
+    Args:
+        records (list): The records.
+        scrape_seconds (float): How long collecting the records took.
+        success (bool): Whether every fetch succeeded.
+
+    Returns:
+        str: The metrics.
+    """
+    now = datetime.now(timezone.utc)
+    by_kind = defaultdict(list)
+    for record in records:
+        by_kind[record['kind']].append(record)
+
+    volumes = by_kind['volume']
+    snapshots = [(snap, _age(snap['created'], now)) for snap in by_kind['snapshot']]
+    clusters = Counter(cluster['provider'] for cluster in by_kind['cluster'])
+    vpcs = Counter(vpc['region'] for vpc in by_kind['vpc'])
+    found = {volume['name'] for volume in volumes}
+
+    def identity(record):
+        return {'provider': record['provider'], 'region': record['region'], 'name': record['name'], 'id': record['id']}
+
+    lines = []
+    lines += _gauge('iac_volume_state', 'Always 1, with the current state of the volume as a label.', [
+        ({**identity(v), 'state': v['state']}, 1) for v in volumes
+    ])
+    lines += _gauge('iac_volume_attached', 'Whether the volume is attached to an instance.', [
+        (identity(v), int(bool(v['attached']))) for v in volumes
+    ])
+    lines += _gauge('iac_volume_size_bytes', 'The provisioned size of the volume.', [
+        (identity(v), v['size'] * 2 ** 30) for v in volumes if v.get('size') is not None
+    ])
+    lines += _gauge('iac_volume_present', 'Whether an expected volume name exists in any region.', [
+        ({'name': name}, int(name in found)) for name in status.VOLUME_NAMES
+    ])
+    lines += _gauge('iac_snapshot_age_seconds', 'Age of the latest snapshot of each volume name.', [
+        (identity(snap), round(age)) for snap, age in snapshots if age is not None
+    ])
+    lines += _gauge('iac_clusters', 'Number of Kubernetes clusters.', [
+        ({'provider': provider}, clusters[provider]) for provider in ('aws', 'exoscale')
+    ])
+    lines += _gauge('iac_vpcs', 'Number of VPCs.', [({'region': region}, count) for region, count in sorted(vpcs.items())])
+    lines += API_LATENCY.render()
+    lines += _gauge('iac_scrape_duration_seconds', 'How long collecting the inventory took.', [({}, round(scrape_seconds, 3))])
+    lines += _gauge('iac_scrape_success', 'Whether every collector succeeded.', [({}, int(success))])
+    return '\n'.join(lines) + '\n'
+
+
+class Exporter:
+    """
+    Collects the inventory with clients and a cache that live as long as the exporter, and keeps the rendered
+    metrics of the last collection.
+    """
+
+    def __init__(self):
+        if _observe_latency not in API_STATS.listeners:
+            API_STATS.listeners.append(_observe_latency)
+        # Only the configured providers, see `status.regions`
+        regions = status.regions()
+        self.aws = status.aws_clients(regions['aws'])
+        for region_clients in self.aws.values():
+            for client in region_clients.values():
+                instrument_boto3(client)
+        self.exoscale = {zone: instrument_exoscale(exo) for zone, exo in status.exoscale_clients(regions['exoscale']).items()}
+        self.cache = ResourceCache(status.STATUS_CACHE, ttl=status.STATUS_CACHE_TTL) if status.STATUS_CACHE else None
+        self.text = ''
+
+    def collect(self) -> str:
+        start = monotonic()
+        records, success = [], True
+        try:
+            for record in status.stream(cache=self.cache, verbose=False, aws=self.aws, exoscale=self.exoscale):
+                records.append(record)
+        except RuntimeError as e:
+            print(f"Collection failed: {e}", file=sys.stderr)
+            success = False
+        if self.cache:
+            self.cache.save()
+        self.text = metrics(records, monotonic() - start, success)
+        return self.text
+
+
+def write_textfile(exporter: Exporter, path: str):
+    # Write then rename, so the textfile collector never reads a half-written file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(exporter.collect())
+    os.replace(temporary, path)
+
+
+def serve(exporter: Exporter, port: int = EXPORTER_PORT, interval: int = EXPORTER_INTERVAL):
+    """
+    Serves the metrics on http://0.0.0.0:<port>/metrics, re-collecting every `interval` seconds in the background
+    so scrapes are answered immediately.
+    """
+    exporter.collect()
+
+    def refresh():
+        while True:
+            sleep(interval)
+            exporter.collect()
+
+    Thread(target=refresh, daemon=True).start()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = exporter.text.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Serving metrics on http://0.0.0.0:{port}/metrics, refreshed every {interval}s")
+    ThreadingHTTPServer(('', port), Handler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the status inventory and cloud API latency as Prometheus metrics.")
+    parser.add_argument("--textfile", help="Collect once and write the metrics to this file, for the node_exporter textfile collector.")
+    parser.add_argument("--port", type=int, default=EXPORTER_PORT, help="The port to serve /metrics on.")
+    parser.add_argument("--interval", type=int, default=EXPORTER_INTERVAL, help="Seconds between collections while serving.")
+    args = parser.parse_args()
+
+    exporter = Exporter()
+    if args.textfile:
+        write_textfile(exporter, args.textfile)
+    else:
+        serve(exporter, args.port, args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import pytest
+
+import helpers.clients
+import helpers.waiters
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Runs the test against moto, with fresh shared clients and waits that do not sleep."""
+    from moto import mock_aws
+
+    for key, value in {
+        'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing', 'AWS_REGION': 'ca-central-1',
+        'AWS_DEFAULT_REGION': 'ca-central-1',
+    }.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(helpers.waiters, 'WAIT_TIME_SCALE', 0.001)
+    monkeypatch.setattr(helpers.clients, '_clients', {})
+    with mock_aws():
+        yield
+
+
+@pytest.fixture
+def exoscale(monkeypatch):
+    """
+    Runs the test against the fake Exoscale API of benchmarks/fake_exoscale.py, with fresh shared clients and waits
+    that do not sleep. Yields the fake, to seed it and look at its state.
+    """
+    from benchmarks.fake_exoscale import FakeExoscale
+
+    fake = FakeExoscale(transition=0)
+    monkeypatch.setenv('EXOSCALE_API_URL', fake.start())
+    for key, value in {'EXOSCALE_API_KEY': 'EXOtesting', 'EXOSCALE_API_SECRET': 'testing', 'EXOSCALE_ZONE': 'ch-gva-2'}.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(helpers.waiters, 'WAIT_TIME_SCALE', 0.001)
+    monkeypatch.setattr(helpers.clients, '_clients', {})
+    try:
+        yield fake
+    finally:
+        fake.stop()
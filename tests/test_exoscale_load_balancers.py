@@ -0,0 +1,44 @@
+from uuid import uuid4
+
+import pytest
+
+from iac.orchestrator import load_script
+
+ZONE = 'ch-gva-2'
+
+
+def cluster(fake, name: str) -> dict:
+    """Adds an SKS cluster with one nodepool, and returns its instance pool."""
+    pool = fake.add(ZONE, 'instance-pool', name=f'{name}-nodepool', state='running', instances=[{'id': str(uuid4())}])
+    fake.add(ZONE, 'sks-cluster', name=f'{name}-cluster', state='running', nodepools=[
+        {'id': str(uuid4()), 'name': pool['name'], 'instance-pool': {'id': pool['id']}},
+    ])
+    return pool
+
+
+def nlb(fake, name: str, **service) -> str:
+    return fake.add(ZONE, 'load-balancer', name=name, state='running', services=[
+        {'id': str(uuid4()), 'name': 'service', 'port': 443, **service},
+    ] if service else [])['id']
+
+
+@pytest.fixture
+def teardown(exoscale):
+    return load_script('exoscale/cluster/teardown_load_balancer')
+
+
+def test_deletes_only_the_cluster_nlbs(exoscale, teardown):
+    ours, theirs = cluster(exoscale, 'llm'), cluster(exoscale, 'eberron-llm')
+    deleted = {
+        nlb(exoscale, 'k8s-ingress', **{'instance-pool': {'id': ours['id']}}),
+        nlb(exoscale, 'ingress', target=[{'instance': {'id': ours['instances'][0]['id']}}]),
+    }
+    kept = {
+        # Another cluster's Kubernetes NLB, and one whose services are not set up yet
+        nlb(exoscale, 'k8s-other', **{'instance-pool': {'id': theirs['id']}}),
+        nlb(exoscale, 'k8s-pending'),
+        nlb(exoscale, 'unrelated', **{'instance-pool': {'id': str(uuid4())}}),
+    }
+
+    assert set(teardown.teardown_load_balancers('llm', ZONE)) == deleted
+    assert set(exoscale.zones[ZONE]['load-balancer']) == kept
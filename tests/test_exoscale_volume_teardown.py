@@ -0,0 +1,44 @@
+import pytest
+
+from helpers import EXPECTED_DURATIONS
+from iac.orchestrator import load_script
+
+ZONE = 'ch-gva-2'
+
+
+@pytest.fixture
+def teardown(exoscale, monkeypatch):
+    # Every change in the fake takes a second, longer than the compressed deadline of a default snapshot wait.
+    # The deletion that follows the snapshots gets a deadline that fits.
+    exoscale.transition = 1
+    monkeypatch.setitem(EXPECTED_DURATIONS, 'exoscale_volume_deleted', 1000)
+    return load_script('exoscale/volume/teardown')
+
+
+def volume(fake, size: int) -> str:
+    return fake.add(ZONE, 'block-storage', name='llm', size=size, labels={'name': 'llm'}, state='detached')['id']
+
+
+def test_snapshot_wait_grows_with_the_volume(exoscale, teardown):
+    # The second the snapshot takes is past the deadline of the default expected duration, not of a 100 GiB volume's
+    volume_id = volume(exoscale, 100)
+
+    assert teardown.teardown_volumes('llm', ZONE) == [volume_id]
+    assert not exoscale.zones[ZONE]['block-storage']
+    assert [snapshot['state'] for snapshot in exoscale.zones[ZONE]['block-storage-snapshot'].values()] == ['created']
+
+
+def test_snapshot_timeout_overrides_the_deadline(exoscale, teardown, monkeypatch):
+    volume_id = volume(exoscale, 1)
+    monkeypatch.setattr(teardown, 'SNAPSHOT_TIMEOUT', 2000)
+
+    assert teardown.teardown_volumes('llm', ZONE) == [volume_id]
+
+
+def test_volume_kept_when_snapshot_times_out(exoscale, teardown, monkeypatch):
+    volume_id = volume(exoscale, 1)
+    monkeypatch.setattr(teardown, 'SNAPSHOT_TIMEOUT', 100)
+
+    with pytest.raises(RuntimeError):
+        teardown.teardown_volumes('llm', ZONE)
+    assert list(exoscale.zones[ZONE]['block-storage']) == [volume_id]
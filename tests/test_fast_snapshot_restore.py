@@ -0,0 +1,93 @@
+import pytest
+from botocore.awsrequest import AWSResponse
+
+from helpers import aws_client
+from iac.orchestrator import load_script
+
+REGION = 'ca-central-1'
+
+
+class FakeFastSnapshotRestores:
+    """
+    Answers the Fast Snapshot Restore calls of an EC2 client, which moto does not implement, and lets the others
+    through. Enabling goes through 'enabling' and 'optimizing' to 'enabled', one step per describe.
+    """
+
+    def __init__(self, ec2_client, states: dict):
+        self.states = states
+        self.calls = []
+        for operation in ('EnableFastSnapshotRestores', 'DisableFastSnapshotRestores', 'DescribeFastSnapshotRestores'):
+            ec2_client.meta.events.register(f'before-parameter-build.ec2.{operation}', self.keep)
+            ec2_client.meta.events.register(f'before-call.ec2.{operation}', self.answer)
+
+    def keep(self, params, context, **kwargs):
+        # before-call only sees the serialized request, so keep the arguments of the call for it
+        context['api_params'] = dict(params)
+
+    def answer(self, model, context, **kwargs):
+        operation = model.name
+        params = context['api_params']
+        if operation == 'DescribeFastSnapshotRestores':
+            filters = {f['Name']: f['Values'] for f in params['Filters']}
+            zone = filters['availability-zone'][0]
+            for snapshot_id, state in self.states.items():
+                self.states[snapshot_id] = {'enabling': 'optimizing', 'optimizing': 'enabled'}.get(state, state)
+            restores = [
+                {'SnapshotId': snapshot_id, 'AvailabilityZone': zone, 'State': state}
+                for snapshot_id, state in self.states.items() if snapshot_id in filters['snapshot-id']
+            ]
+            return AWSResponse('', 200, {}, None), {'FastSnapshotRestores': restores}
+        snapshot_ids = params['SourceSnapshotIds']
+        self.calls.append((operation, sorted(snapshot_ids)))
+        for snapshot_id in snapshot_ids:
+            self.states[snapshot_id] = 'enabling' if operation == 'EnableFastSnapshotRestores' else 'disabling'
+        return AWSResponse('', 200, {}, None), {'Successful': [{'SnapshotId': s} for s in snapshot_ids], 'Unsuccessful': []}
+
+
+def snapshot(ec2_client, name: str, size: int) -> str:
+    volume_id = ec2_client.create_volume(Size=size, AvailabilityZone=f'{REGION}a')['VolumeId']
+    snapshot_id = ec2_client.create_snapshot(
+        VolumeId=volume_id, TagSpecifications=[{'ResourceType': 'snapshot', 'Tags': [{'Key': 'name', 'Value': name}]}]
+    )['SnapshotId']
+    ec2_client.delete_volume(VolumeId=volume_id)
+    return snapshot_id
+
+
+@pytest.fixture
+def provision(aws):
+    return load_script('aws/volume/provision')
+
+
+@pytest.mark.parametrize('earlier', [None, 'disabled', 'disabling'])
+def test_enables_waits_and_disables(provision, earlier):
+    ec2_client = aws_client('ec2', REGION)
+    snapshot_id = snapshot(ec2_client, 'llm', 500)
+    fsr = FakeFastSnapshotRestores(ec2_client, {snapshot_id: earlier} if earlier else {})
+
+    volume = provision.provision_volume('llm', 500, REGION, fast_restore=True)
+
+    assert ec2_client.describe_volumes(VolumeIds=[volume['volume_id']])['Volumes'][0]['SnapshotId'] == snapshot_id
+    assert fsr.calls == [('EnableFastSnapshotRestores', [snapshot_id]), ('DisableFastSnapshotRestores', [snapshot_id])]
+
+
+def test_leaves_fast_restore_enabled_by_others(provision):
+    ec2_client = aws_client('ec2', REGION)
+    ours, theirs = snapshot(ec2_client, 'notebooks', 10), snapshot(ec2_client, 'llm', 500)
+    fsr = FakeFastSnapshotRestores(ec2_client, {theirs: 'optimizing'})
+
+    results = provision.provision_volumes({'notebooks': 10, 'llm': 500, 'fresh': 5}, REGION, fast_restore=True)
+
+    assert all('volume_id' in result for result in results.values())
+    assert fsr.calls == [('EnableFastSnapshotRestores', [ours]), ('DisableFastSnapshotRestores', [ours])]
+    assert fsr.states[theirs] == 'enabled'
+
+
+def test_off_by_default(provision, monkeypatch):
+    monkeypatch.delenv('VOLUME_FAST_RESTORE', raising=False)
+    ec2_client = aws_client('ec2', REGION)
+    snapshot(ec2_client, 'llm', 500)
+    fsr = FakeFastSnapshotRestores(ec2_client, {})
+
+    provision.provision_volume('llm', 500, REGION)
+
+    assert fsr.calls == []
@@ -0,0 +1,38 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from helpers.history import compare_runs
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def run(total: float, ok: bool = True) -> dict:
+    return {'script': 'aws/volume/provision', 'provider': 'aws', 'config': 'llm.env', 'ok': ok, 'total': total, 'phases': {}}
+
+
+def test_compare_leaves_out_failed_runs():
+    # A failed run that waited out a timeout neither regresses itself, nor raises the median of the later runs
+    runs = [run(10), run(10), run(600, ok=False), run(600, ok=False), run(10), run(30, ok=False)]
+    assert compare_runs(runs) == []
+
+    regressions = compare_runs(runs + [run(60)])
+    assert [(r['metric'], r['latest'], r['median']) for r in regressions] == [('total', 60, 10)]
+
+
+def test_compare_counts_runs_without_outcome_as_ok():
+    runs = [{k: v for k, v in run(10).items() if k != 'ok'} for _ in range(3)] + [run(60)]
+    assert len(compare_runs(runs)) == 1
+
+
+def test_records_outcome(tmp_path):
+    path = tmp_path / 'history.jsonl'
+    env = {**os.environ, 'RUN_HISTORY': str(path), 'PYTHONPATH': str(REPO)}
+    for script, code in [('ok', ''), ('fail', "raise RuntimeError('boom')")]:
+        subprocess.run([sys.executable, '-c', f"from helpers import observe_from_env; observe_from_env('x/{script}'); {code}"], env=env, capture_output=True)
+
+    records = {record['script']: record for record in map(json.loads, path.read_text().splitlines())}
+    assert records['x/ok']['ok'] is True and 'error' not in records['x/ok']
+    assert records['x/fail']['ok'] is False and records['x/fail']['error'] == 'RuntimeError'
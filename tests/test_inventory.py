@@ -0,0 +1,62 @@
+import boto3
+import pytest
+
+from helpers import VpcInventory
+
+
+@pytest.fixture
+def vpc(aws):
+    """A VPC with two security groups and three network interfaces: one in each group, and one in both."""
+    ec2_client = boto3.client('ec2')
+    vpc_id = ec2_client.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    subnet_id = ec2_client.create_subnet(VpcId=vpc_id, CidrBlock='10.0.0.0/24')['Subnet']['SubnetId']
+    first, second = (
+        ec2_client.create_security_group(GroupName=name, Description=name, VpcId=vpc_id)['GroupId']
+        for name in ('first', 'second')
+    )
+    enis = [
+        ec2_client.create_network_interface(SubnetId=subnet_id, Groups=groups)['NetworkInterface']['NetworkInterfaceId']
+        for groups in ([first], [second], [first, second])
+    ]
+    inventory = VpcInventory(ec2_client, boto3.client('elb'), boto3.client('elbv2'), [vpc_id])
+    return inventory.refresh(), vpc_id, first, second, enis
+
+
+def ids(items: list) -> set:
+    return {item['NetworkInterfaceId'] for item in items}
+
+
+def test_lookups(vpc):
+    inventory, vpc_id, first, second, enis = vpc
+
+    assert ids(inventory.in_vpc('network_interfaces', vpc_id)) == set(enis)
+    assert set(inventory.by_vpc('network_interfaces')[vpc_id]) == set(enis)
+    assert ids(inventory.in_security_group('network_interfaces', first)) == {enis[0], enis[2]}
+    assert ids(inventory.by_security_group('network_interfaces')[second]) == {enis[1], enis[2]}
+    assert inventory.in_security_group('network_interfaces', 'sg-unknown') == []
+
+
+def test_update_and_remove_keep_indexes(vpc):
+    inventory, vpc_id, first, second, enis = vpc
+    eni = inventory.get('network_interfaces', enis[2])
+
+    inventory.update('network_interfaces', {**eni, 'Groups': [g for g in eni['Groups'] if g['GroupId'] != first]})
+
+    assert ids(inventory.in_security_group('network_interfaces', first)) == {enis[0]}
+    assert ids(inventory.in_security_group('network_interfaces', second)) == {enis[1], enis[2]}
+
+    inventory.remove('network_interfaces', enis[0])
+
+    assert inventory.in_security_group('network_interfaces', first) == []
+    assert first not in inventory.by_security_group('network_interfaces')
+    assert ids(inventory.in_vpc('network_interfaces', vpc_id)) == {enis[1], enis[2]}
+
+
+def test_refresh_replaces_indexes(vpc):
+    inventory, vpc_id, first, second, enis = vpc
+    inventory.clients['ec2'].delete_network_interface(NetworkInterfaceId=enis[1])
+
+    inventory.refresh('network_interfaces', vpc_id=vpc_id)
+
+    assert ids(inventory.in_vpc('network_interfaces', vpc_id)) == {enis[0], enis[2]}
+    assert ids(inventory.in_security_group('network_interfaces', second)) == {enis[2]}
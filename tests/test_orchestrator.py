@@ -0,0 +1,35 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from iac.orchestrator import COMMANDS, STEPS, Orchestrator
+
+REPO = Path(__file__).resolve().parent.parent
+CONFIG = 'configs/aws/llm.env'
+
+
+@pytest.mark.parametrize('command, step', [
+    (command, step) for command in COMMANDS for step in STEPS if step not in COMMANDS[command]
+])
+def test_refuses_steps_of_other_commands(command, step, monkeypatch):
+    orchestrator = Orchestrator(CONFIG)
+    # Refused before anything runs: the config is not even exported
+    monkeypatch.setattr(orchestrator, 'apply', lambda: pytest.fail("apply() ran"))
+    with pytest.raises(ValueError, match=f"{command} cannot run"):
+        orchestrator.run(command, [step])
+
+
+def test_load_balancers_only_tear_down():
+    with pytest.raises(ValueError, match="only tears load balancers down"):
+        Orchestrator(CONFIG).load_balancers('provision')
+
+
+def test_cli_reports_refused_steps_as_usage_errors():
+    result = subprocess.run(
+        [sys.executable, '-m', 'iac', 'provision', '--config', CONFIG, '--steps', 'load-balancers'],
+        cwd=REPO, capture_output=True, text=True,
+    )
+    assert result.returncode == 2
+    assert 'error: provision cannot run step(s): load-balancers' in result.stderr
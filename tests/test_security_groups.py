@@ -0,0 +1,103 @@
+import boto3
+import pytest
+
+from helpers import SecurityGroupReferences
+
+GROUPS = 300
+DOOMED = 100
+# Each group refers to the groups this far ahead of it, in ingress and egress rules
+INGRESS_OFFSETS = (1, 7, 150)
+EGRESS_OFFSETS = (13,)
+
+
+def references(ec2_client, vpc_id: str) -> set:
+    """The (referencing group, direction, referenced group) of every rule in the VPC."""
+    found = set()
+    groups = ec2_client.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['SecurityGroups']
+    for group in groups:
+        for direction, key in (('ingress', 'IpPermissions'), ('egress', 'IpPermissionsEgress')):
+            for permission in group.get(key, []):
+                for pair in permission.get('UserIdGroupPairs', []):
+                    found.add((group['GroupId'], direction, pair['GroupId']))
+    return found
+
+
+@pytest.fixture
+def vpc(aws):
+    """
+    A VPC of GROUPS security groups that refer to each other, the first DOOMED of them to be deleted. Every rule
+    pointing at other groups also keeps a CIDR range, and some rules mix doomed and surviving groups.
+    """
+    ec2_client = boto3.client('ec2')
+    vpc_id = ec2_client.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    group_ids = [
+        ec2_client.create_security_group(GroupName=f'sg-{i}', Description=f'sg-{i}', VpcId=vpc_id)['GroupId']
+        for i in range(GROUPS)
+    ]
+    expected = set()
+    for i, group_id in enumerate(group_ids):
+        ingress = [group_ids[(i + offset) % GROUPS] for offset in INGRESS_OFFSETS]
+        egress = [group_ids[(i + offset) % GROUPS] for offset in EGRESS_OFFSETS]
+        ec2_client.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[{
+            'IpProtocol': 'tcp', 'FromPort': 443, 'ToPort': 443,
+            'UserIdGroupPairs': [{'GroupId': other} for other in ingress],
+            'IpRanges': [{'CidrIp': '10.0.0.0/8'}],
+        }])
+        ec2_client.authorize_security_group_egress(GroupId=group_id, IpPermissions=[{
+            'IpProtocol': 'tcp', 'FromPort': 80, 'ToPort': 80, 'UserIdGroupPairs': [{'GroupId': other} for other in egress],
+        }])
+        expected |= {(group_id, 'ingress', other) for other in ingress} | {(group_id, 'egress', other) for other in egress}
+    return ec2_client, vpc_id, group_ids, expected
+
+
+def test_revocations_find_every_reference(vpc):
+    ec2_client, vpc_id, group_ids, expected = vpc
+    doomed = set(group_ids[:DOOMED])
+    index = SecurityGroupReferences.describe(ec2_client, [vpc_id])
+
+    revocations = index.revocations(doomed)
+
+    found = {
+        (referencing_id, direction, pair['GroupId'])
+        for (referencing_id, direction), permissions in revocations.items()
+        for permission in permissions
+        for pair in permission['UserIdGroupPairs']
+    }
+    assert found == {reference for reference in expected if reference[2] in doomed}
+    # One revocation per referencing group and direction, and no CIDR range in it
+    assert all(len(permissions) == 1 and 'IpRanges' not in permissions[0] for permissions in revocations.values())
+
+
+def test_revocations_skip_groups(vpc):
+    ec2_client, vpc_id, group_ids, _ = vpc
+    doomed = set(group_ids[:DOOMED])
+
+    revocations = SecurityGroupReferences.describe(ec2_client, [vpc_id]).revocations(doomed, skip=doomed)
+
+    assert revocations
+    assert not {referencing_id for referencing_id, _ in revocations} & doomed
+
+
+def test_every_group_deletable_after_revoke(vpc):
+    ec2_client, vpc_id, group_ids, expected = vpc
+    doomed = set(group_ids[:DOOMED])
+    index = SecurityGroupReferences.describe(ec2_client, [vpc_id])
+
+    index.revoke(ec2_client, doomed)
+
+    remaining = references(ec2_client, vpc_id)
+    # Only the references to doomed groups are gone: the other pairs of the same rules, and the CIDR ranges, stay
+    assert remaining == {reference for reference in expected if reference[2] not in doomed}
+    assert all(index.referencing(group_id) == [] for group_id in doomed)
+    ranges = ec2_client.describe_security_groups(GroupIds=group_ids[DOOMED:])['SecurityGroups']
+    assert all(
+        any(r['CidrIp'] == '10.0.0.0/8' for permission in group['IpPermissions'] for r in permission.get('IpRanges', []))
+        for group in ranges
+    )
+
+    # moto deletes referenced groups, where AWS fails with DependencyViolation, so check what AWS checks first
+    referenced = {reference[2] for reference in remaining}
+    for group_id in doomed:
+        assert group_id not in referenced
+        ec2_client.delete_security_group(GroupId=group_id)
+    assert len(ec2_client.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])['SecurityGroups']) == GROUPS - DOOMED + 1
@@ -0,0 +1,109 @@
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from time import sleep
+
+import boto3
+import pytest
+
+from helpers import ResourceCache
+
+REGION = 'ca-central-1'
+SCRIPT = Path(__file__).resolve().parent.parent / 'scripts' / 'status.py'
+
+
+@pytest.fixture
+def status(aws):
+    spec = importlib.util.spec_from_file_location('status', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def ec2_client(aws):
+    return boto3.client('ec2', region_name=REGION)
+
+
+def snapshot(ec2_client, name: str) -> str:
+    # moto's StartTime has a resolution of one second, and the latest snapshot must be later
+    sleep(1)
+    volume_id = ec2_client.create_volume(Size=1, AvailabilityZone=f'{REGION}a')['VolumeId']
+    return ec2_client.create_snapshot(
+        VolumeId=volume_id, TagSpecifications=[{'ResourceType': 'snapshot', 'Tags': [{'Key': 'name', 'Value': name}]}]
+    )['SnapshotId']
+
+
+@pytest.fixture
+def start_time_filters(ec2_client):
+    """
+    Keeps the start-time filters of describe_snapshots, and takes them out of the call: moto matches timestamp
+    filters exactly, without wildcards, so it would return nothing. The fetch's own check on StartTime remains.
+    """
+    kept = []
+
+    def strip(params, **kwargs):
+        kept.extend(f['Values'] for f in params.get('Filters', []) if f['Name'] == 'start-time')
+        params['Filters'] = [f for f in params.get('Filters', []) if f['Name'] != 'start-time']
+
+    ec2_client.meta.events.register('before-parameter-build.ec2.DescribeSnapshots', strip)
+    return kept
+
+
+def latest(status, ec2_client, cache) -> str:
+    return status.fetch_aws_snapshots(ec2_client, REGION, cache)['llm'][0]
+
+
+def test_delta_fetch_finds_new_snapshots(status, ec2_client, start_time_filters, tmp_path):
+    cache = ResourceCache(tmp_path / 'cache.json')
+    first = snapshot(ec2_client, 'llm')
+    assert latest(status, ec2_client, cache) == first
+    assert start_time_filters == []
+    refreshed = cache.get('aws', REGION, 'snapshots')['refreshed']
+
+    second = snapshot(ec2_client, 'llm')
+
+    assert latest(status, ec2_client, cache) == second
+    # The check of the cached snapshots, then a delta since the day of the last fetch on top of the cached entry,
+    # not a full refresh
+    assert len(start_time_filters) == 2 and all(value.endswith('*') for values in start_time_filters for value in values)
+    assert cache.get('aws', REGION, 'snapshots')['refreshed'] == refreshed
+
+
+def test_deleted_snapshot_is_not_reported_from_cache(status, ec2_client, start_time_filters, tmp_path):
+    cache = ResourceCache(tmp_path / 'cache.json')
+    first = snapshot(ec2_client, 'llm')
+    second = snapshot(ec2_client, 'llm')
+    assert latest(status, ec2_client, cache) == second
+
+    ec2_client.delete_snapshot(SnapshotId=second)
+
+    assert latest(status, ec2_client, cache) == first
+
+
+def test_unmatched_start_time_falls_back_to_full_fetch(status, ec2_client, tmp_path):
+    # Without the start-time filters taken out, moto matches none of the wildcards, as EC2 would if it stopped
+    # supporting them: the delta must not then report the cached snapshot as the latest
+    cache = ResourceCache(tmp_path / 'cache.json')
+    snapshot(ec2_client, 'llm')
+    latest(status, ec2_client, cache)
+    refreshed = cache.get('aws', REGION, 'snapshots')['refreshed']
+
+    second = snapshot(ec2_client, 'llm')
+
+    assert latest(status, ec2_client, cache) == second
+    assert cache.get('aws', REGION, 'snapshots')['refreshed'] > refreshed
+
+
+def test_old_cursor_takes_full_fetch(status, ec2_client, start_time_filters, tmp_path):
+    cache = ResourceCache(tmp_path / 'cache.json')
+    snapshot(ec2_client, 'llm')
+    latest(status, ec2_client, cache)
+    entry = cache.get('aws', REGION, 'snapshots')
+    cursor = datetime.now(timezone.utc) - timedelta(days=status.STATUS_DELTA_DAYS)
+    cache.put('aws', REGION, 'snapshots', entry['items'], cursor=cursor.isoformat(), refreshed=entry['refreshed'])
+
+    second = snapshot(ec2_client, 'llm')
+
+    assert latest(status, ec2_client, cache) == second
+    assert start_time_filters == []
@@ -0,0 +1,32 @@
+import pytest
+
+from helpers.tasks import TaskGraph
+
+
+def fail():
+    raise KeyError('VpcId')
+
+
+def test_failure_keeps_reason_and_cause():
+    graph = TaskGraph()
+    graph.add('vpcs/ca-central-1', fail)
+    graph.add('volumes/ca-central-1', lambda: 'ok')
+    graph.add('clusters/ca-central-1', lambda: 'ok', deps=['vpcs/ca-central-1'])
+
+    with pytest.raises(RuntimeError) as raised:
+        graph.run()
+
+    assert "vpcs/ca-central-1: KeyError('VpcId')" in str(raised.value)
+    assert "Skipped: clusters/ca-central-1." in str(raised.value)
+    assert isinstance(raised.value.__cause__, KeyError)
+
+
+def test_runs_dependencies_first():
+    order = []
+    graph = TaskGraph()
+    graph.add('delete_sgs', lambda: order.append('delete_sgs'), deps=['delete_lbs'])
+    graph.add('delete_lbs', lambda: order.append('delete_lbs'))
+
+    graph.run()
+
+    assert order == ['delete_lbs', 'delete_sgs']
@@ -0,0 +1,12 @@
+from helpers.tracing import Tracer
+
+
+def test_snapshot_is_a_copy():
+    tracer = Tracer()
+    tracer.complete('create snapshot', 'phase', 0, 1)
+
+    events = tracer.snapshot()
+    tracer.complete('wait snapshot_completed', 'wait', 1, 2)
+
+    assert [event['name'] for event in events] == ['create snapshot']
+    assert len(tracer.snapshot()) == 2
@@ -0,0 +1,48 @@
+import boto3
+import pytest
+
+from helpers import VOLUME_PROFILES, volume_specs
+from iac.orchestrator import load_script
+
+
+def config(directory, name: str, **variables):
+    (directory / f'{name}.env').write_text(''.join(f'{key}={value}\n' for key, value in variables.items()))
+
+
+@pytest.fixture
+def configs(tmp_path):
+    # The same volume name in two regions, with a different profile in each
+    aws = tmp_path / 'aws'
+    aws.mkdir()
+    config(aws, 'llm', REGION='ca-central-1', VOLUME_NAME='llm', VOLUME_SIZE=500, VOLUME_PROFILE='model-store')
+    config(aws, 'llm-us', REGION='us-east-1', VOLUME_NAME='llm', VOLUME_SIZE=200, VOLUME_PROFILE='notebook')
+    return aws
+
+
+def test_specs_carry_the_profile_of_each_region(configs):
+    batches = volume_specs('aws', ['notebooks=10@ca-central-1'], configs)
+
+    assert batches['ca-central-1']['llm'] == {'size': 500, 'profile': VOLUME_PROFILES['model-store']}
+    assert batches['us-east-1']['llm'] == {'size': 200, 'profile': VOLUME_PROFILES['notebook']}
+    assert batches['ca-central-1']['notebooks'] == {'size': 10}
+
+
+def test_specs_refuse_different_profiles_for_one_volume(configs):
+    config(configs, 'llm-copy', REGION='ca-central-1', VOLUME_NAME='llm', VOLUME_SIZE=100)
+
+    with pytest.raises(ValueError, match="different profiles for the volume 'llm' in ca-central-1"):
+        volume_specs('aws', [], configs)
+
+
+def test_batches_use_the_profile_of_their_region(aws, configs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    provision = load_script('aws/volume/provision')
+
+    results = provision.provision_batches(volume_specs('aws', [], configs))
+
+    for region, profile in [('ca-central-1', 'model-store'), ('us-east-1', 'notebook')]:
+        volume_id = results[region]['llm']['volume_id']
+        volume = boto3.client('ec2', region_name=region).describe_volumes(VolumeIds=[volume_id])['Volumes'][0]
+        assert (volume['VolumeType'], volume['Iops'], volume['Throughput']) == (
+            'gp3', VOLUME_PROFILES[profile]['iops'], VOLUME_PROFILES[profile]['throughput'],
+        )